@@ -0,0 +1,237 @@
+import json
+import random
+
+ARCH_WEIGHTS = {
+    "x86_64": 30,
+    "i586": 18,
+    "aarch64": 18,
+    "ppc64le": 12,
+    "armh": 8,
+    "x86_64-i586": 4,
+}
+NAME_PARTS = (
+    "alsa", "gtk", "qt", "kde", "gnome", "xorg", "perl", "python", "ruby", "boost", "glib", "mesa", "openssl",
+    "curl", "zlib", "ssh", "mail", "font", "sound", "image", "video", "tools", "utils", "core", "base", "net",
+    "crypt", "sql", "xml", "json", "http", "vim", "emacs", "tex", "doc", "devel", "plugin", "theme", "data",
+)
+SUBPACKAGE_PATTERNS = (
+    ("{name}", False, 1.0),
+    ("lib{name}", False, 0.5),
+    ("lib{name}-devel", False, 0.45),
+    ("{name}-docs", True, 0.2),
+    ("python3-module-{name}", True, 0.15),
+    ("{name}-data", True, 0.15),
+    ("lib{name}-devel-static", False, 0.05),
+)
+
+
+def random_version(generator: random.Random) -> str:
+    """
+    Generates a version string with the shape distribution seen in ALT Linux branches.
+
+    Args:
+        generator (random.Random): The seeded random generator.
+
+    Returns:
+        str: A version such as "2.14.1", "1.0.2u", "20230512" or "0.9.8.4".
+
+    Examples:
+        random_version(random.Random(0))
+        '6.6.0'
+    """
+    shape = generator.random()
+    if shape < 0.6:
+        return f"{generator.randint(0, 9)}.{generator.randint(0, 30)}.{generator.randint(0, 20)}"
+    if shape < 0.8:
+        return f"{generator.randint(0, 30)}.{generator.randint(0, 99)}"
+    if shape < 0.85:
+        return f"20{generator.randint(10, 24)}{generator.randint(1, 12):02}{generator.randint(1, 28):02}"
+    if shape < 0.9:
+        suffix = generator.choice("abcdefz")
+        return f"{generator.randint(0, 3)}.{generator.randint(0, 9)}.{generator.randint(0, 9)}{suffix}"
+    return ".".join(str(generator.randint(0, 20)) for _ in range(4))
+
+
+def random_release(generator: random.Random) -> str:
+    """
+    Generates a release string.
+
+    Args:
+        generator (random.Random): The seeded random generator.
+
+    Returns:
+        str: A release such as "alt1", "alt2.1" or "alt0.git3f2a1c".
+    """
+    shape = generator.random()
+    if shape < 0.75:
+        release = f"alt{generator.randint(1, 6)}"
+    elif shape < 0.95:
+        release = f"alt{generator.randint(1, 4)}.{generator.randint(1, 3)}"
+    else:
+        release = f"alt0.git{generator.getrandbits(24):06x}"
+    return release
+
+
+def bump(generator: random.Random, version: str, release: str) -> tuple:
+    """
+    Changes the version or the release of a package the way a branch update usually does.
+
+    Args:
+        generator (random.Random): The seeded random generator.
+        version (str): The current version.
+        release (str): The current release.
+
+    Returns:
+        tuple: The new (version, release) pair, newer in most cases and sometimes older.
+    """
+    shape = generator.random()
+    if shape < 0.5:
+        return version, f"{release.split('.')[0]}.{generator.randint(1, 3)}"
+    if shape < 0.9:
+        parts = version.split(".")
+        if parts[-1].isdigit():
+            parts[-1] = str(int(parts[-1]) + generator.randint(1, 3))
+        else:
+            parts.append("1")
+        return ".".join(parts), "alt1"
+    return random_version(generator), random_release(generator)
+
+
+def generate_sources(rows: int, generator: random.Random, prefix: str = "") -> list:
+    """
+    Generates source packages with their binary packages until the requested number of rows is reached.
+
+    Args:
+        rows (int): The number of binary package rows to generate.
+        generator (random.Random): The seeded random generator.
+        prefix (str): A prefix of the generated names, keeps the names of different calls apart.
+
+    Returns:
+        list: Source packages as dictionaries with "name", "epoch", "version", "release" and
+              "binaries" - a list of (name, arch) pairs.
+    """
+    arches = list(ARCH_WEIGHTS)
+    weights = list(ARCH_WEIGHTS.values())
+    sources = []
+    total = 0
+    while total < rows:
+        name = f"{prefix}{generator.choice(NAME_PARTS)}-{generator.choice(NAME_PARTS)}{len(sources)}"
+        built_for = sorted(set(generator.choices(arches, weights, k=generator.randint(1, 5))))
+        binaries = []
+        for pattern, noarch, probability in SUBPACKAGE_PATTERNS:
+            if generator.random() < probability:
+                binary = pattern.format(name=name)
+                binaries.extend([(binary, "noarch")] if noarch else [(binary, arch) for arch in built_for])
+        sources.append({
+            "name": name,
+            "epoch": generator.choices((0, 1, 2), (92, 6, 2))[0],
+            "version": random_version(generator),
+            "release": random_release(generator),
+            "binaries": binaries,
+        })
+        total += len(binaries)
+    return sources
+
+
+def expand(sources: list, branch: str, generator: random.Random) -> list:
+    """
+    Turns source packages into the binary package rows of the branch export.
+
+    Args:
+        sources (list): Source packages, see `generate_sources`.
+        branch (str): The branch name used in the disttag.
+        generator (random.Random): The seeded random generator.
+
+    Returns:
+        list: Package dictionaries with the fields of the `/export/branch_binary_packages` response.
+    """
+    packages = []
+    for source in sources:
+        buildtime = 1_500_000_000 + generator.randint(0, 300_000_000)
+        disttag = f"{branch}+{generator.randint(100_000, 400_000)}.{generator.randint(100, 9_900)}.1.1"
+        for name, arch in source["binaries"]:
+            packages.append({
+                "name": name,
+                "epoch": source["epoch"],
+                "version": source["version"],
+                "release": source["release"],
+                "arch": arch,
+                "disttag": disttag,
+                "buildtime": buildtime,
+                "source": source["name"],
+            })
+    return packages
+
+
+def generate_branch_pair(
+    rows: int,
+    overlap: float = 0.9,
+    update_rate: float = 0.3,
+    duplicate_rate: float = 0.001,
+    seed: int = 0,
+) -> tuple:
+    """
+    Generates the exports of two related branches, e.g. a stable branch and sisyphus.
+
+    The second branch keeps a part of the source packages of the first one (`overlap`), updates a part of
+    the kept ones (`update_rate`) and adds new source packages instead of the dropped ones, so both branches
+    have about `rows` rows. A small part of the rows is repeated (sometimes with another release) to cover
+    duplicate (name, arch) keys.
+    The same arguments always give the same data.
+
+    Args:
+        rows (int): The approximate number of rows in each branch.
+        overlap (float): The share of the source packages of the first branch that the second one keeps.
+        update_rate (float): The share of the kept source packages with another version or release.
+        duplicate_rate (float): The share of rows that are repeated in the same branch.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        tuple: Two lists of package dictionaries.
+
+    Examples:
+        first, second = generate_branch_pair(1_000_000, overlap=0.8, seed=42)
+    """
+    generator = random.Random(seed)
+    first_sources = generate_sources(rows, generator)
+    second_sources = []
+    for source in first_sources:
+        if generator.random() < overlap:
+            if generator.random() < update_rate:
+                version, release = bump(generator, source["version"], source["release"])
+                source = dict(source, version=version, release=release)
+            second_sources.append(source)
+    kept_rows = sum(len(source["binaries"]) for source in second_sources)
+    second_sources.extend(generate_sources(rows - kept_rows, generator, prefix="new-"))
+    generator.shuffle(second_sources)
+
+    branches = []
+    for branch, sources in (("p10", first_sources), ("sisyphus", second_sources)):
+        packages = []
+        for package in expand(sources, branch, generator):
+            packages.append(package)
+            if generator.random() < duplicate_rate:
+                duplicate = dict(generator.choice(packages))
+                if generator.random() < 0.5:
+                    duplicate["release"] = random_release(generator)
+                packages.append(duplicate)
+        branches.append(packages)
+    return branches[0], branches[1]
+
+
+def export_bytes(packages: list) -> bytes:
+    """
+    Serializes packages the way the API returns a branch export.
+
+    Args:
+        packages (list): The package dictionaries.
+
+    Returns:
+        bytes: The response body of `/export/branch_binary_packages/{branch}`.
+
+    Examples:
+        json.loads(export_bytes(first))["length"]
+        1000000
+    """
+    response = {"request_args": {"arch": None}, "length": len(packages), "packages": packages}
+    return json.dumps(response).encode()
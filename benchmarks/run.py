@@ -0,0 +1,323 @@
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from multiprocessing import cpu_count
+from typing import Callable
+
+from benchmarks.generator import export_bytes, generate_branch_pair
+from core.data_extractor import (
+    build_tables,
+    be_into_to_lists,
+    merge_variant,
+    multiprocess_variant,
+    search_unic_packages,
+    sync_variant,
+)
+from core.utils import compare_versions_release, create_response, generate_package_set, version_key
+from core.vectorized import numpy_available, numpy_variant
+from core.writer import open_output, write_response
+
+BENCHMARK_ENGINES = ("sync", "merge", "multiprocess") + (("numpy",) if numpy_available() else ())
+
+
+@dataclasses.dataclass()
+class StageResult:
+    """
+    The measurement of one pipeline stage.
+
+    Attributes:
+        stage (str): The stage name.
+        engine (str | None): The comparison engine for the per-engine stages.
+        seconds (float): The best wall time of all repeats.
+        rows (int): The number of rows the stage processed.
+        rows_per_second (float): The throughput of the stage.
+        peak_memory (int | None): The peak of the memory allocated by the stage in bytes (tracemalloc),
+            None if memory tracing is off. Only this process is traced: the memory of the worker processes of
+            the multiprocess engine is not included, see `children_max_rss` of `run_benchmarks`.
+    """
+
+    stage: str
+    engine: str | None
+    seconds: float
+    rows: int
+    rows_per_second: float
+    peak_memory: int | None
+
+
+def measure(stage: str, function: Callable, rows: int, repeat: int = 1, trace_memory: bool = True,
+            engine: str | None = None) -> tuple:
+    """
+    Runs a stage several times and measures it.
+
+    The time is measured without memory tracing, because tracemalloc slows Python code down several times.
+    The peak memory is measured in one more run with tracing enabled.
+
+    Args:
+        stage (str): The stage name.
+        function (Callable): The stage, called without arguments.
+        rows (int): The number of rows the stage processes.
+        repeat (int): How many times the stage is timed, the best time is reported.
+        trace_memory (bool): Measure the peak memory of the stage.
+        engine (str | None): The comparison engine of the stage.
+
+    Returns:
+        tuple: The `StageResult` and the value returned by the last run of the stage.
+
+    Examples:
+        result, tables = measure("build_tables", partial(build_tables, first, second), rows=2_000_000)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+    peak_memory = None
+    if trace_memory:
+        del value
+        tracemalloc.start()
+        value = function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return StageResult(stage, engine, best, rows, rows / best if best else 0.0, peak_memory), value
+
+
+def decode_exports(exports: tuple) -> list:
+    """
+    Decodes the package lists of the JSON exports.
+    """
+    return [json.loads(export)["packages"] for export in exports]
+
+
+def version_release_pairs(first_table, second_table) -> list:
+    """
+    Collects the (version, version, release, release) strings of the packages present in both tables.
+    """
+    strings = first_table.pool.strings
+    first_rows = generate_package_set(first_table)
+    return [
+        (
+            strings[second_table.version[index]], strings[first_table.version[other]],
+            strings[second_table.release[index]], strings[first_table.release[other]],
+        )
+        for index, key in enumerate(second_table.keys())
+        if (other := first_rows.get(key)) is not None
+    ]
+
+
+def search_both_ways(tables: tuple) -> tuple:
+    """
+    Finds the unique packages of both tables.
+    """
+    return search_unic_packages(tables[0], tables[1]), search_unic_packages(tables[1], tables[0])
+
+
+def compare_pairs(pairs: list) -> list:
+    """
+    Compares the version-release pairs of `version_release_pairs` with an empty version key cache.
+    """
+    version_key.cache_clear()
+    return [
+        compare_versions_release(version1, version2) and compare_versions_release(release1, release2, release=True)
+        for version1, version2, release1, release2 in pairs
+    ]
+
+
+def make_response(tables: tuple, sorted_data: list) -> dict:
+    """
+    Builds the response of the results of an engine.
+    """
+    return create_response([
+        tables[0].records(sorted_data[0]),
+        tables[1].records(sorted_data[1]),
+        tables[1].records(sorted_data[2]),
+    ])
+
+
+def write_output(path: str, response: dict) -> None:
+    """
+    Writes a response to a JSON file.
+    """
+    with open_output(path) as file:
+        write_response(response, [file])
+
+
+def git_revision() -> str | None:
+    """
+    Returns the commit of the benchmarked code, if it is run from a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    rows: int,
+    overlap: float = 0.9,
+    update_rate: float = 0.3,
+    seed: int = 0,
+    engines: tuple = BENCHMARK_ENGINES,
+    processes: int | None = None,
+    repeat: int = 1,
+    trace_memory: bool = True,
+) -> dict:
+    """
+    Times every stage of the comparison pipeline on generated branches.
+
+    The stages are: JSON decoding of both exports, building the package tables, `search_unic_packages`,
+    `be_into_to_lists`, `compare_versions_release` on the version-release pairs of the common packages
+    (with an empty version key cache) and, for every engine, the comparison itself, `create_response`
+    and writing the output file.
+
+    Args:
+        rows (int): The approximate number of rows in each branch.
+        overlap (float): The share of the packages of the first branch kept in the second one.
+        update_rate (float): The share of the kept packages with another version-release.
+        seed (int): The seed of the data generator.
+        engines (tuple): The engines to benchmark, see `BENCHMARK_ENGINES`.
+        processes (int | None): The number of processes of the multiprocess engine, all cores by default.
+        repeat (int): How many times every stage is timed.
+        trace_memory (bool): Measure the peak memory of every stage.
+
+    Returns:
+        dict: The machine-readable results: the parameters, the machine, the list of stage measurements, the peak
+              RSS of this process (`max_rss`) and the largest peak RSS of its finished child processes
+              (`children_max_rss`), e.g. the workers of the multiprocess engine that tracemalloc does not see.
+
+    Examples:
+        run_benchmarks(1_000_000, engines=("merge",))
+        {'parameters': {...}, 'machine': {...}, 'stages': [{'stage': 'json_decode', ...}, ...]}
+    """
+    processes = processes or cpu_count()
+    first, second = generate_branch_pair(rows, overlap, update_rate, seed=seed)
+    exports = export_bytes(first), export_bytes(second)
+    total = len(first) + len(second)
+    del first, second
+    results = []
+
+    def measured(stage: str, function: Callable, stage_rows: int = total, engine: str | None = None):
+        result, value = measure(stage, function, stage_rows, repeat, trace_memory, engine)
+        results.append(result)
+        sys.stdout.write(
+            f"\t{stage + (f' [{engine}]' if engine else ''):<30} {result.seconds:9.3f} s "
+            f"{result.rows_per_second:14,.0f} rows/s"
+            + (f" {result.peak_memory / 1024**2:10.1f} MiB" if result.peak_memory is not None else "")
+            + "\n"
+        )
+        return value
+
+    decoded = measured("json_decode", partial(decode_exports, exports))
+    tables = measured("build_tables", partial(build_tables, *decoded))
+    # The tables keep no reference to the decoded packages.
+    decoded.clear()
+    measured("search_unic_packages", partial(search_both_ways, tables))
+    measured("be_into_to_lists", partial(be_into_to_lists, tables[1], tables[0]))
+
+    def measure_version_comparison():
+        pairs = version_release_pairs(*tables)
+        measured("compare_versions_release", partial(compare_pairs, pairs), len(pairs))
+
+    measure_version_comparison()
+    variants = {
+        "sync": partial(sync_variant, *tables),
+        "merge": partial(merge_variant, *tables),
+        "multiprocess": partial(multiprocess_variant, processes, *tables),
+        "numpy": partial(numpy_variant, *tables),
+    }
+
+    def measure_engine(engine: str, output_path: str):
+        sorted_data = measured("compare", variants[engine], engine=engine)
+        result_rows = sum(map(len, sorted_data))
+        response = measured("create_response", partial(make_response, tables, sorted_data), result_rows, engine)
+        measured("write_output", partial(write_output, output_path, response), result_rows, engine)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in engines:
+            measure_engine(engine, os.path.join(directory, "result.json"))
+
+    return {
+        "parameters": {
+            "rows": rows,
+            "overlap": overlap,
+            "update_rate": update_rate,
+            "seed": seed,
+            "engines": list(engines),
+            "processes": processes,
+            "repeat": repeat,
+            "total_rows": total,
+        },
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": cpu_count(),
+        },
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "children_max_rss": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        "stages": [dataclasses.asdict(result) for result in results],
+    }
+
+
+def main():
+    """
+    Runs the benchmark suite from the command line.
+
+    Command-line Arguments:
+        --rows (int, optional): The approximate number of rows in each generated branch.
+        --overlap (float, optional): The share of the packages of the first branch kept in the second one.
+        --update-rate (float, optional): The share of the kept packages with another version-release.
+        --seed (int, optional): The seed of the data generator.
+        --engines (list, optional): The engines to benchmark.
+        --processes (int, optional): The number of processes of the multiprocess engine.
+        --repeat (int, optional): How many times every stage is timed, the best time is reported.
+        --no-memory (bool, optional): Do not measure the peak memory of the stages.
+        --output (str, optional): The JSON file the results are appended to, one run per line.
+
+    Examples:
+        $ python -m benchmarks.run --rows 1000000 --output benchmarks.jsonl
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the package comparison on generated branches.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Approximate number of rows in each branch")
+    parser.add_argument("--overlap", type=float, default=0.9, help="Share of packages kept in the second branch")
+    parser.add_argument("--update-rate", type=float, default=0.3, help="Share of kept packages that were updated")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generator")
+    parser.add_argument(
+        "--engines", nargs="+", choices=BENCHMARK_ENGINES, default=list(BENCHMARK_ENGINES),
+        help="Engines to benchmark",
+    )
+    parser.add_argument("--processes", type=int, help="Number of processes of the multiprocess engine")
+    parser.add_argument("--repeat", type=int, default=1, help="How many times every stage is timed")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure the peak memory of the stages")
+    parser.add_argument("--output", help="File the JSON results are appended to, one run per line")
+    args = parser.parse_args()
+
+    sys.stdout.write(f"\n\tGenerating two branches of about {args.rows:,} rows (seed {args.seed})\n\n")
+    results = run_benchmarks(
+        args.rows, args.overlap, args.update_rate, args.seed, tuple(args.engines),
+        args.processes, args.repeat, not args.no_memory,
+    )
+    sys.stdout.write(
+        f"\n\tPeak RSS: {results['max_rss'] / 1024**2:.1f} MiB, "
+        f"child processes: {results['children_max_rss'] / 1024**2:.1f} MiB\n"
+    )
+    if args.output is not None:
+        with open(args.output, "a") as file:
+            file.write(json.dumps(results) + "\n")
+        sys.stdout.write(f"\tThe results are appended to {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
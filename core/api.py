@@ -0,0 +1,247 @@
+import dataclasses
+from collections import Counter
+from typing import Iterable, Iterator, TextIO
+
+from core.classes import PackageRow, PackageTable, SourceRollup
+from core.data_extractor import build_tables, compare_tables
+from core.parse_data import PackageFilter
+from core.planner import ExecutionPlan, MachineProfile, choose_plan
+from core.utils import create_response, create_source_response
+from core.writer import iter_response, write_response
+
+CATEGORIES = SourceRollup.CATEGORIES
+
+
+@dataclasses.dataclass()
+class ComparisonResult:
+    """
+    The result of a comparison of two branches, kept as row numbers of the compared tables.
+
+    Nothing is decoded or serialized until it is asked for: counts and per-architecture slices work on the row
+    numbers and string codes, the packages of a category are decoded one by one while they are iterated, and
+    the response document is built only by `to_response`, `to_json` or `write`.
+
+    Attributes:
+        first (PackageTable): The table of the first branch.
+        second (PackageTable): The table of the second branch, sharing the string pool of the first one.
+        rows (list): The row numbers of every category in `CATEGORIES`: the rows of `first` missing in `second`,
+            the rows of `second` missing in `first` and the rows of `second` newer than in `first`.
+        rollup (SourceRollup | None): The counts per source package, if they were collected by the comparison.
+
+    Examples:
+        result = compare_branches(p10, sisyphus)
+        result.counts()
+        {'first_package': 1204, 'second_package': 8733, 'newer_versions_first_package': 15012}
+        next(result.for_arch("x86_64").iter_packages("second_package"))
+        {'name': 'pkg2', 'epoch': 0, 'version': '1.0', 'release': 'alt1', 'arch': 'x86_64', ...}
+    """
+
+    first: PackageTable
+    second: PackageTable
+    rows: list
+    rollup: SourceRollup | None = None
+
+    def _category(self, category: str) -> int:
+        if category not in CATEGORIES:
+            raise ValueError(f"Unknown result category: {category}. Available categories: {', '.join(CATEGORIES)}")
+        return CATEGORIES.index(category)
+
+    def table(self, category: str) -> PackageTable:
+        """
+        Returns the table the rows of a category belong to.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+
+        Returns:
+            PackageTable: `first` for "first_package", `second` otherwise.
+        """
+        return self.first if self._category(category) == 0 else self.second
+
+    def counts(self) -> dict:
+        """
+        Counts the packages of every category.
+
+        Returns:
+            dict: Maps every category to its number of packages.
+        """
+        return {category: len(rows) for category, rows in zip(CATEGORIES, self.rows)}
+
+    def arch_counts(self) -> dict:
+        """
+        Counts the packages of every category per architecture.
+
+        Returns:
+            dict: Maps every category to a dictionary of architectures (in alphabetical order) and their counts.
+
+        Examples:
+            result.arch_counts()["second_package"]
+            {'aarch64': 2110, 'noarch': 1730, 'x86_64': 2208, ...}
+        """
+        strings = self.first.pool.strings
+        result = {}
+        for category, rows in zip(CATEGORIES, self.rows):
+            counts = Counter(map(self.table(category).arch.__getitem__, rows))
+            result[category] = {strings[code]: counts[code] for code in sorted(counts, key=strings.__getitem__)}
+        return result
+
+    def arches(self) -> list:
+        """
+        Lists the architectures that have packages in any category.
+
+        Returns:
+            list: The architecture names in alphabetical order.
+        """
+        codes = set()
+        for category, rows in zip(CATEGORIES, self.rows):
+            codes.update(map(self.table(category).arch.__getitem__, rows))
+        return sorted(self.first.pool.strings[code] for code in codes)
+
+    def for_arch(self, arch: str) -> "ComparisonResult":
+        """
+        Selects the packages of one architecture.
+
+        Args:
+            arch (str): The architecture, e.g. "x86_64".
+
+        Returns:
+            ComparisonResult: A result over the same tables with only the rows of that architecture.
+        """
+        code = self.first.pool.codes.get(arch)
+        rows = []
+        for category, category_rows in zip(CATEGORIES, self.rows):
+            arches = self.table(category).arch
+            rows.append([row for row in category_rows if arches[row] == code] if code is not None else [])
+        return ComparisonResult(self.first, self.second, rows)
+
+    def iter_rows(self, category: str) -> Iterator[PackageRow]:
+        """
+        Iterates over the packages of a category as row views, which decode only the fields that are read.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+
+        Returns:
+            Iterator[PackageRow]: The packages in the order of the comparison.
+        """
+        table = self.table(category)
+        return (PackageRow(table, row) for row in self.rows[self._category(category)])
+
+    def iter_packages(self, category: str) -> Iterator[dict]:
+        """
+        Iterates over the packages of a category, decoding them one by one.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+
+        Returns:
+            Iterator[dict]: Package dictionaries in the order of the comparison.
+        """
+        return self.table(category).iter_records(self.rows[self._category(category)])
+
+    def sources(self) -> dict:
+        """
+        Groups the result by source package, see `SourceRollup.to_dict`.
+
+        The counts are taken from the comparison if it collected them (`compare_branches(..., by_source=True)`),
+        otherwise the rows are counted on the first call.
+
+        Returns:
+            dict: Maps every source package to the per-architecture counts of each category and the total.
+        """
+        if self.rollup is None:
+            self.rollup = SourceRollup(self.first.pool)
+            for position, (category, rows) in enumerate(zip(CATEGORIES, self.rows)):
+                self.rollup.add_rows(position, self.table(category), rows)
+        return self.rollup.to_dict()
+
+    def to_response(self, by_source: bool = False) -> dict:
+        """
+        Builds the response document of `core.utils.create_response` with the user and the time.
+
+        Args:
+            by_source (bool): Build the response grouped by source package, see `create_source_response`.
+
+        Returns:
+            dict: The response, its package lists are iterators that can be consumed only once.
+        """
+        if by_source:
+            return create_source_response(self.sources())
+        return create_response([self.iter_packages(category) for category in CATEGORIES])
+
+    def write(self, outputs: Iterable[TextIO], output_format: str = "json", by_source: bool = False) -> int:
+        """
+        Serializes the response once and writes it to the outputs, see `core.writer.write_response`.
+
+        Args:
+            outputs (Iterable[TextIO]): The files to write to.
+            output_format (str): One of `core.writer.FORMATS`.
+            by_source (bool): Write the response grouped by source package.
+
+        Returns:
+            int: The number of characters written to each output.
+        """
+        return write_response(self.to_response(by_source), outputs, output_format)
+
+    def to_json(self, output_format: str = "json", by_source: bool = False) -> str:
+        """
+        Serializes the response into a string.
+
+        Args:
+            output_format (str): One of `core.writer.FORMATS`.
+            by_source (bool): Serialize the response grouped by source package.
+
+        Returns:
+            str: The JSON document.
+        """
+        return "".join(iter_response(self.to_response(by_source), output_format))
+
+
+def compare_branches(
+    first_package: Iterable,
+    second_package: Iterable,
+    engine: str = "merge",
+    state_path: str | None = None,
+    plan: ExecutionPlan | None = None,
+    by_source: bool = False,
+    indexes: tuple | None = None,
+    package_filter: PackageFilter | None = None,
+    profile: MachineProfile | None = None,
+) -> ComparisonResult:
+    """
+    Compares the packages of two branches for use as a library: nothing is printed and no response is built.
+
+    No calibration is run and no file is written: "auto" follows the given plan, or a plan made with the given
+    machine profile (see `core.planner.choose_plan`), and falls back to the single join without either.
+
+    Args:
+        first_package (Iterable): The packages of the first branch: package dictionaries, a `PackageTable` or a
+            binary snapshot, see `core.data_extractor.build_tables`.
+        second_package (Iterable): The packages of the second branch, where newer versions are searched.
+        engine (str): The comparison engine, one of `core.data_extractor.ENGINES`.
+        state_path (str | None): The state file of an incremental comparison, see `incremental_variant`.
+        plan (ExecutionPlan | None): A ready execution plan for "auto", e.g. from `core.planner.plan_execution`.
+        by_source (bool): Count the packages per source package during the comparison, see `ComparisonResult.sources`.
+        indexes (tuple | None): Prebuilt `TableIndex` objects of both branches, e.g. from `core.pipeline.fetch_indexed`.
+        package_filter (PackageFilter | None): The filter the branches were read with, see `incremental_variant`.
+        profile (MachineProfile | None): The machine profile "auto" plans with if no plan is given, e.g. from
+            `core.planner.load_profile`.
+
+    Returns:
+        ComparisonResult: The lazy result of the comparison.
+
+    Examples:
+        packages1, packages2 = asyncio.run(async_version("p10", "sisyphus"))
+        result = compare_branches(packages1, packages2)
+        result.for_arch("noarch").counts()
+        {'first_package': 87, 'second_package': 1730, 'newer_versions_first_package': 2904}
+    """
+    first_package, second_package = build_tables(first_package, second_package)
+    if engine == "auto" and plan is None and state_path is None:
+        if profile is None:
+            engine = "merge"
+        else:
+            plan = choose_plan(len(first_package) + len(second_package), profile)
+    rollup = SourceRollup(first_package.pool) if by_source else None
+    rows = compare_tables(first_package, second_package, engine, state_path, plan, rollup, indexes, package_filter)
+    return ComparisonResult(first_package, second_package, rows, rollup)
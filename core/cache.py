@@ -0,0 +1,356 @@
+import dataclasses
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from hashlib import blake2b
+from pathlib import Path
+from typing import Iterator
+
+from core.classes import PackageTable
+from core.snapshot import MappedSnapshot, write_snapshot
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_SIZE = 2 * 1024**3
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def short_hash(text: str) -> str:
+    """
+    Returns a short stable hash of a string, the same on every run.
+
+    Args:
+        text (str): The string.
+
+    Returns:
+        str: 8 hex digits of the blake2b hash of the string.
+    """
+    return blake2b(text.encode("utf-8", "surrogatepass"), digest_size=4).hexdigest()
+
+
+def safe_file_name(name: str) -> str:
+    """
+    Replaces the characters that are not safe in a file name and appends a short hash of the original name,
+    so names that differ only in the replaced characters get different files.
+
+    Args:
+        name (str): A branch name or another identifier.
+
+    Returns:
+        str: The name with everything except letters, digits, dots, dashes and underscores replaced by "_",
+             followed by "-" and `short_hash` of the name.
+
+    Examples:
+        safe_file_name("p10/x86_64"), safe_file_name("p10_x86_64")
+        ('p10_x86_64-a9d1517b', 'p10_x86_64-584ef3a9')
+    """
+    safe_name = re.sub(r"[^\w.-]", "_", name)
+    return f"{safe_name}-{short_hash(name)}"
+
+
+@dataclasses.dataclass()
+class CacheEntry:
+    """
+    Metadata of a branch export stored in the snapshot cache.
+
+    Attributes:
+        branch (str): The branch name the snapshot belongs to.
+        path (Path): The path to the raw response body on disk.
+        etag (str | None): The ETag header returned by the API, if any.
+        last_modified (str | None): The Last-Modified header returned by the API, if any.
+        fetched_at (float): The UNIX time the snapshot was last downloaded or revalidated.
+        size (int): The size of the stored response body in bytes.
+    """
+
+    branch: str
+    path: Path
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+    size: int
+
+
+class SnapshotCache:
+    """
+    An on-disk cache of raw `/export/branch_binary_packages/{branch}` responses, keyed by branch.
+
+    Every branch is stored as two files: `<branch>.json` with the response body exactly as it was received
+    and `<branch>.meta.json` with the validators needed for a conditional request. A snapshot younger
+    than `ttl` seconds is used without contacting the API, an older one is revalidated with
+    If-None-Match / If-Modified-Since. The file names are made with `safe_file_name`.
+
+    With `binary` enabled, every branch also gets `<branch>.snapshot` in the memory-mappable format of
+    `core.snapshot`, built once from the JSON body and removed whenever the body is replaced. The incremental
+    comparison keeps a `.state` file per branch pair, see `diff_state_path`.
+
+    When the total size of the files exceeds `max_size`, the least recently used branches (all their files)
+    and pair states are removed.
+
+    Examples:
+        cache = SnapshotCache("~/.cache/compare_packages", ttl=3600)
+        entry = cache.get("sisyphus")
+        cache.is_fresh(entry)
+        True
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+        binary: bool = False,
+    ):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.binary = binary
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, branch: str) -> tuple[Path, Path]:
+        name = safe_file_name(branch)
+        return self.cache_dir / f"{name}.json", self.cache_dir / f"{name}.meta.json"
+
+    def get(self, branch: str) -> CacheEntry | None:
+        """
+        Returns the cached snapshot of a branch.
+
+        Args:
+            branch (str): The branch name.
+
+        Returns:
+            CacheEntry | None: The snapshot metadata, or None if the branch is not cached.
+        """
+        data_path, meta_path = self._paths(branch)
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            size = data_path.stat().st_size
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(
+            branch=branch,
+            path=data_path,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            fetched_at=meta.get("fetched_at", 0),
+            size=size,
+        )
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """
+        Checks whether a snapshot can be used without revalidating it with the API.
+
+        Args:
+            entry (CacheEntry): The cached snapshot.
+
+        Returns:
+            bool: True if the snapshot is younger than the cache TTL.
+        """
+        return time.time() - entry.fetched_at < self.ttl
+
+    @staticmethod
+    def validation_headers(entry: CacheEntry | None) -> dict:
+        """
+        Builds the headers of a conditional request for a cached snapshot.
+
+        Args:
+            entry (CacheEntry | None): The cached snapshot, if any.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if there is nothing to revalidate.
+
+        Examples:
+            SnapshotCache.validation_headers(entry)
+            {'If-None-Match': '"5f3a-1c9"'}
+        """
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, entry: CacheEntry) -> CacheEntry:
+        """
+        Marks a snapshot as confirmed by the API (HTTP 304), restarting its TTL.
+
+        Args:
+            entry (CacheEntry): The cached snapshot.
+
+        Returns:
+            CacheEntry: The updated snapshot metadata.
+        """
+        entry.fetched_at = time.time()
+        self._write_meta(entry)
+        return entry
+
+    def read_chunks(self, entry: CacheEntry, block_size: int = READ_BLOCK_SIZE) -> Iterator[bytes]:
+        """
+        Reads a cached response body block by block.
+
+        Args:
+            entry (CacheEntry): The cached snapshot.
+            block_size (int): The size of the blocks to read.
+
+        Returns:
+            Iterator[bytes]: The response body in blocks.
+        """
+        os.utime(entry.path)
+        with open(entry.path, "rb") as file:
+            while block := file.read(block_size):
+                yield block
+
+    def load(self, entry: CacheEntry) -> list:
+        """
+        Loads the package list of a cached snapshot at once.
+
+        Args:
+            entry (CacheEntry): The cached snapshot.
+
+        Returns:
+            list: The package dictionaries stored in the snapshot.
+        """
+        os.utime(entry.path)
+        with open(entry.path, "rb") as file:
+            return json.load(file)["packages"]
+
+    def binary_path(self, branch: str) -> Path:
+        """
+        Returns the path of the binary snapshot of a branch.
+
+        Args:
+            branch (str): The branch name.
+
+        Returns:
+            Path: The `.snapshot` file inside the cache directory.
+        """
+        return self.cache_dir / f"{safe_file_name(branch)}.snapshot"
+
+    def load_binary(self, entry: CacheEntry, packages: list | PackageTable | None = None) -> MappedSnapshot:
+        """
+        Opens the binary snapshot of a cached branch, writing it first if it does not exist yet or has an older format.
+
+        Args:
+            entry (CacheEntry): The cached snapshot.
+            packages (list | PackageTable | None): The packages of the snapshot if they are already in memory,
+                otherwise they are loaded from the JSON body when the binary snapshot has to be written.
+
+        Returns:
+            MappedSnapshot: The memory-mapped snapshot.
+
+        Examples:
+            snapshot = cache.load_binary(cache.get("sisyphus"))
+            build_tables(snapshot, other)
+        """
+        path = self.binary_path(entry.branch)
+        if path.exists():
+            try:
+                snapshot = MappedSnapshot(path)
+            except ValueError:
+                # Written in an older format, it is replaced below.
+                pass
+            else:
+                os.utime(entry.path)
+                return snapshot
+        if isinstance(packages, PackageTable):
+            table = packages
+        else:
+            table = PackageTable.from_records(packages if packages is not None else self.load(entry))
+        write_snapshot(path, table)
+        return MappedSnapshot(path)
+
+    @contextmanager
+    def store(self, branch: str, etag: str | None = None, last_modified: str | None = None):
+        """
+        Writes a new snapshot of a branch.
+
+        The body is written to a temporary file that replaces the previous snapshot only when the
+        `with` block finishes without an error, so an interrupted download never corrupts the cache.
+
+        Args:
+            branch (str): The branch name.
+            etag (str | None): The ETag header of the response.
+            last_modified (str | None): The Last-Modified header of the response.
+
+        Yields:
+            BinaryIO: The file to write the response body to.
+
+        Examples:
+            with cache.store("sisyphus", etag='"5f3a-1c9"') as file:
+                file.write(body)
+        """
+        data_path, _ = self._paths(branch)
+        temp_path = data_path.with_name(f"{data_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(temp_path, "wb") as file:
+                yield file
+            os.replace(temp_path, data_path)
+            self.binary_path(branch).unlink(missing_ok=True)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        entry = CacheEntry(branch, data_path, etag, last_modified, time.time(), data_path.stat().st_size)
+        self._write_meta(entry)
+        self.evict(keep=branch)
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Removes the least recently used branches and pair states until the cache fits into `max_size`.
+
+        A branch is its body, metadata and binary snapshot, it is as old as the body (reading a snapshot touches
+        it). A pair state is rewritten by every incremental run of the pair.
+
+        Args:
+            keep (str | None): A branch that must not be removed, e.g. the one that was just stored.
+        """
+        keep_path = self._paths(keep)[0] if keep is not None else None
+        items = []
+        for path in self.cache_dir.glob("*.json"):
+            if not path.name.endswith(".meta.json"):
+                stem = path.name[: -len(".json")]
+                items.append((path, [path, path.with_name(f"{stem}.meta.json"), path.with_name(f"{stem}.snapshot")]))
+        items.extend((path, [path]) for path in self.cache_dir.glob("*.state"))
+        stats = {path: path.stat() for _, files in items for path in files if path.exists()}
+        items.sort(key=lambda item: stats[item[0]].st_mtime if item[0] in stats else 0)
+        total = sum(stat.st_size for stat in stats.values())
+        for path, files in items:
+            if total <= self.max_size:
+                break
+            if path == keep_path:
+                continue
+            for file in files:
+                if file in stats:
+                    total -= stats[file].st_size
+                file.unlink(missing_ok=True)
+
+    def diff_state_path(self, branch1: str, branch2: str) -> Path:
+        """
+        Returns the path of the incremental comparison state of a branch pair.
+
+        The name ends with a hash of both names, so every ordered pair gets its own file.
+
+        Args:
+            branch1 (str): The first branch name.
+            branch2 (str): The second branch name.
+
+        Returns:
+            Path: The state file path inside the cache directory.
+
+        Examples:
+            cache.diff_state_path("p10", "sisyphus").name
+            'p10_sisyphus-f3534b61.state'
+        """
+        names = "_".join(re.sub(r"[^\w.-]", "_", branch) for branch in (branch1, branch2))
+        return self.cache_dir / f"{names}-{short_hash(json.dumps([branch1, branch2]))}.state"
+
+    def _write_meta(self, entry: CacheEntry) -> None:
+        _, meta_path = self._paths(entry.branch)
+        meta = {
+            "branch": entry.branch,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "fetched_at": entry.fetched_at,
+        }
+        with open(meta_path, "w") as file:
+            json.dump(meta, file)
@@ -1,4 +1,7 @@
 import dataclasses
+from array import array
+from collections import Counter
+from typing import Iterable, Iterator
 
 
 @dataclasses.dataclass()
@@ -25,3 +28,347 @@ class Package:
     disttag: str
     buildtime: int
     source: str
+
+
+PACKAGE_FIELDS = tuple(field.name for field in dataclasses.fields(Package))
+STRING_FIELDS = ("name", "version", "release", "arch", "disttag", "source")
+INTEGER_FIELDS = ("epoch", "buildtime")
+# The array typecodes of the columns: string codes are 32-bit and integers 64-bit numbers.
+COLUMN_TYPES = {field: "I" if field in STRING_FIELDS else "q" for field in PACKAGE_FIELDS}
+
+
+class StringPool:
+    """
+    Dictionary encoding of strings: every distinct string is stored once and referred to by an integer code.
+
+    Package tables that share a pool can compare encoded values (e.g. (name, arch) keys) directly.
+
+    Attributes:
+        codes (dict): Maps a string to its code.
+        strings (list): Maps a code to its string.
+
+    Examples:
+        pool = StringPool()
+        pool.encode("x86_64"), pool.encode("noarch"), pool.encode("x86_64")
+        (0, 1, 0)
+        pool.strings[1]
+        'noarch'
+    """
+
+    __slots__ = ("codes", "strings")
+
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+class PackageRow:
+    """
+    A lightweight read-only view of one row of a `PackageTable`.
+
+    The view does not copy any data, attributes are decoded from the table columns on access.
+
+    Examples:
+        row = table[0]
+        row.name, row.arch
+        ('pkg1', 'x86_64')
+        row.to_dict()
+        {'name': 'pkg1', 'epoch': 0, 'version': '1.0', ...}
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: "PackageTable", index: int):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, field: str):
+        if field in STRING_FIELDS:
+            return self.table.pool.strings[getattr(self.table, field)[self.index]]
+        if field in INTEGER_FIELDS:
+            return getattr(self.table, field)[self.index]
+        raise AttributeError(field)
+
+    def __repr__(self) -> str:
+        return f"PackageRow({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        return self.table.record(self.index)
+
+
+class PackageTable:
+    """
+    A columnar store of packages.
+
+    String fields are dictionary-encoded through a `StringPool` and kept as arrays of codes,
+    integer fields are kept as arrays of 64-bit integers. Compared to a list of dictionaries this
+    takes several times less memory and makes (name, arch) keys plain integers. A column may also be
+    a memoryview of the same type (see `COLUMN_TYPES`), e.g. a column of a memory-mapped snapshot.
+
+    Attributes:
+        pool (StringPool): The string pool used to encode the string columns.
+        name, version, release, arch, disttag, source (array): The string columns (codes in the pool).
+        epoch, buildtime (array): The integer columns.
+        fingerprint (TableFingerprint | None): The partition fingerprints of the table, if they are known, see
+            `core.fingerprint`. They are dropped when the table is extended.
+
+    Examples:
+        pool = StringPool()
+        table = PackageTable.from_records(
+            [{"name": "pkg1", "epoch": 0, "version": "1.0", "release": "alt1", "arch": "x86_64",
+              "disttag": "sisyphus+1", "buildtime": 1700000000, "source": "pkg"}],
+            pool,
+        )
+        len(table), table[0].name
+        (1, 'pkg1')
+    """
+
+    __slots__ = ("pool", "fingerprint") + PACKAGE_FIELDS
+
+    def __init__(self, pool: StringPool | None = None):
+        self.pool = pool if pool is not None else StringPool()
+        self.fingerprint = None
+        for field in STRING_FIELDS:
+            setattr(self, field, array("I"))
+        for field in INTEGER_FIELDS:
+            setattr(self, field, array("q"))
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], pool: StringPool | None = None) -> "PackageTable":
+        """
+        Builds a table from package dictionaries as returned by the API.
+
+        Args:
+            records (Iterable[dict]): Package dictionaries, a list or a single-pass iterator.
+            pool (StringPool | None): The pool to encode strings with, share it between tables that are compared.
+
+        Returns:
+            PackageTable: The filled table.
+        """
+        table = cls(pool)
+        table.extend(records)
+        return table
+
+    @classmethod
+    def from_columns(cls, columns: dict, pool: StringPool) -> "PackageTable":
+        """
+        Builds a table from already encoded columns, e.g. the ones returned by `select`.
+
+        Args:
+            columns (dict): Maps field names to arrays, missing fields are left empty.
+            pool (StringPool): The pool the string columns are encoded with.
+
+        Returns:
+            PackageTable: The table using the given arrays without copying them.
+        """
+        table = cls(pool)
+        for field, column in columns.items():
+            setattr(table, field, column)
+        return table
+
+    def select(self, rows: Iterable[int], fields: Iterable[str] = PACKAGE_FIELDS) -> dict:
+        """
+        Copies the given rows of the given columns.
+
+        Args:
+            rows (Iterable[int]): Row numbers.
+            fields (Iterable[str]): The columns to copy.
+
+        Returns:
+            dict: Maps every field name to a new array with the selected rows.
+
+        Examples:
+            table.select([0, 2], ("name", "arch"))
+            {'name': array('I', [0, 7]), 'arch': array('I', [3, 3])}
+        """
+        rows = rows if isinstance(rows, (list, array)) else list(rows)
+        return {
+            field: array(COLUMN_TYPES[field], map(getattr(self, field).__getitem__, rows))
+            for field in fields
+        }
+
+    def extend(self, records: Iterable[dict]) -> None:
+        self.fingerprint = None
+        encode = self.pool.encode
+        columns = [(field, getattr(self, field).append) for field in STRING_FIELDS]
+        integers = [(field, getattr(self, field).append) for field in INTEGER_FIELDS]
+        for record in records:
+            for field, append in columns:
+                append(encode(record[field]))
+            for field, append in integers:
+                append(record[field])
+
+    def __len__(self) -> int:
+        return len(self.name)
+
+    def __getitem__(self, index: int) -> PackageRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError("package table index out of range")
+        return PackageRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator[PackageRow]:
+        return (PackageRow(self, index) for index in range(len(self)))
+
+    def keys(self) -> list:
+        """
+        Returns the (name, arch) key of every row packed into a single integer.
+
+        Keys are comparable between tables that share a string pool.
+
+        Returns:
+            list: One integer key per row, in row order.
+        """
+        return [name << 32 | arch for name, arch in zip(self.name, self.arch)]
+
+    def record(self, index: int) -> dict:
+        """
+        Decodes a row back into the package dictionary it was built from.
+
+        Args:
+            index (int): The row number.
+
+        Returns:
+            dict: The package dictionary with the fields in API order.
+        """
+        strings = self.pool.strings
+        return {
+            "name": strings[self.name[index]],
+            "epoch": self.epoch[index],
+            "version": strings[self.version[index]],
+            "release": strings[self.release[index]],
+            "arch": strings[self.arch[index]],
+            "disttag": strings[self.disttag[index]],
+            "buildtime": self.buildtime[index],
+            "source": strings[self.source[index]],
+        }
+
+    def records(self, indices: Iterable[int]) -> list:
+        """
+        Decodes the given rows into package dictionaries.
+
+        Args:
+            indices (Iterable[int]): Row numbers.
+
+        Returns:
+            list: Package dictionaries in the order of `indices`.
+        """
+        return [self.record(index) for index in indices]
+
+    def iter_records(self, indices: Iterable[int]) -> Iterator[dict]:
+        """
+        Decodes the given rows into package dictionaries one by one, when they are consumed.
+
+        Args:
+            indices (Iterable[int]): Row numbers.
+
+        Returns:
+            Iterator[dict]: Package dictionaries in the order of `indices`.
+        """
+        return map(self.record, indices)
+
+
+@dataclasses.dataclass()
+class TableIndex:
+    """
+    The (name, arch) index of a package table, built once and shared by all comparisons of the table.
+
+    Attributes:
+        keys (list): The packed key of every indexed row, see `PackageTable.keys`.
+        first_rows (dict): Maps every key to the number of the first row with that key.
+        rows (list | array | None): The numbers of the indexed rows if only some rows are indexed (e.g. the rows
+            of one architecture), None if the index covers the whole table.
+
+    Examples:
+        index = TableIndex.build(table)
+        index.first_rows[index.keys[5]]
+        5
+    """
+
+    keys: list
+    first_rows: dict
+    rows: list | array | None = None
+
+    @classmethod
+    def build(cls, table: PackageTable, rows: Iterable[int] | None = None) -> "TableIndex":
+        if rows is None:
+            keys = table.keys()
+            # Filled from the end, so the first row with a duplicate key is the one that remains.
+            return cls(keys, dict(zip(reversed(keys), reversed(range(len(keys))))))
+        # Only some rows, e.g. the ones left by `core.fingerprint.changed_rows`, in ascending order.
+        names, arches = table.name, table.arch
+        keys = [names[row] << 32 | arches[row] for row in rows]
+        return cls(keys, dict(zip(reversed(keys), reversed(rows))), rows)
+
+
+class SourceRollup:
+    """
+    Counts the packages of a comparison result per source package, result category and architecture.
+
+    The counts are filled by the comparison itself (see `core.data_extractor.merge_variant`), row by row as
+    the rows are classified, so grouping does not need another pass over the results. Counters are keyed by
+    the packed (source, arch) codes of the string pool and are decoded only by `to_dict`.
+
+    Attributes:
+        pool (StringPool): The pool the compared tables are encoded with.
+        counts (list): One `Counter` per result category, mapping `source << 32 | arch` codes to package counts.
+
+    Examples:
+        rollup = SourceRollup(table1.pool)
+        merge_variant(table1, table2, rollup=rollup)
+        rollup.to_dict()["bash"]
+        {'first_package': {}, 'second_package': {'x86_64': 1}, 'newer_versions_first_package': {'i586': 2, ...},
+         'total': 3}
+    """
+
+    CATEGORIES = ("first_package", "second_package", "newer_versions_first_package")
+
+    def __init__(self, pool: StringPool):
+        self.pool = pool
+        self.counts = [Counter() for _ in self.CATEGORIES]
+
+    def add_rows(self, category: int, table: PackageTable, rows: Iterable[int]) -> None:
+        """
+        Counts already classified rows, for the engines that return only row numbers.
+
+        Args:
+            category (int): The position of the result category in `CATEGORIES`.
+            table (PackageTable): The table the rows belong to.
+            rows (Iterable[int]): Row numbers.
+        """
+        source, arch = table.source, table.arch
+        self.counts[category].update(source[row] << 32 | arch[row] for row in rows)
+
+    def to_dict(self) -> dict:
+        """
+        Decodes the counts.
+
+        Returns:
+            dict: Maps every source package, in alphabetical order, to the per-architecture counts of each result
+                  category and the total number of its packages in the result.
+        """
+        strings = self.pool.strings
+        sources = {}
+        for category, counts in zip(self.CATEGORIES, self.counts):
+            for key, count in counts.items():
+                groups = sources.get(key >> 32)
+                if groups is None:
+                    groups = sources[key >> 32] = {name: {} for name in self.CATEGORIES}
+                groups[category][strings[key & 0xFFFFFFFF]] = count
+        result = {}
+        for code in sorted(sources, key=strings.__getitem__):
+            groups = sources[code]
+            for category in self.CATEGORIES:
+                groups[category] = dict(sorted(groups[category].items()))
+            groups["total"] = sum(sum(groups[category].values()) for category in self.CATEGORIES)
+            result[strings[code]] = groups
+        return result
@@ -1,137 +1,429 @@
 import json
 import sys
-from multiprocessing import Pool
-from typing import Callable
+from array import array
+from collections import Counter
+from heapq import merge
+from itertools import combinations
+from multiprocessing import Pool, cpu_count
+from typing import Iterable
 
-from core.classes import Package
+from core.classes import PackageTable, SourceRollup, StringPool, TableIndex
+from core.external import external_variant
+from core.fingerprint import MIN_SKIPPED_SHARE, MIN_SKIPPED_SHARE_INDEXED, changed_rows
+from core.incremental import incremental_variant
+from core.parse_data import PackageFilter
+from core.planner import ExecutionPlan, plan_execution
+from core.shared import SharedShards
+from core.snapshot import MappedSnapshot
 from core.utils import (
-    check_difficult,
     colorize_text,
-    compare_versions_release,
+    create_matrix_response,
+    create_matrix_source_response,
+    create_newest_response,
     create_response,
+    create_source_response,
+    format_evr,
     generate_package_set,
-    key_func_name,
-    worker,
+    is_newer_package,
 )
+from core.vectorized import numpy_variant
 
+ENGINES = ("auto", "sync", "multiprocess", "merge", "numpy", "external")
+SHARDS_PER_PROCESS = 4
 
-def search_unic_packages(data_list1: list, data_list2: list, key_func: Callable[["Package"], tuple]) -> list:
+
+def build_tables(*packages: Iterable) -> tuple:
+    """
+    Builds the package tables of several branches with a shared string pool.
+
+    Arguments that are already `PackageTable` objects are used as is (the pool of the first such table is
+    shared with the other ones), binary snapshots (`core.snapshot.MappedSnapshot`) are translated into the
+    shared pool, any other iterable of package dictionaries is consumed once, so lists and the package
+    iterators of `core.parse_data` are accepted alike.
+
+    Args:
+        *packages (Iterable): The packages of every branch.
+
+    Returns:
+        tuple: `PackageTable` objects whose (name, arch) keys can be compared with each other.
+
+    Examples:
+        first, second = build_tables(list1, list2)
+        first.pool is second.pool
+        True
+    """
+    tables = [package for package in packages if isinstance(package, PackageTable)]
+    pool = tables[0].pool if tables else StringPool()
+    if any(table.pool is not pool for table in tables):
+        raise ValueError("Package tables must share a string pool to be compared")
+    snapshots = {}
+
+    def build(package) -> PackageTable:
+        if isinstance(package, PackageTable):
+            return package
+        if isinstance(package, MappedSnapshot):
+            # The same snapshot is returned for a branch that is listed several times.
+            if id(package) not in snapshots:
+                snapshots[id(package)] = package.table(pool)
+            return snapshots[id(package)]
+        return PackageTable.from_records(package, pool)
+
+    return tuple(map(build, packages))
+
+
+def search_unic_packages(table1: PackageTable, table2: PackageTable) -> list:
     """
-    Filters items from the first list that are not in the second list, based on the key function.
+    Filters rows of the first table whose (name, arch) key is not in the second table.
 
     Args:
-        data_list1 (list): The first list of dictionaries representing packages.
-        data_list2 (list): The second list of dictionaries representing packages.
-        key_func (Callable[["Package"], tuple]): A function to extract the key from a package.
+        table1 (PackageTable): The first package table.
+        table2 (PackageTable): The second package table, sharing the string pool with the first one.
 
     Returns:
-        list: A list of packages that are present in the first list but not present in the second list.
+        list: The numbers of the rows of the first table that are not present in the second table.
 
     Examples:
-        unic_first_list(list1, list2, lambda pkg: (pkg.name, pkg.arch))
-        [{'name': 'pkg1', 'arch': 'x86_64'}, {'name': 'pkg2', 'arch': 'arm'}]
+        search_unic_packages(table1, table2)
+        [0, 5, 17]
     """
-    package_set = {key_func(Package(**d)) for d in data_list2}
-    data = [d for d in data_list1 if key_func(Package(**d)) not in package_set]
+    package_set = set(table2.keys())
+    data = [index for index, key in enumerate(table1.keys()) if key not in package_set]
     return data
 
 
-def be_into_to_lists(data_list1: list, data_list2: list) -> list:
+def be_into_to_lists(table1: PackageTable, table2: PackageTable) -> list:
     """
-    Filters items from the first list that are also present in the second list and compares their versions.
+    Filters rows of the first table that are also present in the second table and compares their versions.
 
     Args:
-        data_list1 (list): The first list of dictionaries representing packages.
-        data_list2 (list): The second list of dictionaries representing packages.
+        table1 (PackageTable): The first package table.
+        table2 (PackageTable): The second package table, sharing the string pool with the first one.
 
     Returns:
-        list: A list of packages that are in both lists and meet the version comparison criteria.
+        list: The numbers of the rows of the first table that are in both tables and meet the version
+              comparison criteria.
 
     Examples:
-        be_into_to_lists(list1, list2)
-        [{'name': 'pkg1', 'arch': 'x86_64', 'version': '2.0'}]
-    """
-    package_set = generate_package_set(data_list2)
-    data = [
-        d
-        for d in data_list1
-        if (d["name"], d["arch"]) in package_set
-           and d["epoch"] >= package_set[(d["name"], d["arch"])]["epoch"]
-           and compare_versions_release(d["version"], package_set[(d["name"], d["arch"])]["version"])
-           and compare_versions_release(d["release"], package_set[(d["name"], d["arch"])]["release"], release=True)
-    ]
+        be_into_to_lists(table1, table2)
+        [3, 8]
+    """
+    package_set = generate_package_set(table2)
+    data = []
+    for index, key in enumerate(table1.keys()):
+        other = package_set.get(key)
+        if other is not None and is_newer_package(table1, index, table2, other):
+            data.append(index)
     return data
 
 
-def multiprocess_variant(processes_count: int, first_package: list, second_package: list) -> list:
+def split_shards(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    shard_count: int,
+) -> list:
+    """
+    Splits the rows of two tables into independent shards for a parallel comparison.
+
+    Rows are split by architecture, so every shard holds all rows of its (name, arch) keys from both tables.
+    Architectures with more rows than a fair share of a shard are further split by the package name.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
+        shard_count (int): The desired number of shards.
+
+    Returns:
+        list: (first_rows, second_rows) pairs of row number arrays, in increasing row order.
+
+    Examples:
+        split_shards(table1, table2, 8)
+        [(array('I', [0, 4, ...]), array('I', [1, 2, ...])), ...]
+    """
+    sizes = Counter(first_package.arch) + Counter(second_package.arch)
+    limit = max(1, (len(first_package) + len(second_package)) // max(1, shard_count))
+    parts = {arch: -(-size // limit) for arch, size in sizes.items()}
+    shards = {}
+    for side, table in enumerate((first_package, second_package)):
+        for index, (name, arch) in enumerate(zip(table.name, table.arch)):
+            shard = shards.get((arch, name % parts[arch]))
+            if shard is None:
+                shard = shards[(arch, name % parts[arch])] = (array("I"), array("I"))
+            shard[side].append(index)
+    return sorted(shards.values(), key=lambda shard: len(shard[0]) + len(shard[1]), reverse=True)
+
+
+_shared_shards = None
+
+
+def init_shard_worker(name: str, layout: dict, bounds: list) -> None:
+    """
+    Initializes a worker process of `multiprocess_variant`: attaches it to the shared block of the shards.
+
+    Args:
+        name (str): The name of the shared memory block, see `SharedShards.worker_args`.
+        layout (dict): The layout of the block.
+        bounds (list): The row ranges of the shards.
+    """
+    global _shared_shards
+    _shared_shards = SharedShards.attach(name, layout, bounds)
+
+
+def diff_shard(number: int) -> list:
+    """
+    Compares one shard in a worker process.
+
+    Args:
+        number (int): The shard number, its columns are read from the shared block without copying.
+
+    Returns:
+        list: The results of `merge_variant` for the shard, as arrays of row numbers of the original tables.
+    """
+    first_rows, first_package, second_rows, second_package = _shared_shards.shard(number)
+    unique_first, unique_second, newer_second = merge_variant(first_package, second_package)
+    return [
+        array("I", map(first_rows.__getitem__, unique_first)),
+        array("I", map(second_rows.__getitem__, unique_second)),
+        array("I", map(second_rows.__getitem__, newer_second)),
+    ]
+
+
+def multiprocess_variant(processes_count: int, first_package: PackageTable, second_package: PackageTable) -> list:
     """
-    Executes comparison functions in parallel using multiple processes.
+    Executes the comparison in parallel, on shards of the data processed by a pool of processes.
+
+    Both tables are split into shards by architecture (see `split_shards`), several shards per process
+    so that the load stays balanced. The compared columns and the string pool are written once into a shared
+    memory block, shard after shard (see `core.shared.SharedShards`); the workers attach to it when they start,
+    every task is just a shard number and every result is a compact array of row numbers. The results of the
+    shards are merged back in row order, so they are the same as the results of `sync_variant`.
 
     Args:
         processes_count (int): The number of processes to use.
-        first_package (list): The first list of packages.
-        second_package (list): The second list of packages.
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
 
     Returns:
         list: A list of results from the parallel execution of comparison functions.
 
     Examples:
-        multiprocess_variant(4, list1, list2)
+        multiprocess_variant(4, table1, table2)
         [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
     """
-    with Pool(processes=processes_count) as pool:
-        results = pool.starmap(
-            worker,
-            [
-                (
-                    search_unic_packages,
-                    first_package,
-                    second_package,
-                    key_func_name,
-                ),
-                (
-                    search_unic_packages,
-                    second_package,
-                    first_package,
-                    key_func_name,
-                ),
-                (be_into_to_lists, second_package, first_package),
-            ],
-        )
-    return results
+    shards = split_shards(first_package, second_package, processes_count * SHARDS_PER_PROCESS)
+    with SharedShards.create(first_package, second_package, shards) as shared:
+        del shards
+        with Pool(processes=processes_count, initializer=init_shard_worker, initargs=shared.worker_args()) as pool:
+            shard_results = pool.map(diff_shard, range(len(shared.bounds)))
+    return [list(merge(*(result[category] for result in shard_results))) for category in range(3)]
 
 
-def sync_variant(first_package: list, second_package: list) -> list:
+def sync_variant(first_package: PackageTable, second_package: PackageTable) -> list:
     """
     Executes comparison functions sequentially (synchronously).
 
     Args:
-        first_package (list): The first list of packages.
-        second_package (list): The second list of packages.
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
 
     Returns:
         list: A list of results from the synchronous execution of comparison functions.
 
     Examples:
-        sync_variant(list1, list2)
+        sync_variant(table1, table2)
         [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
     """
     results = [
-        search_unic_packages(first_package, second_package, lambda pkg: (pkg.name, pkg.arch)),
-        search_unic_packages(second_package, first_package, lambda pkg: (pkg.name, pkg.arch)),
+        search_unic_packages(first_package, second_package),
+        search_unic_packages(second_package, first_package),
         be_into_to_lists(second_package, first_package),
     ]
     return results
 
 
-def get_sorted_data(first_package: list, second_package: list) -> json:
+def merge_variant(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    first_index: TableIndex | None = None,
+    second_index: TableIndex | None = None,
+    rollup: SourceRollup | None = None,
+) -> list:
+    """
+    Produces all three comparison results in a single join of the two tables.
+
+    Each table is indexed by the (name, arch) key once. In a single pass over the second table each of its rows
+    is joined with the first row of the first table that has the same key, which gives both the packages
+    that exist only in the second table and the ones that are newer there. Duplicate keys are handled like in
+    `search_unic_packages` and `be_into_to_lists`: every duplicate row is reported, and rows of the second
+    table are compared with the first occurrence of the key in the first table.
+
+    If both tables carry fingerprints (see `core.fingerprint`) and a large enough share of their rows lies in
+    partitions of names that are the same in both tables (`MIN_SKIPPED_SHARE`, or `MIN_SKIPPED_SHARE_INDEXED`
+    with prebuilt indexes), those rows are skipped: only the remaining rows are looked up in the prebuilt
+    indexes, or indexed and joined if there are no prebuilt indexes.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
+        first_index (TableIndex | None): A prebuilt index of the first table, e.g. shared between several pairs.
+            If it covers only some rows (`TableIndex.rows`), only those rows are compared.
+        second_index (TableIndex | None): A prebuilt index of the second table.
+        rollup (SourceRollup | None): If given, every reported row is also counted by its source package and
+            architecture while the tables are joined.
+
+    Returns:
+        list: The same results as `sync_variant`.
+
+    Examples:
+        merge_variant(table1, table2)
+        [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
+    """
+    indexed = first_index is not None or second_index is not None
+    if any(index is not None and index.rows is not None for index in (first_index, second_index)):
+        # The fingerprints describe whole tables, indexes of some rows are joined as they are.
+        changed = None
+    else:
+        # Prebuilt indexes already make the whole join cheap, so skipping pays off only for a larger share of rows.
+        changed = changed_rows(
+            first_package, second_package, MIN_SKIPPED_SHARE_INDEXED if indexed else MIN_SKIPPED_SHARE
+        )
+    if changed is not None and not indexed:
+        first_candidates, second_candidates = changed
+        first_index = TableIndex.build(first_package, first_candidates)
+        second_index = TableIndex.build(second_package, second_candidates)
+        first_keys, second_keys = first_index.keys, second_index.keys
+    else:
+        first_index = first_index or TableIndex.build(first_package)
+        second_index = second_index or TableIndex.build(second_package)
+        if changed is None:
+            first_candidates, second_candidates = (
+                range(len(index.keys)) if index.rows is None else index.rows for index in (first_index, second_index)
+            )
+            first_keys, second_keys = first_index.keys, second_index.keys
+        else:
+            # The prebuilt indexes cover every row, only the rows of the changed partitions are looked up.
+            first_candidates, second_candidates = changed
+            first_keys = map(first_index.keys.__getitem__, first_candidates)
+            second_keys = map(second_index.keys.__getitem__, second_candidates)
+    first_rows = first_index.first_rows
+    second_rows = second_index.first_rows
+    unique_second = []
+    newer_second = []
+    if rollup is None:
+        for index, key in zip(second_candidates, second_keys):
+            other = first_rows.get(key)
+            if other is None:
+                unique_second.append(index)
+            elif is_newer_package(second_package, index, first_package, other):
+                newer_second.append(index)
+        unique_first = [index for index, key in zip(first_candidates, first_keys) if key not in second_rows]
+        return [unique_first, unique_second, newer_second]
+
+    unique_first = []
+    first_counts, second_counts, newer_counts = rollup.counts
+    source, arch = first_package.source, first_package.arch
+    for index, key in zip(first_candidates, first_keys):
+        if key not in second_rows:
+            unique_first.append(index)
+            first_counts[source[index] << 32 | arch[index]] += 1
+    source, arch = second_package.source, second_package.arch
+    for index, key in zip(second_candidates, second_keys):
+        other = first_rows.get(key)
+        if other is None:
+            unique_second.append(index)
+            second_counts[source[index] << 32 | arch[index]] += 1
+        elif is_newer_package(second_package, index, first_package, other):
+            newer_second.append(index)
+            newer_counts[source[index] << 32 | arch[index]] += 1
+    return [unique_first, unique_second, newer_second]
+
+
+def compare_tables(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    engine: str = "auto",
+    state_path: str | None = None,
+    plan: ExecutionPlan | None = None,
+    rollup: SourceRollup | None = None,
+    indexes: tuple | None = None,
+    package_filter: PackageFilter | None = None,
+) -> list:
+    """
+    Compares two package tables with the chosen engine, without any output.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table, sharing the string pool of the first one.
+        engine (str): The comparison engine, see `get_sorted_data`.
+        state_path (str | None): The state file of an incremental comparison, see `incremental_variant`.
+        plan (ExecutionPlan | None): A ready execution plan, by default it is made for "auto" when needed.
+        rollup (SourceRollup | None): Counts the resulting rows per source package. The single join fills it
+            while it classifies the rows, for the other engines the resulting rows are counted afterwards.
+        indexes (tuple | None): Prebuilt `TableIndex` objects of both tables, used by the single join.
+        package_filter (PackageFilter | None): The filter the tables were read with, kept in the incremental state.
+
+    Returns:
+        list: The row numbers of the three results, see `sync_variant`.
+
+    Examples:
+        compare_tables(table1, table2, "merge")
+        [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown comparison engine: {engine}. Available engines: {', '.join(ENGINES)}")
+    if engine == "auto" and state_path is None and plan is None:
+        plan = plan_execution(len(first_package) + len(second_package))
+    counted = False
+    if state_path is not None:
+        sorted_data = incremental_variant(first_package, second_package, state_path, package_filter)
+    elif engine == "multiprocess" or engine == "auto" and plan.engine == "multiprocess":
+        processes = plan.processes if plan is not None and plan.processes > 1 else cpu_count()
+        sorted_data = multiprocess_variant(processes, first_package, second_package)
+    elif engine == "sync":
+        sorted_data = sync_variant(first_package, second_package)
+    elif engine == "numpy":
+        sorted_data = numpy_variant(first_package, second_package)
+    elif engine == "external":
+        sorted_data = external_variant(first_package, second_package)
+    else:
+        sorted_data = merge_variant(first_package, second_package, *(indexes or (None, None)), rollup=rollup)
+        counted = True
+    if rollup is not None and not counted:
+        for category, table in enumerate((first_package, second_package, second_package)):
+            rollup.add_rows(category, table, sorted_data[category])
+    return sorted_data
+
+
+def get_sorted_data(
+    first_package: Iterable,
+    second_package: Iterable,
+    engine: str = "auto",
+    state_path: str | None = None,
+    plan: ExecutionPlan | None = None,
+    lazy: bool = False,
+    by_source: bool = False,
+) -> json:
     """
     Determines whether to use parallel or sequential processing based on data size and system resources,
     then processes package data and returns the result.
 
+    The number of found packages is printed to stdout. To embed the comparison without any output and build
+    the response only when it is needed, use `core.api.compare_branches`.
+
     Args:
-        first_package (list): The first list of packages.
-        second_package (list): The second list of packages.
+        first_package (Iterable): The packages of the first branch, see `build_tables`.
+        second_package (Iterable): The packages of the second branch.
+        engine (str): The comparison engine, one of `ENGINES`. "auto" follows the execution plan: several processes
+            if the planner expects them to be faster on this machine (see `plan_execution`), a single join otherwise.
+            "numpy" compares the tables with array operations (see `numpy_variant`), it requires NumPy.
+            "external" sorts and joins the tables on disk (see `core.external.external_join`).
+        state_path (str | None): If given, the comparison is incremental: only the packages that changed since
+            the run that saved this state file are compared again, see `incremental_variant`.
+        plan (ExecutionPlan | None): A ready execution plan, by default it is made for "auto" when needed.
+        lazy (bool): Return the package lists as iterators that decode the packages only when they are consumed,
+            e.g. by `core.writer.write_response`. They can be consumed only once.
+        by_source (bool): Return the results grouped by source package, with the number of packages of every
+            architecture in each category, instead of the package lists, see `SourceRollup`. The single join
+            counts the rows while it classifies them, the other engines count their resulting rows.
 
     Returns:
         json: A JSON-formatted response containing the results of the comparison.
@@ -148,11 +440,9 @@ def get_sorted_data(first_package: list, second_package: list) -> json:
             }
         }
     """
-    execution_options = check_difficult(first_package, second_package)
-    if execution_options[0]:
-        sorted_data = multiprocess_variant(execution_options[1], first_package, second_package)
-    else:
-        sorted_data = sync_variant(first_package, second_package)
+    first_package, second_package = build_tables(first_package, second_package)
+    rollup = SourceRollup(first_package.pool) if by_source else None
+    sorted_data = compare_tables(first_package, second_package, engine, state_path, plan, rollup)
 
     sys.stdout.write(
         f"\tNumber of packets found for the first branch: "
@@ -162,4 +452,162 @@ def get_sorted_data(first_package: list, second_package: list) -> json:
         f"\tAll packages whose version-release is larger in the second branch: "
         f"{colorize_text('red', str(len(sorted_data[2])))}\n"
     )
-    return create_response(sorted_data)
+    if rollup is not None:
+        sources = rollup.to_dict()
+        sys.stdout.write(f"\tNumber of source packages: {colorize_text('red', str(len(sources)))}\n")
+        return create_source_response(sources)
+    records = PackageTable.iter_records if lazy else PackageTable.records
+    return create_response(
+        [
+            records(first_package, sorted_data[0]),
+            records(second_package, sorted_data[1]),
+            records(second_package, sorted_data[2]),
+        ]
+    )
+
+
+def compare_matrix(tables: tuple, indexes: list | None = None) -> dict:
+    """
+    Compares every pair of package tables.
+
+    Every table is indexed once and the index is shared by all pairs it takes part in. Pairs are ordered
+    as the tables are given: in the pair (i, j) with i < j newer versions are searched in the table j.
+
+    Args:
+        tables (tuple): Package tables sharing a string pool, see `build_tables`.
+        indexes (list | None): Prebuilt `TableIndex` objects of the tables.
+
+    Returns:
+        dict: Maps every (i, j) pair of table positions to the results of `merge_variant`.
+
+    Examples:
+        compare_matrix((p10, p11, sisyphus))
+        {(0, 1): [[...], [...], [...]], (0, 2): [...], (1, 2): [...]}
+    """
+    indexes = indexes or [TableIndex.build(table) for table in tables]
+    return {
+        (first, second): merge_variant(tables[first], tables[second], indexes[first], indexes[second])
+        for first, second in combinations(range(len(tables)), 2)
+    }
+
+
+def newest_branches(tables: tuple, indexes: list | None = None) -> list:
+    """
+    Finds, for every (name, arch) key, the table with the newest version of the package.
+
+    Tables are checked in the given order, a later table wins if its package is newer than the current
+    winner by the same rule as in `be_into_to_lists`, so the earliest table wins ties.
+
+    Args:
+        tables (tuple): Package tables sharing a string pool, see `build_tables`.
+        indexes (list | None): Prebuilt `TableIndex` objects of the tables.
+
+    Returns:
+        list: (newest, rows) tuples in the order the keys first appear, where `newest` is the position of the
+              winning table and `rows` holds the first row of the key in every table (None if it has no such row).
+
+    Examples:
+        newest_branches((p10, sisyphus))
+        [(1, (0, 3)), (0, (1, None)), ...]
+    """
+    indexes = indexes or [TableIndex.build(table) for table in tables]
+    all_keys = {}
+    for index in indexes:
+        all_keys.update(dict.fromkeys(index.first_rows))
+    result = []
+    for key in all_keys:
+        rows = tuple(index.first_rows.get(key) for index in indexes)
+        newest = None
+        for position, row in enumerate(rows):
+            if row is None:
+                continue
+            if newest is None or is_newer_package(tables[position], row, tables[newest], rows[newest]):
+                newest = position
+        result.append((newest, rows))
+    return result
+
+
+def get_branches_data(
+    branches: list,
+    packages: list,
+    newest: bool = False,
+    lazy: bool = False,
+    by_source: bool = False,
+    indexes: list | None = None,
+) -> json:
+    """
+    Compares several branches at once and returns the result.
+
+    Args:
+        branches (list): The branch names.
+        packages (list): The packages of every branch, in the same order, see `build_tables`.
+        newest (bool): Return a single table with the newest branch of every package instead of the
+            pairwise comparison of all branches.
+        lazy (bool): Return the package lists of the pairwise comparison as iterators, see `get_sorted_data`.
+        by_source (bool): Return the pairwise comparison grouped by source package, see `get_sorted_data`.
+        indexes (list | None): Prebuilt `TableIndex` objects of the tables, e.g. from `core.pipeline.fetch_indexed`.
+
+    Returns:
+        json: A JSON-formatted response, see `create_matrix_response` and `create_newest_response`.
+
+    Examples:
+        get_branches_data(["p10", "sisyphus"], [list1, list2])
+        {
+            'user': 'john_doe',
+            'time': '14:30:15 18-09-2024',
+            'result': {
+                'p10-sisyphus': {
+                    'first_package': [...], 'second_package': [...], 'newer_versions_first_package': [...]
+                }
+            }
+        }
+    """
+    tables = build_tables(*packages)
+    indexes = indexes or [TableIndex.build(table) for table in tables]
+
+    if newest:
+        rows = []
+        for position, positions in newest_branches(tables, indexes):
+            row = positions[position]
+            versions = {
+                branch: format_evr(table.epoch[other], table.pool.strings[table.version[other]],
+                                   table.pool.strings[table.release[other]])
+                for branch, table, other in zip(branches, tables, positions)
+                if other is not None
+            }
+            rows.append({
+                "name": tables[position].pool.strings[tables[position].name[row]],
+                "arch": tables[position].pool.strings[tables[position].arch[row]],
+                "newest_branch": branches[position],
+                "versions": versions,
+            })
+        sys.stdout.write(f"\tNumber of packages compared: {colorize_text('red', str(len(rows)))}\n")
+        return create_newest_response(rows)
+
+    if by_source:
+        sources = {}
+        for first, second in combinations(range(len(tables)), 2):
+            rollup = SourceRollup(tables[first].pool)
+            merge_variant(tables[first], tables[second], indexes[first], indexes[second], rollup)
+            pair = sources[f"{branches[first]}-{branches[second]}"] = rollup.to_dict()
+            sys.stdout.write(
+                f"\t{colorize_text('green', branches[first])} - {colorize_text('green', branches[second])}: "
+                f"source packages {colorize_text('red', str(len(pair)))}\n"
+            )
+        return create_matrix_source_response(sources)
+
+    matrix = {}
+    for (first, second), sorted_data in compare_matrix(tables, indexes).items():
+        sys.stdout.write(
+            f"\t{colorize_text('green', branches[first])} - {colorize_text('green', branches[second])}: "
+            f"only in the first {colorize_text('red', str(len(sorted_data[0])))}, "
+            f"only in the second {colorize_text('red', str(len(sorted_data[1])))}, "
+            f"newer in the second {colorize_text('red', str(len(sorted_data[2])))}\n"
+        )
+        records = PackageTable.iter_records if lazy else PackageTable.records
+        matrix[f"{branches[first]}-{branches[second]}"] = [
+            records(tables[first], sorted_data[0]),
+            records(tables[second], sorted_data[1]),
+            records(tables[second], sorted_data[2]),
+        ]
+    return create_matrix_response(matrix)
@@ -0,0 +1,334 @@
+import heapq
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO
+
+from core.classes import PACKAGE_FIELDS, PackageTable, SourceRollup
+from core.utils import create_response, is_newer_version
+from core.writer import iter_response, write_response
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024**2
+BLOCK_ROWS = 4096
+SIZE_SAMPLE = 256
+CATEGORIES = SourceRollup.CATEGORIES
+
+
+def _item_size(item: tuple) -> int:
+    # The tuple, the objects it refers to and its slot in the buffer list.
+    return sys.getsizeof(item) + sum(map(sys.getsizeof, item)) + 8
+
+
+def _read_run(path: Path) -> Iterator[tuple]:
+    with open(path, "rb") as file:
+        while True:
+            try:
+                block = pickle.load(file)
+            except EOFError:
+                return
+            yield from block
+
+
+class ExternalSorter:
+    """
+    Sorts tuples with a bounded amount of memory.
+
+    Tuples are collected until their estimated size reaches the memory budget, then sorted and written to a run
+    file in pickled blocks of `BLOCK_ROWS` tuples. Iterating merges the runs with `heapq.merge`, holding one block
+    of every run; if the blocks of all runs do not fit into the budget, the runs are first merged in several passes.
+    Tuples are compared as a whole, so they should be unique, e.g. contain a row number.
+
+    Examples:
+        sorter = ExternalSorter("/tmp/sort", 64 * 1024**2)
+        sorter.extend([(3, "c"), (1, "a"), (2, "b")])
+        list(sorter)
+        [(1, 'a'), (2, 'b'), (3, 'c')]
+    """
+
+    def __init__(self, directory: str | Path, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.buffer = []
+        self.runs = []
+        self.rows = 0
+        self.item_size = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def add(self, item: tuple) -> None:
+        buffer = self.buffer
+        buffer.append(item)
+        self.rows += 1
+        if len(buffer) % SIZE_SAMPLE == 1:
+            self.item_size = max(self.item_size, _item_size(item))
+        if len(buffer) * self.item_size >= self.memory_budget:
+            self.spill()
+
+    def extend(self, items: Iterable[tuple]) -> None:
+        for item in items:
+            self.add(item)
+
+    def _write_run(self, items: Iterable[tuple]) -> Path:
+        descriptor, name = tempfile.mkstemp(prefix="run-", suffix=".pickle", dir=self.directory)
+        with os.fdopen(descriptor, "wb") as file:
+            items = iter(items)
+            while block := list(itertools.islice(items, BLOCK_ROWS)):
+                pickle.dump(block, file, pickle.HIGHEST_PROTOCOL)
+        return Path(name)
+
+    def spill(self) -> None:
+        """
+        Sorts the collected tuples and writes them to a new run file, freeing their memory.
+        """
+        if self.buffer:
+            self.buffer.sort()
+            self.runs.append(self._write_run(self.buffer))
+            self.buffer = []
+
+    def close(self) -> None:
+        """
+        Removes the run files.
+        """
+        for path in self.runs:
+            path.unlink(missing_ok=True)
+        self.runs = []
+        self.buffer = []
+
+    def __iter__(self) -> Iterator[tuple]:
+        if not self.runs:
+            self.buffer.sort()
+            return iter(self.buffer)
+        self.spill()
+        fan_in = max(2, self.memory_budget // (BLOCK_ROWS * max(self.item_size, 1)))
+        while len(self.runs) > fan_in:
+            merged, self.runs = self.runs[:fan_in], self.runs[fan_in:]
+            self.runs.append(self._write_run(heapq.merge(*map(_read_run, merged))))
+            for path in merged:
+                path.unlink()
+        return heapq.merge(*map(_read_run, self.runs))
+
+
+def _sort_rows(packages: Iterable[dict], directory: Path, memory_budget: int) -> ExternalSorter:
+    sorter = ExternalSorter(directory, memory_budget)
+    for row, package in enumerate(packages):
+        # The (name, arch) key and the row number come first, so the tuples sort by them.
+        sorter.add((
+            package["name"], package["arch"], row, package["epoch"], package["version"], package["release"],
+            package["disttag"], package["buildtime"], package["source"],
+        ))
+    sorter.spill()
+    return sorter
+
+
+def _result_row(row: tuple) -> tuple:
+    # The row number first, then the package fields in API order.
+    return row[2], row[0], row[3], row[4], row[5], row[1], row[6], row[7], row[8]
+
+
+class ExternalResult:
+    """
+    The result of `external_join`, kept on disk as sorted runs until it is read.
+
+    The packages of every category are read back in the order of the input rows, so the response is the same
+    as the one of the in-memory engines. The files are removed by `close` (or when the `with` block ends).
+
+    Attributes:
+        rows (tuple): The number of packages read from each branch.
+    """
+
+    def __init__(self, directory: tempfile.TemporaryDirectory, rows: tuple, sorters: list):
+        self._directory = directory
+        self.rows = rows
+        self._sorters = sorters
+
+    def __enter__(self) -> "ExternalResult":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Removes the temporary files of the result.
+        """
+        self._directory.cleanup()
+
+    def _sorter(self, category: str) -> ExternalSorter:
+        if category not in CATEGORIES:
+            raise ValueError(f"Unknown result category: {category}. Available categories: {', '.join(CATEGORIES)}")
+        return self._sorters[CATEGORIES.index(category)]
+
+    def counts(self) -> dict:
+        """
+        Counts the packages of every category.
+
+        Returns:
+            dict: Maps every category to its number of packages.
+        """
+        return {category: len(sorter) for category, sorter in zip(CATEGORIES, self._sorters)}
+
+    def iter_rows(self, category: str) -> Iterator[int]:
+        """
+        Iterates over the row numbers of the packages of a category in the input of their branch.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+
+        Returns:
+            Iterator[int]: The row numbers in ascending order.
+        """
+        return map(itemgetter(0), self._sorter(category))
+
+    def iter_packages(self, category: str) -> Iterator[dict]:
+        """
+        Iterates over the packages of a category, reading them from disk.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+
+        Returns:
+            Iterator[dict]: Package dictionaries in the order of the input rows.
+        """
+        return (dict(zip(PACKAGE_FIELDS, row[1:])) for row in self._sorter(category))
+
+    def to_response(self) -> dict:
+        """
+        Builds the response document of `core.utils.create_response`.
+
+        Returns:
+            dict: The response, its package lists are iterators over the files of the result.
+        """
+        return create_response([self.iter_packages(category) for category in CATEGORIES])
+
+    def write(self, outputs: Iterable[TextIO], output_format: str = "json") -> int:
+        """
+        Serializes the response once and writes it to the outputs, see `core.writer.write_response`.
+
+        Args:
+            outputs (Iterable[TextIO]): The files to write to.
+            output_format (str): One of `core.writer.FORMATS`.
+
+        Returns:
+            int: The number of characters written to each output.
+        """
+        return write_response(self.to_response(), outputs, output_format)
+
+    def to_json(self, output_format: str = "json") -> str:
+        """
+        Serializes the response into a string.
+
+        Args:
+            output_format (str): One of `core.writer.FORMATS`.
+
+        Returns:
+            str: The JSON document.
+        """
+        return "".join(iter_response(self.to_response(), output_format))
+
+
+def external_join(
+    first_packages: Iterable[dict],
+    second_packages: Iterable[dict],
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    directory: str | Path | None = None,
+) -> ExternalResult:
+    """
+    Compares two branches of any size with a bounded amount of memory.
+
+    Every branch is read once and sorted by the (name, arch) key into runs on disk (see `ExternalSorter`). The
+    merged runs of both branches are then joined key by key: a key of only one branch puts its rows into the
+    first or the second category, for a common key every row of the second branch is compared with the first
+    row of the key in the first branch. The rows of the categories are sorted back into the input order on disk
+    as well. The budget is used by one branch at a time while the branches are sorted and is shared by the two
+    merges and the three categories during the join.
+
+    Args:
+        first_packages (Iterable[dict]): The packages of the first branch, read once, e.g. `iter_packages` over
+            the chunks of a cached export.
+        second_packages (Iterable[dict]): The packages of the second branch.
+        memory_budget (int): The approximate number of bytes the sorted rows may take in memory.
+        directory (str | Path | None): Where the temporary files are created, the system default if None.
+
+    Returns:
+        ExternalResult: The result, to be closed when it is no longer needed.
+
+    Examples:
+        with external_join(iter_packages(cache.read_chunks(p10)), iter_packages(cache.read_chunks(sisyphus)),
+                           memory_budget=64 * 1024**2) as result:
+            result.counts()
+        {'first_package': 1204, 'second_package': 8733, 'newer_versions_first_package': 15012}
+    """
+    temporary = tempfile.TemporaryDirectory(prefix="compare-packages-", dir=directory)
+    try:
+        path = Path(temporary.name)
+        first = _sort_rows(first_packages, path, memory_budget)
+        second = _sort_rows(second_packages, path, memory_budget)
+        first.memory_budget = second.memory_budget = memory_budget // 4
+        results = [ExternalSorter(path, memory_budget // 6) for _ in CATEGORIES]
+        unique_first, unique_second, newer_second = results
+
+        key = itemgetter(0, 1)
+        first_groups = itertools.groupby(first, key)
+        second_groups = itertools.groupby(second, key)
+        first_group = next(first_groups, None)
+        second_group = next(second_groups, None)
+        while first_group is not None or second_group is not None:
+            if second_group is None or first_group is not None and first_group[0] < second_group[0]:
+                unique_first.extend(map(_result_row, first_group[1]))
+                first_group = next(first_groups, None)
+            elif first_group is None or second_group[0] < first_group[0]:
+                unique_second.extend(map(_result_row, second_group[1]))
+                second_group = next(second_groups, None)
+            else:
+                # Within a key the rows are sorted by their number, so this is the first row of the key.
+                oldest = next(first_group[1])
+                for row in second_group[1]:
+                    if is_newer_version(row[3], row[4], row[5], oldest[3], oldest[4], oldest[5]):
+                        newer_second.add(_result_row(row))
+                first_group = next(first_groups, None)
+                second_group = next(second_groups, None)
+        first.close()
+        second.close()
+    except BaseException:
+        temporary.cleanup()
+        raise
+    return ExternalResult(temporary, (len(first), len(second)), results)
+
+
+def external_variant(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    directory: str | Path | None = None,
+) -> list:
+    """
+    Produces the comparison results of two tables with `external_join`.
+
+    The tables are already in memory, so this is mostly useful to check the out-of-core engine against the other
+    ones; `external_join` over streamed packages keeps the memory bounded.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
+        memory_budget (int): See `external_join`.
+        directory (str | Path | None): See `external_join`.
+
+    Returns:
+        list: The same results as `sync_variant`.
+
+    Examples:
+        external_variant(table1, table2, memory_budget=16 * 1024**2)
+        [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
+    """
+    with external_join(
+        first_package.iter_records(range(len(first_package))),
+        second_package.iter_records(range(len(second_package))),
+        memory_budget,
+        directory,
+    ) as result:
+        return [list(result.iter_rows(category)) for category in CATEGORIES]
@@ -0,0 +1,201 @@
+import dataclasses
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from itertools import repeat
+from operator import lshift, or_
+from typing import Iterable
+
+from core.classes import PackageTable
+
+FINGERPRINT_BUCKETS = 4096
+MIN_SKIPPED_SHARE = 0.5
+MIN_SKIPPED_SHARE_INDEXED = 0.75
+DIGEST_SIZE = 16
+DIGEST_MASK = (1 << 8 * DIGEST_SIZE) - 1
+
+
+def _hash(text: str, digest_size: int) -> int:
+    return int.from_bytes(blake2b(text.encode("utf-8", "surrogatepass"), digest_size=digest_size).digest(), "little")
+
+
+def name_bucket(name: str, buckets: int = FINGERPRINT_BUCKETS) -> int:
+    """
+    Returns the bucket of a package name, the same in every process and on every run.
+
+    Args:
+        name (str): The package name.
+        buckets (int): The number of buckets per architecture.
+
+    Returns:
+        int: The bucket number.
+    """
+    return _hash(name, 8) % buckets
+
+
+@dataclasses.dataclass()
+class TableFingerprint:
+    """
+    Order-independent fingerprints of the packages of a table, per architecture and per bucket of package names.
+
+    Every (name, epoch, version, release) tuple is hashed with blake2b and the hashes of the rows of a partition
+    (an architecture and a bucket of names within it) are added up, so the fingerprint does not depend on the
+    order of the rows. Two partitions with the same fingerprint and number of rows hold the same packages, and if
+    neither has a duplicate (name, arch) key, none of their rows can show up in the result of a comparison.
+
+    Attributes:
+        buckets (int): The number of buckets per architecture.
+        row_buckets (array): The bucket of every row of the table.
+        partitions (dict): Maps every (arch, bucket) partition to its (digest, rows, duplicates) tuple: the sum of
+            the row hashes, the number of rows and whether a (name, arch) key occurs more than once.
+        _groups (tuple | None): The rows grouped by partition, built on the first call of `partition_rows`.
+        _clean (frozenset | None): The partitions without duplicate keys with their fingerprints, built on the
+            first call of `unchanged`.
+
+    Examples:
+        fingerprint = TableFingerprint.build(table)
+        fingerprint.arch_digests()["noarch"]
+        '5c1e0f9a...'
+    """
+
+    buckets: int
+    row_buckets: array
+    partitions: dict
+    _groups: tuple | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
+    _clean: frozenset | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def build(cls, table: PackageTable, buckets: int = FINGERPRINT_BUCKETS) -> "TableFingerprint":
+        """
+        Computes the fingerprints of a table.
+
+        Args:
+            table (PackageTable): The table.
+            buckets (int): The number of buckets per architecture.
+
+        Returns:
+            TableFingerprint: The fingerprints, with the architectures as strings so that they can be compared
+                              with the ones of a table of another string pool.
+        """
+        strings = table.pool.strings
+        name_buckets = {name: name_bucket(strings[name], buckets) for name in set(table.name)}
+        row_buckets = array("H", map(name_buckets.__getitem__, table.name))
+        # A partition is packed into one integer while counting: the arch code and the bucket.
+        row_partitions = [arch << 16 | bucket for arch, bucket in zip(table.arch, row_buckets)]
+        digests = dict.fromkeys(row_partitions, 0)
+        for partition, name, epoch, version, release in zip(
+            row_partitions, table.name, table.epoch, table.version, table.release
+        ):
+            text = f"{strings[name]}\0{epoch}\0{strings[version]}\0{strings[release]}"
+            digests[partition] += _hash(text, DIGEST_SIZE)
+        rows = Counter(row_partitions)
+        duplicates = {
+            (key & 0xFFFFFFFF) << 16 | name_buckets[key >> 32]
+            for key, count in Counter(table.keys()).items()
+            if count > 1
+        }
+        partitions = {
+            (strings[partition >> 16], partition & 0xFFFF): (
+                digest & DIGEST_MASK, rows[partition], partition in duplicates
+            )
+            for partition, digest in digests.items()
+        }
+        return cls(buckets, row_buckets, partitions)
+
+    def arch_digests(self) -> dict:
+        """
+        Combines the fingerprints of the buckets into one fingerprint per architecture.
+
+        Returns:
+            dict: Maps every architecture (in alphabetical order) to the hex digest of its packages.
+        """
+        digests = Counter()
+        for (arch, _), (digest, _, _) in self.partitions.items():
+            digests[arch] += digest
+        return {arch: f"{digests[arch] & DIGEST_MASK:032x}" for arch in sorted(digests)}
+
+    def partition_rows(self, table: PackageTable, partitions: Iterable[tuple]) -> array:
+        """
+        Collects the rows of some partitions of the table the fingerprints belong to.
+
+        The rows are grouped by partition once and the grouping is kept, so later calls take time in proportion
+        to the number of collected rows.
+
+        Args:
+            table (PackageTable): The table of the fingerprints.
+            partitions (Iterable[tuple]): The (arch, bucket) partitions.
+
+        Returns:
+            array: The row numbers in ascending order.
+        """
+        if self._groups is None:
+            strings = table.pool.strings
+            # Partitions are packed as in `build`, so the rows are grouped in C.
+            row_partitions = list(map(or_, map(lshift, table.arch, repeat(16)), self.row_buckets))
+            order = array("I", sorted(range(len(row_partitions)), key=row_partitions.__getitem__))
+            ranges = {}
+            start = 0
+            for partition, rows in sorted(Counter(row_partitions).items()):
+                ranges[(strings[partition >> 16], partition & 0xFFFF)] = (start, start + rows)
+                start += rows
+            self._groups = order, ranges
+        order, ranges = self._groups
+        rows = array("I")
+        for partition in partitions:
+            start, end = ranges[partition]
+            rows.extend(order[start:end])
+        return array("I", sorted(rows))
+
+    def unchanged(self, other: "TableFingerprint") -> set:
+        """
+        Finds the partitions that can be skipped when this table is compared with another one.
+
+        Args:
+            other (TableFingerprint): The fingerprints of the other table.
+
+        Returns:
+            set: The (arch, bucket) partitions with the same fingerprint in both tables and no duplicate keys.
+        """
+        if self.buckets != other.buckets:
+            return set()
+        for fingerprints in (self, other):
+            if fingerprints._clean is None:
+                fingerprints._clean = frozenset(
+                    item for item in fingerprints.partitions.items() if not item[1][2]
+                )
+        # The sets keep the hashes of their items, so the intersection does not hash the partitions again.
+        return {partition for partition, _ in self._clean & other._clean}
+
+
+def changed_rows(
+    first_package: PackageTable, second_package: PackageTable, min_skipped: float = MIN_SKIPPED_SHARE
+) -> tuple | None:
+    """
+    Selects the rows of two tables that have to be compared, skipping the partitions with equal fingerprints.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table, sharing the string pool of the first one.
+        min_skipped (float): The smallest share of the rows of both tables that has to be skipped, selecting
+            the rows costs more than it saves below it.
+
+    Returns:
+        tuple | None: Arrays with the numbers of the remaining rows of both tables, or None if the tables have no
+                      fingerprints or too few rows can be skipped.
+
+    Examples:
+        changed_rows(p11, sisyphus)
+        (array('I', [17, 18, 203, ...]), array('I', [16, 17, 210, ...]))
+    """
+    first, second = first_package.fingerprint, second_package.fingerprint
+    if first is None or second is None:
+        return None
+    unchanged = first.unchanged(second)
+    # An unchanged partition has the same number of rows in both tables.
+    skipped = 2 * sum(first.partitions[partition][1] for partition in unchanged)
+    if not unchanged or skipped < min_skipped * (len(first_package) + len(second_package)):
+        return None
+    return tuple(
+        table.fingerprint.partition_rows(table, table.fingerprint.partitions.keys() - unchanged)
+        for table in (first_package, second_package)
+    )
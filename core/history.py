@@ -0,0 +1,395 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+from core.cache import CacheEntry
+from core.classes import SourceRollup
+from core.parse_data import PackageFilter
+from core.utils import get_current_user, get_time
+
+CATEGORIES = SourceRollup.CATEGORIES
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    branch1 TEXT NOT NULL,
+    branch2 TEXT NOT NULL,
+    started REAL NOT NULL,
+    user TEXT,
+    engine TEXT,
+    filter TEXT,
+    first_rows INTEGER,
+    second_rows INTEGER,
+    first_package INTEGER NOT NULL,
+    second_package INTEGER NOT NULL,
+    newer_versions_first_package INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_pair ON runs (branch1, branch2, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE TABLE IF NOT EXISTS snapshots (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    branch TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL,
+    size INTEGER,
+    PRIMARY KEY (run_id, branch)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS packages (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    category INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    epoch INTEGER,
+    version TEXT,
+    release TEXT,
+    arch TEXT NOT NULL,
+    disttag TEXT,
+    buildtime INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS packages_key ON packages (name, arch, run_id);
+CREATE INDEX IF NOT EXISTS packages_source ON packages (source, run_id);
+CREATE INDEX IF NOT EXISTS packages_run ON packages (run_id, category);
+"""
+RUN_COLUMNS = ("id", "branch1", "branch2", "started", "user", "engine", "filter", "first_rows", "second_rows")
+PACKAGE_COLUMNS = ("name", "epoch", "version", "release", "arch", "disttag", "buildtime", "source")
+
+
+def _filter_text(package_filter: PackageFilter | None) -> str | None:
+    if not package_filter:
+        return None
+    return json.dumps({"arch": package_filter.arches, "name": package_filter.names, "source": package_filter.sources})
+
+
+class HistoryStore:
+    """
+    A SQLite database with the results of every recorded comparison, for historical and trend queries.
+
+    Every run gets a row in `runs` with its branch pair, time, engine, package filter and the counts of the three
+    result categories, a row in `snapshots` for every cached branch export it used (validators, download time
+    and size) and a row in `packages` for every package of its result. The packages are indexed by (name, arch),
+    by source package and by run, the runs by branch pair and time, so a query about one package or one source
+    reads only its own rows. A run is inserted in one transaction with `executemany`.
+
+    Every run adds all packages of its result, so the database grows with every recorded run until the older runs
+    are removed with `prune`. SQLite reuses the pages of removed runs, the file itself shrinks only after VACUUM.
+
+    Examples:
+        with HistoryStore("history.sqlite") as history:
+            history.newer_since("python3", "p10", "sisyphus")
+        {'x86_64': {'since': '14:30:15 18-09-2024', 'runs': 12, 'version': '3.12.1', 'release': 'alt1'}}
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise Exception(f"Unsupported history database version {version} in {self.path}")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the database.
+        """
+        self.connection.close()
+
+    def record(
+        self,
+        branches: tuple,
+        comparison,
+        rows: tuple = (None, None),
+        snapshots: Iterable[CacheEntry | None] = (),
+        engine: str | None = None,
+        package_filter: PackageFilter | None = None,
+    ) -> int:
+        """
+        Stores the result of a comparison as a new run.
+
+        Args:
+            branches (tuple): The first and the second branch.
+            comparison: The result, a `core.api.ComparisonResult` or a `core.external.ExternalResult`: anything
+                with `counts()` and `iter_packages(category)`.
+            rows (tuple): The number of packages compared in each branch.
+            snapshots (Iterable[CacheEntry | None]): The cached exports the branches were read from, if any.
+            engine (str | None): The comparison engine.
+            package_filter (PackageFilter | None): The filter the branches were read with. Filtered runs do not
+                take part in `newer_since`, as they may miss the package.
+
+        Returns:
+            int: The id of the run.
+        """
+        counts = comparison.counts()
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (branch1, branch2, started, user, engine, filter, first_rows, second_rows, "
+                "first_package, second_package, newer_versions_first_package) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *branches, time.time(), get_current_user(), engine, _filter_text(package_filter), *rows,
+                    *(counts[category] for category in CATEGORIES),
+                ),
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, entry.branch, entry.etag, entry.last_modified, entry.fetched_at, entry.size)
+                    for entry in snapshots
+                    if entry is not None
+                ),
+            )
+            for position, category in enumerate(CATEGORIES):
+                self.connection.executemany(
+                    "INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (run_id, position, *(package[column] for column in PACKAGE_COLUMNS))
+                        for package in comparison.iter_packages(category)
+                    ),
+                )
+        return run_id
+
+    def prune(self, branch1: str, branch2: str, keep: int) -> int:
+        """
+        Removes the runs of a branch pair except the latest ones, with their snapshots and packages.
+
+        Args:
+            branch1 (str): The first branch.
+            branch2 (str): The second branch.
+            keep (int): How many latest runs of the pair are kept.
+
+        Returns:
+            int: The number of removed runs.
+
+        Raises:
+            ValueError: If `keep` is negative.
+        """
+        if keep < 0:
+            raise ValueError("keep must not be negative")
+        with self.connection:
+            return self.connection.execute(
+                "DELETE FROM runs WHERE branch1 = ? AND branch2 = ? AND id NOT IN ("
+                "SELECT id FROM runs WHERE branch1 = ? AND branch2 = ? ORDER BY started DESC, id DESC LIMIT ?)",
+                (branch1, branch2, branch1, branch2, keep),
+            ).rowcount
+
+    def _pair_runs(self, branch1: str | None, branch2: str | None, unfiltered: bool = False) -> tuple:
+        conditions, parameters = [], []
+        for column, value in (("branch1", branch1), ("branch2", branch2)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if unfiltered:
+            conditions.append("filter IS NULL")
+        return " AND ".join(conditions) or "1", parameters
+
+    @staticmethod
+    def _run(row: sqlite3.Row) -> dict:
+        run = {column: row[column] for column in RUN_COLUMNS}
+        run["started"] = get_time(row["started"])
+        run["filter"] = json.loads(row["filter"]) if row["filter"] else None
+        return run
+
+    def runs(self, branch1: str | None = None, branch2: str | None = None, limit: int | None = 20) -> list:
+        """
+        Lists the recorded runs with their counts and snapshots, the latest first.
+
+        Args:
+            branch1 (str | None): Only the runs with this first branch.
+            branch2 (str | None): Only the runs with this second branch.
+            limit (int | None): The maximum number of runs, all of them if None.
+
+        Returns:
+            list: A dictionary for every run.
+        """
+        where, parameters = self._pair_runs(branch1, branch2)
+        rows = self.connection.execute(
+            f"SELECT * FROM runs WHERE {where} ORDER BY started DESC, id DESC LIMIT ?", (*parameters, limit or -1)
+        ).fetchall()
+        snapshots = {}
+        if rows:
+            for snapshot in self.connection.execute(
+                f"SELECT * FROM snapshots WHERE run_id IN ({', '.join('?' * len(rows))})", [row["id"] for row in rows]
+            ):
+                snapshots.setdefault(snapshot["run_id"], []).append({
+                    "branch": snapshot["branch"],
+                    "etag": snapshot["etag"],
+                    "last_modified": snapshot["last_modified"],
+                    "fetched_at": get_time(snapshot["fetched_at"]),
+                    "size": snapshot["size"],
+                })
+        return [
+            {
+                **self._run(row),
+                "counts": {category: row[category] for category in CATEGORIES},
+                "snapshots": snapshots.get(row["id"], []),
+            }
+            for row in rows
+        ]
+
+    def trend(self, branch1: str, branch2: str, limit: int | None = None) -> list:
+        """
+        Lists the counts of the result categories of a branch pair over time, the oldest run first.
+
+        Args:
+            branch1 (str): The first branch.
+            branch2 (str): The second branch.
+            limit (int | None): Only this many latest runs, all of them if None.
+
+        Returns:
+            list: A dictionary with the run id, time and the count of every category for every run.
+
+        Examples:
+            history.trend("p10", "sisyphus", limit=2)
+            [{'run': 41, 'started': '14:30:15 17-09-2024', 'first_package': 1204, ...},
+             {'run': 42, 'started': '14:30:15 18-09-2024', 'first_package': 1199, ...}]
+        """
+        rows = self.connection.execute(
+            f"SELECT id, started, {', '.join(CATEGORIES)} FROM runs WHERE branch1 = ? AND branch2 = ? "
+            "ORDER BY started DESC, id DESC LIMIT ?",
+            (branch1, branch2, limit or -1),
+        ).fetchall()
+        return [
+            {
+                "run": row["id"],
+                "started": get_time(row["started"]),
+                **{category: row[category] for category in CATEGORIES},
+            }
+            for row in reversed(rows)
+        ]
+
+    def package_history(
+        self, name: str, arch: str | None = None, branch1: str | None = None, branch2: str | None = None
+    ) -> list:
+        """
+        Lists every recorded result a package was part of, the oldest run first.
+
+        Args:
+            name (str): The package name.
+            arch (str | None): Only this architecture.
+            branch1 (str | None): Only the runs with this first branch.
+            branch2 (str | None): Only the runs with this second branch.
+
+        Returns:
+            list: A dictionary for every run and architecture with the result category and the package version.
+
+        Examples:
+            history.package_history("python3", "x86_64")
+            [{'run': 41, 'started': '14:30:15 17-09-2024', 'branch1': 'p10', 'branch2': 'sisyphus',
+              'arch': 'x86_64', 'category': 'newer_versions_first_package', 'epoch': 0, 'version': '3.12.1', ...}]
+        """
+        where, parameters = self._pair_runs(branch1, branch2)
+        rows = self.connection.execute(
+            "SELECT runs.id, runs.started, runs.branch1, runs.branch2, packages.* FROM packages "
+            f"JOIN runs ON runs.id = packages.run_id WHERE packages.name = ? AND {where}"
+            f"{' AND packages.arch = ?' if arch is not None else ''} ORDER BY runs.started, runs.id, packages.arch",
+            (name, *parameters, *([arch] if arch is not None else [])),
+        ).fetchall()
+        return [
+            {
+                "run": row["id"],
+                "started": get_time(row["started"]),
+                "branch1": row["branch1"],
+                "branch2": row["branch2"],
+                "arch": row["arch"],
+                "category": CATEGORIES[row["category"]],
+                **{column: row[column] for column in ("epoch", "version", "release", "buildtime", "source")},
+            }
+            for row in rows
+        ]
+
+    def newer_since(self, name: str, branch1: str, branch2: str, arch: str | None = None) -> dict:
+        """
+        Finds since when a package has been newer in the second branch, run after run up to the latest run.
+
+        Only the runs that compared the whole branches are taken into account, see `record`.
+
+        Args:
+            name (str): The package name.
+            branch1 (str): The first branch.
+            branch2 (str): The second branch.
+            arch (str | None): Only this architecture.
+
+        Returns:
+            dict: Maps every architecture on which the package is newer in the latest run to the time of the
+                  first run of the streak, the number of runs in it and the current version in the second branch.
+        """
+        where, parameters = self._pair_runs(branch1, branch2, unfiltered=True)
+        runs = [row[0] for row in self.connection.execute(
+            f"SELECT id FROM runs WHERE {where} ORDER BY started DESC, id DESC", parameters
+        )]
+        newer = {}
+        for row in self.connection.execute(
+            f"SELECT packages.run_id, packages.arch, packages.version, packages.release, runs.started FROM packages "
+            f"JOIN runs ON runs.id = packages.run_id WHERE packages.name = ? AND packages.category = ? AND {where}"
+            f"{' AND packages.arch = ?' if arch is not None else ''}",
+            (
+                name, CATEGORIES.index("newer_versions_first_package"), *parameters,
+                *([arch] if arch is not None else []),
+            ),
+        ):
+            newer.setdefault(row["arch"], {})[row["run_id"]] = row
+        result = {}
+        for package_arch, arch_runs in sorted(newer.items()):
+            streak = [arch_runs[run] for run in _prefix(runs, arch_runs)]
+            if streak:
+                result[package_arch] = {
+                    "since": get_time(streak[-1]["started"]),
+                    "runs": len(streak),
+                    "version": streak[0]["version"],
+                    "release": streak[0]["release"],
+                }
+        return result
+
+    def source_history(self, source: str, branch1: str | None = None, branch2: str | None = None) -> list:
+        """
+        Counts the packages of a source package in every result category of every run, the oldest run first.
+
+        Args:
+            source (str): The source package name.
+            branch1 (str | None): Only the runs with this first branch.
+            branch2 (str | None): Only the runs with this second branch.
+
+        Returns:
+            list: A dictionary with the run, its branches and the count of every category for every run the source
+                  package was part of.
+        """
+        where, parameters = self._pair_runs(branch1, branch2)
+        result = {}
+        for row in self.connection.execute(
+            "SELECT runs.id, runs.started, runs.branch1, runs.branch2, packages.category, COUNT(*) AS count "
+            f"FROM packages JOIN runs ON runs.id = packages.run_id WHERE packages.source = ? AND {where} "
+            "GROUP BY runs.id, packages.category ORDER BY runs.started, runs.id",
+            (source, *parameters),
+        ):
+            run = result.setdefault(row["id"], {
+                "run": row["id"],
+                "started": get_time(row["started"]),
+                "branch1": row["branch1"],
+                "branch2": row["branch2"],
+                **dict.fromkeys(CATEGORIES, 0),
+            })
+            run[CATEGORIES[row["category"]]] = row["count"]
+        return list(result.values())
+
+
+def _prefix(runs: list, present: dict) -> Iterable[int]:
+    # The runs, the latest first, up to the first one that does not contain the package.
+    for run in runs:
+        if run not in present:
+            return
+        yield run
@@ -0,0 +1,372 @@
+import dataclasses
+import json
+import os
+import struct
+from array import array
+from collections import Counter
+from pathlib import Path
+
+from core.classes import COLUMN_TYPES, PackageTable
+from core.parse_data import PackageFilter
+from core.utils import generate_package_set, is_newer_package
+
+MAGIC = b"PKGDIFF\x00"
+STATE_VERSION = 3
+HEADER = struct.Struct("<8sIIQQQQQQQQ")
+STATE_COLUMNS = ("name", "arch", "epoch", "version", "release")
+COMPARE_BLOCK_SIZE = 4096
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+@dataclasses.dataclass()
+class DiffState:
+    """
+    What an incremental comparison keeps for the next run of the same branch pair.
+
+    Only the columns that decide the result of a (name, arch) key are kept, with the strings they use, and the
+    result itself as row numbers of the compared tables.
+
+    Attributes:
+        filter (list | None): The package filter of the run, see `incremental_variant`.
+        codes (array): The string pool codes of the kept strings in the run that saved the state.
+        strings (list): The kept strings, in the order of `codes`.
+        first (dict): The `STATE_COLUMNS` of the first table, string columns hold the pool codes of that run.
+        second (dict): The `STATE_COLUMNS` of the second table.
+        results (list): The three row number arrays of the result, see `sync_variant`.
+    """
+
+    filter: list | None
+    codes: array
+    strings: list
+    first: dict
+    second: dict
+    results: list
+
+    @classmethod
+    def build(
+        cls, first_package: PackageTable, second_package: PackageTable, filter_key: list | None, results: list
+    ) -> "DiffState":
+        codes = set()
+        for table in (first_package, second_package):
+            for field in ("name", "arch", "version", "release"):
+                codes.update(getattr(table, field))
+        codes = array("I", sorted(codes))
+        strings = first_package.pool.strings
+        return cls(
+            filter_key,
+            codes,
+            list(map(strings.__getitem__, codes)),
+            {field: getattr(first_package, field) for field in STATE_COLUMNS},
+            {field: getattr(second_package, field) for field in STATE_COLUMNS},
+            [array("I", rows) for rows in results],
+        )
+
+
+def load_diff_state(path: str | Path) -> DiffState | None:
+    """
+    Loads the state saved by the previous incremental comparison.
+
+    The state file holds only numbers and strings (see `save_diff_state`), so reading it never executes
+    anything; a missing, damaged or older file is ignored.
+
+    Args:
+        path (str | Path): The path to the state file.
+
+    Returns:
+        DiffState | None: The saved state, or None if there is no usable state.
+    """
+    try:
+        data = memoryview(Path(path).read_bytes())
+        magic, version, _, filter_size, string_count, text_size, *sizes = HEADER.unpack_from(data)
+        if magic != MAGIC or version != STATE_VERSION:
+            return None
+        first_rows, second_rows, *result_sizes = sizes
+        position = HEADER.size
+
+        def read(typecode: str, count: int) -> array:
+            nonlocal position
+            values = array(typecode)
+            size = count * values.itemsize
+            if position + size > len(data):
+                raise ValueError("The state file is truncated")
+            values.frombytes(data[position: position + size])
+            position += size + _padding(size)
+            return values
+
+        filter_key = json.loads(bytes(read("B", filter_size)))
+        codes = read("I", string_count)
+        offsets = read("Q", string_count + 1)
+        text = read("B", text_size).tobytes().decode("utf-8", "surrogatepass")
+        strings = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+        columns = [
+            {field: read(COLUMN_TYPES[field], rows) for field in STATE_COLUMNS} for rows in (first_rows, second_rows)
+        ]
+        results = [read("I", size) for size in result_sizes]
+        for rows, limit in zip(results, (first_rows, second_rows, second_rows)):
+            if rows and max(rows) >= limit:
+                raise ValueError("The state file refers to rows it does not have")
+    except (OSError, struct.error, ValueError):
+        return None
+    return DiffState(filter_key, codes, strings, columns[0], columns[1], results)
+
+
+def save_diff_state(path: str | Path, state: DiffState) -> None:
+    """
+    Atomically saves the state of an incremental comparison.
+
+    The file consists of a header, the filter as JSON, the string table (pool codes, character offsets and the
+    UTF-8 text), the `STATE_COLUMNS` of both tables and the three result arrays, every section aligned to 8 bytes.
+
+    Args:
+        path (str | Path): The path to the state file.
+        state (DiffState): The state built by `incremental_variant`.
+    """
+    text = "".join(state.strings).encode("utf-8", "surrogatepass")
+    offsets = array("Q", [0])
+    for value in state.strings:
+        offsets.append(offsets[-1] + len(value))
+    sections = [json.dumps(state.filter).encode(), state.codes, offsets, text]
+    for columns in (state.first, state.second):
+        sections.extend(columns[field] for field in STATE_COLUMNS)
+    sections.extend(state.results)
+
+    temp_path = Path(f"{path}.{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(
+                MAGIC, STATE_VERSION, 0, len(sections[0]), len(state.codes), len(text),
+                len(state.first["name"]), len(state.second["name"]), *map(len, state.results),
+            ))
+            for section in sections:
+                data = section if isinstance(section, bytes) else section.tobytes()
+                file.write(data + bytes(_padding(len(data))))
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _filter_key(package_filter: PackageFilter | None) -> list | None:
+    if not package_filter:
+        return None
+    return [list(package_filter.arches), list(package_filter.names), list(package_filter.sources)]
+
+
+def _translation(state: DiffState, table: PackageTable) -> list | None:
+    # Maps the codes of the saved run to the codes of the current pool, None if they are the same.
+    codes = list(map(table.pool.codes.get, state.strings))
+    if codes == state.codes.tolist():
+        return None
+    translation = [0] * (state.codes[-1] + 1 if state.codes else 0)
+    for old, new in zip(state.codes, codes):
+        translation[old] = new
+    return translation
+
+
+def _previous_columns(columns: dict, translation: list | None) -> dict:
+    if translation is None:
+        return columns
+    # Strings the pool does not have any more become None, so the rows that use them never match.
+    missing = None in translation
+    decode = translation.__getitem__
+    columns = dict(columns)
+    for field in ("name", "arch", "version", "release"):
+        values = map(decode, columns[field])
+        columns[field] = list(values) if missing else array("I", values)
+    return columns
+
+
+def changed_rows(table: PackageTable, previous: dict) -> list | None:
+    """
+    Finds the rows whose epoch, version or release changed, if the table still has the same (name, arch) layout.
+
+    The columns are compared block by block in C and only the differing blocks are scanned.
+
+    Args:
+        table (PackageTable): The new package table.
+        previous (dict): The `STATE_COLUMNS` of the previous table, translated into the codes of the table's pool.
+
+    Returns:
+        list | None: The changed row numbers, or None if packages were added, removed or reordered.
+    """
+    if previous["name"] != table.name or previous["arch"] != table.arch:
+        return None
+    rows = set()
+    for field in ("epoch", "version", "release"):
+        old, new = previous[field], getattr(table, field)
+        for start in range(0, len(new), COMPARE_BLOCK_SIZE):
+            end = start + COMPARE_BLOCK_SIZE
+            if old[start:end] != new[start:end]:
+                rows.update(index for index in range(start, min(end, len(new))) if old[index] != new[index])
+    return sorted(rows)
+
+
+def changed_keys(table: PackageTable, previous: dict) -> set:
+    """
+    Finds the (name, arch) keys whose rows were added, removed or changed since the previous table.
+
+    Args:
+        table (PackageTable): The new package table.
+        previous (dict): The `STATE_COLUMNS` of the previous table, translated into the codes of the table's pool.
+
+    Returns:
+        set: Packed keys (see `PackageTable.keys`) of the table that have to be compared again.
+
+    Examples:
+        changed_keys(table, previous_columns)
+        {4294967299, 8589934596}
+    """
+    previous_rows = zip(*(previous[field] for field in STATE_COLUMNS))
+    rows = set(zip(*(getattr(table, field) for field in STATE_COLUMNS)))
+    return {
+        name << 32 | arch
+        for name, arch, *_ in rows.symmetric_difference(previous_rows)
+        if name is not None and arch is not None
+    }
+
+
+def _update_rows(
+    first_package: PackageTable, second_package: PackageTable, results: list, first_rows: list, second_rows: list
+) -> list:
+    # Both tables have the same keys in the same rows as before, so only the changed rows can move between the
+    # newer rows and the rest; the unique rows stay the same.
+    unique_first, unique_second, newer_second = (list(rows) for rows in results)
+    if not first_rows and not second_rows:
+        return [unique_first, unique_second, newer_second]
+    names, arches = first_package.name, first_package.arch
+    first_changed = {names[index] << 32 | arches[index] for index in first_rows}
+    second_keys = second_package.keys()
+    recheck = set(second_rows)
+    if first_changed:
+        recheck.update(index for index, key in enumerate(second_keys) if key in first_changed)
+    first_index = generate_package_set(first_package)
+    newer_second = [index for index in newer_second if index not in recheck]
+    for index in recheck:
+        other = first_index.get(second_keys[index])
+        if other is not None and is_newer_package(second_package, index, first_package, other):
+            newer_second.append(index)
+    newer_second.sort()
+    return [unique_first, unique_second, newer_second]
+
+
+def _update_keys(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    state: DiffState,
+    previous: tuple,
+    changed: set,
+) -> list:
+    # Compares the changed keys again and keeps the outcome of all other keys. Keys with duplicate rows are always
+    # compared again, because their result depends on the row order.
+    first_keys = first_package.keys()
+    second_keys = second_package.keys()
+    first_index = generate_package_set(first_package, first_keys)
+    second_index = generate_package_set(second_package, second_keys)
+    duplicate_rows = []
+    for keys, index in ((first_keys, first_index), (second_keys, second_index)):
+        rows = {}
+        if len(index) != len(keys):
+            for key, count in Counter(keys).items():
+                if count > 1:
+                    rows[key] = []
+            for row, key in enumerate(keys):
+                if key in rows:
+                    rows[key].append(row)
+        duplicate_rows.append(rows)
+    first_duplicates, second_duplicates = duplicate_rows
+
+    unique_first, unique_second, newer_second = [], [], []
+    changed.update(first_duplicates, second_duplicates)
+    # A key that did not change has one row in each table it is in, at the position of the index. It may have had
+    # several equal rows before, so the keys are collected into a set.
+    for rows, columns, index, result in (
+        (state.results[0], previous[0], first_index, unique_first),
+        (state.results[1], previous[1], second_index, unique_second),
+        (state.results[2], previous[1], second_index, newer_second),
+    ):
+        names, arches = columns["name"], columns["arch"]
+        keys = {names[row] << 32 | arches[row] for row in rows if names[row] is not None and arches[row] is not None}
+        result.extend(index[key] for key in keys - changed)
+
+    for key in changed:
+        first_row = first_index.get(key)
+        second_row = second_index.get(key)
+        if second_row is None:
+            if first_row is not None:
+                unique_first.extend(first_duplicates.get(key, (first_row,)))
+        elif first_row is None:
+            unique_second.extend(second_duplicates.get(key, (second_row,)))
+        else:
+            for index in second_duplicates.get(key, (second_row,)):
+                if is_newer_package(second_package, index, first_package, first_row):
+                    newer_second.append(index)
+    for result in (unique_first, unique_second, newer_second):
+        result.sort()
+    return [unique_first, unique_second, newer_second]
+
+
+def incremental_variant(
+    first_package: PackageTable,
+    second_package: PackageTable,
+    state_path: str | Path,
+    package_filter: PackageFilter | None = None,
+) -> list:
+    """
+    Compares two tables reusing the result of the previous run.
+
+    The state file (see `DiffState`) keeps the compared columns of both previous tables and their result. Whether
+    a row is in the result depends only on the rows with the same (name, arch) key, so only the keys whose rows
+    changed have to be classified again:
+
+    - If both tables have the same keys in the same rows as before (the same export, maybe with other versions),
+      the unique rows are the same and only the rows with another epoch, version or release are compared again
+      (see `changed_rows`).
+    - Otherwise the changed keys are found with a set difference of the old and new rows (see `changed_keys`)
+      and the previous result is moved to the new row numbers through the (name, arch) index of the tables.
+
+    Finding the changes takes a few linear passes in C, the work in Python is proportional to the size of the
+    result and the number of changes; with another layout both tables are also indexed, which costs about as much
+    as a full join. Without a state file the tables are compared with `merge_variant`. The state also keeps the
+    package filter of the run, a state saved with another filter is not used.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
+        state_path (str | Path): The file the state is loaded from and saved to afterwards.
+        package_filter (PackageFilter | None): The filter the tables were read with.
+
+    Returns:
+        list: The same results as `sync_variant`.
+
+    Examples:
+        incremental_variant(table1, table2, "/tmp/cache/p10-sisyphus.state")
+        [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
+    """
+    filter_key = _filter_key(package_filter)
+    state = load_diff_state(state_path)
+    if state is not None and state.filter != filter_key:
+        state = None
+    if state is None:
+        from core.data_extractor import merge_variant
+
+        results = merge_variant(first_package, second_package)
+    else:
+        translation = _translation(state, first_package)
+        previous = (_previous_columns(state.first, translation), _previous_columns(state.second, translation))
+        tables = (first_package, second_package)
+        rows = [changed_rows(table, columns) for table, columns in zip(tables, previous)]
+        if None not in rows:
+            results = _update_rows(first_package, second_package, state.results, *rows)
+        else:
+            # A table with the same layout differs from the previous one only in the changed rows.
+            changed = set()
+            for table, columns, table_rows in zip(tables, previous, rows):
+                if table_rows is None:
+                    changed |= changed_keys(table, columns)
+                else:
+                    changed.update(table.name[index] << 32 | table.arch[index] for index in table_rows)
+            results = _update_keys(first_package, second_package, state, previous, changed)
+    save_diff_state(state_path, DiffState.build(first_package, second_package, filter_key, results))
+    return results
@@ -1,42 +1,1086 @@
 import asyncio
+import codecs
+import dataclasses
+import fnmatch
+import itertools
+import json
+import random
+import re
+from array import array
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, Iterator
+from urllib.parse import quote
 
 import aiohttp
 
+from core.cache import CacheEntry, SnapshotCache
+from core.classes import PackageTable, StringPool
+from core.snapshot import MappedSnapshot
 
-async def get_packages_async(branch: str) -> list:
+API_URL = "https://rdb.altlinux.org/api"
+CHUNK_SIZE = 64 * 1024
+ACCEPT_ENCODING = "gzip, deflate"
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 300
+RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+CONNECTION_LIMIT = 8
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+_WS = r"[ \t\n\r]*"
+_WHITESPACE = re.compile(_WS)
+# A package record: a flat object whose values are strings, numbers or literals (possessive, so it fails fast
+# on an object that is cut off at the end of the buffer).
+_FLAT = r'\{(?:[^{}\[\]"]++|"(?:[^"\\]++|\\.)*+")*+\}'
+_FLAT_OBJECT = re.compile(_FLAT)
+
+
+def compile_patterns(patterns: Iterable[str]) -> re.Pattern | None:
+    """
+    Compiles name patterns into one regular expression.
+
+    A pattern is a shell-style glob matched against the whole value, or a regular expression searched in the
+    value if it starts with "re:".
+
+    Args:
+        patterns (Iterable[str]): The patterns.
+
+    Returns:
+        re.Pattern | None: An expression whose `match` accepts the values that match any pattern,
+            or None if there are no patterns.
+
+    Examples:
+        compile_patterns(["python3-*", "re:^lib.*-devel$"]).match("libxml2-devel") is not None
+        True
+    """
+    parts = [
+        f".*?(?:{pattern[3:]})" if pattern.startswith("re:") else fnmatch.translate(pattern)
+        for pattern in patterns
+    ]
+    return re.compile("|".join(f"(?:{part})" for part in parts)) if parts else None
+
+
+@dataclasses.dataclass()
+class PackageFilter:
+    """
+    Selects the packages of a branch while the export is decoded, so the other packages are never kept.
+
+    Attributes:
+        arches (tuple): Keep only these architectures, all of them if empty.
+        names (tuple): Keep only the package names matching any of these patterns, see `compile_patterns`.
+        sources (tuple): Keep only the packages built from source packages matching any of these patterns.
+
+    Examples:
+        package_filter = PackageFilter(arches=("x86_64", "noarch"), names=("python3-*",))
+        package_filter.matches({"name": "python3-module-six", "arch": "noarch", "source": "python-module-six"})
+        True
+    """
+
+    arches: tuple = ()
+    names: tuple = ()
+    sources: tuple = ()
+
+    def __post_init__(self):
+        self.arch_set = frozenset(self.arches)
+        self.name_pattern = compile_patterns(self.names)
+        self.source_pattern = compile_patterns(self.sources)
+        self.checks = [
+            (field, _field_pattern(field), accepts)
+            for field, accepts in (
+                ("arch", self.arch_set.__contains__ if self.arch_set else None),
+                ("name", self.name_pattern.match if self.name_pattern else None),
+                ("source", self.source_pattern.match if self.source_pattern else None),
+            )
+            if accepts is not None
+        ]
+        # The raw text is searched for the keys of possibly selected packages, preferring the most selective
+        # field whose patterns can be matched against raw JSON strings (regular expressions can not).
+        self.candidates = None
+        for field, patterns in (("name", self.names), ("source", self.sources)):
+            if patterns and not any(pattern.startswith("re:") for pattern in patterns):
+                self.candidates = _candidate_pattern(field, map(_raw_glob, patterns))
+                break
+        else:
+            if self.arches:
+                self.candidates = _candidate_pattern("arch", map(re.escape, self.arches))
+
+    def __bool__(self) -> bool:
+        return bool(self.checks)
+
+    def matches(self, package: dict) -> bool:
+        """
+        Checks a decoded package.
+
+        Args:
+            package (dict): The package dictionary.
+
+        Returns:
+            bool: True if the package is selected.
+        """
+        return all(accepts(package[field]) for field, _, accepts in self.checks)
+
+    def rejects_raw(self, text: str, start: int, end: int) -> bool:
+        """
+        Checks the raw JSON text of a package before it is decoded.
+
+        Only plain string values (without escapes) are looked at, so a package that is not rejected here
+        still has to be checked with `matches` after decoding.
+
+        Args:
+            text (str): The text holding the package object.
+            start (int): The position of the opening brace.
+            end (int): The position after the closing brace.
+
+        Returns:
+            bool: True if the package is certainly not selected.
+        """
+        for _, pattern, accepts in self.checks:
+            found = pattern.search(text, start, end)
+            if found is not None and not accepts(found.group(1)):
+                return True
+        return False
+
+    def select_rows(self, snapshot: MappedSnapshot) -> array:
+        """
+        Finds the selected rows of a binary snapshot without decoding its packages.
+
+        Every distinct string is checked once, then the rows are selected by their string codes.
+
+        Args:
+            snapshot (MappedSnapshot): The snapshot.
+
+        Returns:
+            array: The numbers of the selected rows.
+        """
+        columns = []
+        for field, _, accepts in self.checks:
+            allowed = bytes(map(bool, map(accepts, snapshot.strings)))
+            columns.append((allowed.__getitem__, snapshot.column(field)))
+        selected = [bytes(map(allowed, column)) for allowed, column in columns]
+        mask = selected[0] if len(selected) == 1 else bytes(map(min, *selected))
+        return array("I", itertools.compress(range(len(snapshot)), mask))
+
+
+def _field_pattern(field: str) -> re.Pattern:
+    return re.compile(rf'"{field}"{_WS}:{_WS}"([^"\\]*)"')
+
+
+def _raw_glob(pattern: str) -> str:
+    # A glob over the raw text of a JSON string; a character set is widened to any character.
+    parts = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        position += 1
+        if char == "*":
+            parts.append('[^"]*')
+        elif char == "?":
+            parts.append('[^"]')
+        elif char == "[":
+            end = position + (pattern[position: position + 1] == "!")
+            end = pattern.find("]", end + (pattern[end: end + 1] == "]"))
+            if end < 0:
+                parts.append(re.escape(char))
+            else:
+                parts.append('[^"]')
+                position = end + 1
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+def _candidate_pattern(field: str, values: Iterable[str]) -> re.Pattern:
+    # A value with escapes is always a candidate, it is checked after decoding.
+    return re.compile(rf'"{field}"{_WS}:{_WS}"(?:(?:{"|".join(values)})"|[^"]*\\)')
+
+
+class PackageStreamParser:
+    """
+    Incremental parser for the `/export/branch_binary_packages/{branch}` response body.
+
+    The body is fed in arbitrary byte chunks and package records are returned as soon as each
+    object of the "packages" array is complete, so the whole body never has to be held in memory.
+    All other top-level keys of the response are parsed and skipped.
+
+    With a `PackageFilter`, the raw text of every package object is checked before it is decoded, and only
+    the selected packages are decoded and returned.
+
+    Examples:
+        parser = PackageStreamParser()
+        parser.feed(b'{"length": 1, "packages": [{"name": "pkg1"')
+        []
+        parser.feed(b', "arch": "x86_64"}]}')
+        [{'name': 'pkg1', 'arch': 'x86_64'}]
+        parser.close()
+    """
+
+    def __init__(self, package_filter: PackageFilter | None = None):
+        self._filter = package_filter or None
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        Adds a chunk of the response body and returns the package records completed by it.
+
+        Args:
+            chunk (bytes): The next part of the response body.
+
+        Returns:
+            list: Package dictionaries that became complete with this chunk, in document order.
+        """
+        self._buffer = self._buffer[self._pos:] + self._text_decoder.decode(chunk)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> list:
+        """
+        Finishes parsing and checks that the whole document has been received.
+
+        Returns:
+            list: Package dictionaries that were still waiting for the end of the body.
+
+        Raises:
+            Exception: If the body ended before the document was complete.
+        """
+        self._buffer = self._buffer[self._pos:] + self._text_decoder.decode(b"", final=True)
+        self._pos = 0
+        packages = self._parse(final=True)
+        if self._state != "done" or self._buffer[self._pos:].strip():
+            raise Exception("Failed to parse the package list. The response body is incomplete or malformed")
+        return packages
+
+    def _skip_whitespace(self) -> bool:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._pos < len(self._buffer)
+
+    def _decode_value(self, final: bool):
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            return None, False
+        # A number at the very end of the buffer may still be cut off in the middle.
+        if end == len(self._buffer) and not final and self._buffer[self._pos] not in "{[\"":
+            return None, False
+        self._pos = end
+        return value, True
+
+    def _expect(self, symbols: str) -> str | None:
+        if not self._skip_whitespace():
+            return None
+        symbol = self._buffer[self._pos]
+        if symbol not in symbols:
+            raise Exception(f"Failed to parse the package list. Unexpected symbol {symbol!r} at the response body")
+        self._pos += 1
+        return symbol
+
+    def _skip_unselected(self) -> None:
+        # Jumps to the next package that may be selected, or to the last package in the buffer, over the packages
+        # in between without looking at them one by one. This is done only when the text in between is certainly
+        # a sequence of package objects: it has no escapes and no brackets, and the target brace is not in a string
+        # and follows a comma.
+        buffer, pos = self._buffer, self._pos
+        found = self._filter.candidates.search(buffer, pos)
+        limit = len(buffer) if found is None else found.start()
+        for symbol in "\\[]":
+            index = buffer.find(symbol, pos, limit)
+            if index >= 0:
+                limit = index
+        start = limit
+        while (start := buffer.rfind("{", pos, start)) > pos:
+            before = buffer[max(pos, start - 16): start].rstrip(" \t\n\r")
+            if before.endswith(",") and buffer.count('"', pos, start) % 2 == 0:
+                self._pos = start
+                self._state = "item"
+                return
+
+    def _parse(self, final: bool) -> list:
+        packages = []
+        while self._state != "done":
+            if self._state == "start":
+                if self._expect("{") is None:
+                    break
+                self._state = "key"
+            elif self._state == "key":
+                if not self._skip_whitespace():
+                    break
+                if self._buffer[self._pos] == "}":
+                    self._pos += 1
+                    self._state = "done"
+                    continue
+                key, complete = self._decode_value(final)
+                if not complete:
+                    break
+                self._key = key
+                self._state = "colon"
+            elif self._state == "colon":
+                if self._expect(":") is None:
+                    break
+                self._state = "packages" if self._key == "packages" else "value"
+            elif self._state == "value":
+                if not self._skip_whitespace():
+                    break
+                _, complete = self._decode_value(final)
+                if not complete:
+                    break
+                self._state = "next_key"
+            elif self._state == "next_key":
+                symbol = self._expect(",}")
+                if symbol is None:
+                    break
+                self._state = "key" if symbol == "," else "done"
+            elif self._state == "packages":
+                if self._expect("[") is None:
+                    break
+                self._state = "first_item"
+            elif self._state in ("item", "first_item"):
+                if not self._skip_whitespace():
+                    break
+                if self._state == "first_item" and self._buffer[self._pos] == "]":
+                    self._pos += 1
+                    self._state = "next_key"
+                    continue
+                if self._filter is not None and self._filter.candidates is not None:
+                    self._skip_unselected()
+                elif self._filter is not None:
+                    found = _FLAT_OBJECT.match(self._buffer, self._pos)
+                    if found is not None and self._filter.rejects_raw(self._buffer, self._pos, found.end()):
+                        self._pos = found.end()
+                        self._state = "next_item"
+                        continue
+                package, complete = self._decode_value(final)
+                if not complete:
+                    break
+                if self._filter is None or self._filter.matches(package):
+                    packages.append(package)
+                self._state = "next_item"
+            elif self._state == "next_item":
+                symbol = self._expect(",]")
+                if symbol is None:
+                    break
+                self._state = "item" if symbol == "," else "next_key"
+        return packages
+
+
+def iter_packages(chunks: Iterable[bytes], package_filter: PackageFilter | None = None) -> Iterator[dict]:
+    """
+    Lazily yields package records from a response body given as a sequence of byte chunks.
+
+    Args:
+        chunks (Iterable[bytes]): Parts of the response body, e.g. blocks read from a saved export file.
+        package_filter (PackageFilter | None): Yield only the selected packages.
+
+    Returns:
+        Iterator[dict]: Package dictionaries in the order they appear in the "packages" array.
+
+    Examples:
+        list(iter_packages([b'{"packages": [{"name": "pkg1"}', b', {"name": "pkg2"}]}']))
+        [{'name': 'pkg1'}, {'name': 'pkg2'}]
+    """
+    parser = PackageStreamParser(package_filter)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+class PackageDecoder:
+    """
+    Decodes a response body that arrives chunk by chunk, see `decode_download`.
+
+    The packages are collected into a list; subclasses may collect them into another structure while they are
+    decoded (e.g. `core.pipeline.TableDecoder`). `restart` is called when a download starts over.
+
+    Examples:
+        decoder = PackageDecoder()
+        decoder.feed(b'{"packages": [{"name": "pkg1"}')
+        decoder.feed(b']}')
+        decoder.close()
+        [{'name': 'pkg1'}]
+    """
+
+    def __init__(self, package_filter: PackageFilter | None = None):
+        self.package_filter = package_filter
+        self.restart()
+
+    def restart(self) -> None:
+        self.parser = PackageStreamParser(self.package_filter)
+        self.packages = []
+
+    def feed(self, chunk: bytes) -> None:
+        self.packages.extend(self.parser.feed(chunk))
+
+    def close(self) -> list:
+        self.packages.extend(self.parser.close())
+        return self.packages
+
+
+class TableDecoder(PackageDecoder):
+    """
+    Decodes a response body straight into a package table, so no package dictionaries are kept.
+
+    Examples:
+        decoder = TableDecoder(StringPool())
+        decoder.feed(body_chunk)
+        table = decoder.close()
+    """
+
+    def __init__(self, pool: StringPool, package_filter: PackageFilter | None = None):
+        self.pool = pool
+        super().__init__(package_filter)
+
+    def restart(self) -> None:
+        self.parser = PackageStreamParser(self.package_filter)
+        self.table = PackageTable(self.pool)
+
+    def feed(self, chunk: bytes) -> None:
+        self.table.extend(self.parser.feed(chunk))
+
+    def close(self) -> PackageTable:
+        self.table.extend(self.parser.close())
+        return self.table
+
+
+def encode_packages(packages: list | PackageTable | MappedSnapshot, pool: StringPool) -> PackageTable:
+    """
+    Dictionary-encodes the packages of a branch with a string pool.
+
+    Args:
+        packages (list | PackageTable | MappedSnapshot): The packages, a table is returned as is.
+        pool (StringPool): The string pool shared by the branches that are compared.
+
+    Returns:
+        PackageTable: The packages as a table of string codes.
+    """
+    if isinstance(packages, PackageTable):
+        return packages
+    if isinstance(packages, MappedSnapshot):
+        return packages.table(pool)
+    return PackageTable.from_records(packages, pool)
+
+
+async def run_blocking(executor: Executor | None, function: Callable, *args):
+    """
+    Runs a CPU-bound function in an executor, or in place if there is none.
+
+    Args:
+        executor (Executor | None): The executor, e.g. the single indexing thread of `core.pipeline`.
+        function (Callable): The function.
+        *args: Its arguments.
+
+    Returns:
+        The result of the function.
+    """
+    if executor is None:
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+class FetchError(Exception):
+    """
+    A branch can not be fetched: the API answered with an unexpected status, the export changed while it was
+    downloaded or there is no cached snapshot to work offline.
+    """
+
+
+def export_url(branch: str, base_url: str = API_URL) -> str:
+    """
+    Builds the URL of the binary package export of a branch.
+
+    Args:
+        branch (str): The branch name, quoted as a single path segment.
+        base_url (str): The root URL of the API.
+
+    Returns:
+        str: The URL of `/export/branch_binary_packages/{branch}`.
+
+    Examples:
+        export_url("p10")
+        'https://rdb.altlinux.org/api/export/branch_binary_packages/p10'
+    """
+    return f"{base_url}/export/branch_binary_packages/{quote(branch, safe='')}"
+
+
+@dataclasses.dataclass()
+class HttpOptions:
+    """
+    Settings of the HTTP client: timeouts, connection pooling and retries.
+
+    Attributes:
+        connect_timeout (float): Seconds to wait for a connection to the API.
+        read_timeout (float): Seconds to wait for the next piece of a response.
+        retries (int): How many times a failed request is repeated.
+        backoff_base (float): The first retry waits up to this many seconds, every next one twice as long.
+        backoff_max (float): The longest wait between retries in seconds.
+        connection_limit (int): The maximum number of simultaneous connections of a session.
+    """
+
+    connect_timeout: float = CONNECT_TIMEOUT
+    read_timeout: float = READ_TIMEOUT
+    retries: int = RETRIES
+    backoff_base: float = BACKOFF_BASE
+    backoff_max: float = BACKOFF_MAX
+    connection_limit: int = CONNECTION_LIMIT
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the wait before a retry: exponential backoff with full jitter.
+
+        Args:
+            attempt (int): The number of the failed attempt, starting from 0.
+
+        Returns:
+            float: A random number of seconds between 0 and `min(backoff_max, backoff_base * 2 ** attempt)`.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+def create_session(options: HttpOptions | None = None, trace_configs: list | None = None) -> aiohttp.ClientSession:
+    """
+    Creates the HTTP session shared by all requests of a run.
+
+    The session keeps a pool of connections, asks for a compressed transfer (gzip or deflate) and applies the
+    connect and read timeouts of `options`. There is no total timeout: a large export may take long to download
+    as long as data keeps coming.
+
+    Args:
+        options (HttpOptions | None): The client settings.
+        trace_configs (list | None): aiohttp trace configs of the session, e.g. `Profiler.trace_config`.
+
+    Returns:
+        aiohttp.ClientSession: The session, it must be closed by the caller.
+
+    Examples:
+        async with create_session() as session:
+            packages = await get_packages_async("sisyphus", session=session)
+    """
+    options = options or HttpOptions()
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=options.connection_limit),
+        timeout=aiohttp.ClientTimeout(
+            total=None, sock_connect=options.connect_timeout, sock_read=options.read_timeout
+        ),
+        headers={"Accept-Encoding": ACCEPT_ENCODING},
+        trace_configs=trace_configs,
+    )
+
+
+@asynccontextmanager
+async def session_scope(
+    session: aiohttp.ClientSession | None,
+    options: HttpOptions | None = None,
+    trace_configs: list | None = None,
+):
+    """
+    Uses the given session, or creates a temporary one if there is none.
+
+    Args:
+        session (aiohttp.ClientSession | None): A shared session.
+        options (HttpOptions | None): The settings of a temporary session.
+        trace_configs (list | None): The trace configs of a temporary session.
+
+    Yields:
+        aiohttp.ClientSession: The session to send requests with.
+    """
+    if session is not None:
+        yield session
+    else:
+        async with create_session(options, trace_configs) as new_session:
+            yield new_session
+
+
+class ResumableDownload:
+    """
+    A GET request that is repeated with backoff when it fails and resumed when the connection drops.
+
+    Connection errors, timeouts and the 429 and 5xx statuses are retried up to `options.retries` times.
+    If the body breaks off in the middle, the download continues with a Range request from the received offset,
+    guarded by If-Range, when the response allows it: it is not compressed (a compressed body can not be
+    continued from a byte offset), the server accepts byte ranges and there is an ETag or Last-Modified.
+    Otherwise the download starts over and `iter_chunks` yields None, so the consumer drops what it got so far.
+    If the export changed in the meantime (another ETag), the download starts over as well and `headers` become
+    the headers of the new export.
+
+    Examples:
+        async with ResumableDownload(session, url) as download:
+            if download.status == 200:
+                async for chunk in download.iter_chunks():
+                    ...
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: dict | None = None,
+        options: HttpOptions | None = None,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.session = session
+        self.url = url
+        self.request_headers = headers or {}
+        self.options = options or HttpOptions()
+        self.chunk_size = chunk_size
+        self.attempt = 0
+        self.response = None
+        self.status = None
+        self.headers = None
+
+    async def __aenter__(self) -> "ResumableDownload":
+        self.response = await self._request(self.request_headers)
+        self.status = self.response.status
+        self.headers = self.response.headers
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self.response is not None:
+            self.response.release()
+
+    @property
+    def resumable(self) -> bool:
+        """
+        Whether a broken body can be continued with a Range request.
+        """
+        encoding = self.headers.get("Content-Encoding", "identity").lower()
+        return (
+            encoding == "identity"
+            and self.headers.get("Accept-Ranges", "").lower() == "bytes"
+            and self.validator is not None
+        )
+
+    @property
+    def validator(self) -> str | None:
+        """
+        The ETag or Last-Modified of the response, used in If-Range.
+        """
+        return self.headers.get("ETag") or self.headers.get("Last-Modified")
+
+    async def _request(self, headers: dict) -> aiohttp.ClientResponse:
+        while True:
+            try:
+                response = await self.session.get(self.url, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if self.attempt >= self.options.retries:
+                    raise
+            else:
+                if response.status not in RETRY_STATUSES or self.attempt >= self.options.retries:
+                    return response
+                response.release()
+            await asyncio.sleep(self.options.backoff(self.attempt))
+            self.attempt += 1
+
+    async def iter_chunks(self) -> AsyncIterator[bytes | None]:
+        """
+        Yields the response body chunk by chunk, resuming or restarting it after connection failures.
+
+        Returns:
+            AsyncIterator[bytes | None]: Body chunks; None means the download started over and all
+                previous chunks must be discarded.
+
+        Raises:
+            FetchError: If the repeated request fails with another status than 200 or 206.
+            aiohttp.ClientError: If the body can not be downloaded after all retries.
+        """
+        received = 0
+        response = self.response
+        while True:
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    received += len(chunk)
+                    yield chunk
+                return
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if self.attempt >= self.options.retries:
+                    raise
+            response.release()
+            await asyncio.sleep(self.options.backoff(self.attempt))
+            self.attempt += 1
+
+            headers = {
+                key: value for key, value in self.request_headers.items()
+                if key not in ("If-None-Match", "If-Modified-Since")
+            }
+            if self.resumable:
+                headers["Range"] = f"bytes={received}-"
+                headers["If-Range"] = self.validator
+                headers["Accept-Encoding"] = "identity"
+            response = self.response = await self._request(headers)
+            if response.status == 206 and response.headers.get("Content-Range", "").startswith(f"bytes {received}-"):
+                continue
+            if response.status != 200:
+                raise FetchError(f"Failed to resume the download of {self.url}. HTTP status {response.status}")
+            # The whole body again, possibly of a newer export: its validators replace the previous ones.
+            self.headers = response.headers
+            received = 0
+            yield None
+
+
+async def decode_download(
+    download: ResumableDownload,
+    decoder: PackageDecoder | None,
+    executor: Executor | None = None,
+    file: BinaryIO | None = None,
+):
+    """
+    Decodes the body of a download while it arrives.
+
+    Every chunk is handed to the decoder as soon as it is received; with an executor the decoding runs there, so
+    the event loop keeps receiving the other downloads meanwhile.
+
+    Args:
+        download (ResumableDownload): An opened download with status 200.
+        decoder (PackageDecoder | None): The decoder of the body, None to only write the body to the file.
+        executor (Executor | None): Where the decoder runs, in the event loop if None.
+        file (BinaryIO | None): A file the raw body is written to as well, e.g. a cache snapshot.
+
+    Returns:
+        The result of `decoder.close`, None without a decoder.
+    """
+    async for chunk in download.iter_chunks():
+        if chunk is None:
+            if file is not None:
+                file.seek(0)
+                file.truncate()
+            if decoder is not None:
+                decoder.restart()
+            continue
+        if file is not None:
+            file.write(chunk)
+        if decoder is not None:
+            await run_blocking(executor, decoder.feed, chunk)
+    return None if decoder is None else await run_blocking(executor, decoder.close)
+
+
+async def iter_packages_async(
+    branch: str,
+    chunk_size: int = CHUNK_SIZE,
+    base_url: str = API_URL,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Asynchronously streams package records of a branch while the response body is being downloaded.
+
+    If the download has to start over after a failure, the packages that were already yielded are skipped.
+
+    Args:
+        branch (str): The branch name to fetch package data from.
+        chunk_size (int): The size of the body chunks read from the connection.
+        base_url (str): The root URL of the API.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries, used for a temporary session and for retries.
+        package_filter (PackageFilter | None): Keep only the selected packages, see `PackageFilter`.
+
+    Returns:
+        AsyncIterator[dict]: Package dictionaries, yielded one at a time.
+
+    Raises:
+        FetchError: If the response status is not 200.
+        aiohttp.ClientError: If the HTTP request fails after all retries.
+
+    Examples:
+        async for package in iter_packages_async('sisyphus'):
+            print(package['name'])
+    """
+    url = export_url(branch, base_url)
+    async with session_scope(session, options) as client:
+        async with ResumableDownload(client, url, options=options, chunk_size=chunk_size) as download:
+            if download.status != 200:
+                raise FetchError(f"Failed to fetch data from -> {branch} <- branch. HTTP status {download.status}")
+            parser = PackageStreamParser(package_filter)
+            yielded = 0
+            skip = 0
+            async for chunk in download.iter_chunks():
+                if chunk is None:
+                    parser = PackageStreamParser(package_filter)
+                    skip = yielded
+                    continue
+                for package in parser.feed(chunk):
+                    if skip:
+                        skip -= 1
+                        continue
+                    yielded += 1
+                    yield package
+            for package in parser.close():
+                if skip:
+                    skip -= 1
+                    continue
+                yield package
+
+
+def read_cached_packages(
+    cache: SnapshotCache,
+    entry: CacheEntry,
+    stream: bool = False,
+    package_filter: PackageFilter | None = None,
+    packages: list | PackageTable | None = None,
+) -> list | MappedSnapshot:
+    """
+    Reads the packages of a cached branch.
+
+    With a filter the JSON body is always parsed incrementally, so the packages that are not selected are
+    never decoded; a binary snapshot gets the selected rows, see `MappedSnapshot.select`.
+
+    Args:
+        cache (SnapshotCache): The snapshot cache.
+        entry (CacheEntry): The cached snapshot.
+        stream (bool): Parse the JSON body incrementally instead of loading it at once.
+        package_filter (PackageFilter | None): Keep only the selected packages.
+        packages (list | PackageTable | None): All packages of the snapshot if they are already in memory, used to
+            write a missing binary snapshot.
+
+    Returns:
+        list | MappedSnapshot: The binary snapshot if the cache keeps them, otherwise the package list.
+    """
+    if cache.binary:
+        snapshot = cache.load_binary(entry, packages)
+        return snapshot.select(package_filter.select_rows(snapshot)) if package_filter else snapshot
+    if stream or package_filter:
+        return list(iter_packages(cache.read_chunks(entry), package_filter))
+    return cache.load(entry)
+
+
+async def refresh_cached_branch(
+    branch: str,
+    cache: SnapshotCache,
+    offline: bool = False,
+    base_url: str = API_URL,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    decoder: PackageDecoder | None = None,
+    executor: Executor | None = None,
+) -> tuple:
+    """
+    Makes sure the snapshot cache has an up-to-date export of a branch.
+
+    A fresh snapshot is used without contacting the API. A stale one is revalidated with a conditional request
+    and kept if the API answers 304 Not Modified. Otherwise the response body is written to the cache, and decoded
+    by the decoder at the same time if there is one.
+
+    Args:
+        branch (str): The branch name.
+        cache (SnapshotCache): The snapshot cache.
+        offline (bool): Never contact the API, use only the cached snapshot.
+        base_url (str): The root URL of the API.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries, used for a temporary session and for retries.
+        decoder (PackageDecoder | None): Decodes the body if it is downloaded.
+        executor (Executor | None): Where the decoder runs.
+
+    Returns:
+        tuple: The `CacheEntry` of the branch and the result of the decoder, None if nothing was decoded.
+
+    Raises:
+        FetchError: If the response status is not 200, or if there is no snapshot of the branch in offline mode.
+        aiohttp.ClientError: If the HTTP request fails after all retries.
+
+    Examples:
+        entry, _ = asyncio.run(refresh_cached_branch('sisyphus', SnapshotCache('/tmp/cache')))
+        iter_packages(cache.read_chunks(entry))
+    """
+    entry = cache.get(branch)
+    if offline and entry is None:
+        raise FetchError(f"There is no cached snapshot of -> {branch} <- branch to work offline")
+    if entry is not None and (offline or cache.is_fresh(entry)):
+        return entry, None
+
+    url = export_url(branch, base_url)
+    async with session_scope(session, options) as client:
+        async with ResumableDownload(client, url, cache.validation_headers(entry), options) as download:
+            if download.status == 304 and entry is not None:
+                return cache.revalidated(entry), None
+            if download.status != 200:
+                raise FetchError(f"Failed to fetch data from -> {branch} <- branch. HTTP status {download.status}")
+
+            etag = download.headers.get("ETag")
+            last_modified = download.headers.get("Last-Modified")
+            with cache.store(branch, etag, last_modified) as file:
+                packages = await decode_download(download, decoder, executor, file)
+            entry = cache.get(branch)
+            validators = (download.headers.get("ETag"), download.headers.get("Last-Modified"))
+            if (entry.etag, entry.last_modified) != validators:
+                # The export changed during the download, the stored body is the new one.
+                entry.etag, entry.last_modified = validators
+                cache.revalidated(entry)
+    return entry, packages
+
+
+async def get_cached_packages_async(
+    branch: str,
+    cache: SnapshotCache,
+    stream: bool = False,
+    offline: bool = False,
+    base_url: str = API_URL,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+    decoder: PackageDecoder | None = None,
+    executor: Executor | None = None,
+) -> list | MappedSnapshot:
+    """
+    Fetches package data of a branch through the on-disk snapshot cache.
+
+    A fresh snapshot is read from disk without contacting the API. A stale one is revalidated with a
+    conditional request and reused if the API answers 304 Not Modified. Otherwise the response body is
+    written to the cache while it is being parsed. If the cache keeps binary snapshots, the branch is
+    returned as a `MappedSnapshot` instead of a list, see `SnapshotCache.load_binary`.
+
+    Args:
+        branch (str): The branch name to fetch package data from.
+        cache (SnapshotCache): The snapshot cache.
+        stream (bool): Parse cached snapshots incrementally instead of loading them at once.
+        offline (bool): Never contact the API, use only the cached snapshot.
+        base_url (str): The root URL of the API.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries, used for a temporary session and for retries.
+        package_filter (PackageFilter | None): Keep only the selected packages, see `PackageFilter`.
+        decoder (PackageDecoder | None): Decodes a downloaded body, a `PackageDecoder` with the filter by default.
+            If the cache keeps binary snapshots, it has to decode the whole branch.
+        executor (Executor | None): Where the bodies are decoded and the cached snapshots are read.
+
+    Returns:
+        list | MappedSnapshot: A list of packages from the specified branch (or the result of the decoder),
+            or its binary snapshot.
+
+    Raises:
+        FetchError: If the response status is not 200, or if there is no snapshot of the branch in offline mode.
+        aiohttp.ClientError: If the HTTP request fails after all retries.
+
+    Examples:
+        asyncio.run(get_cached_packages_async('sisyphus', SnapshotCache('/tmp/cache')))
+        [{'name': 'package1', 'version': '1.0'}, {'name': 'package2', 'version': '2.0'}]
+    """
+    decoder = decoder or PackageDecoder(None if cache.binary else package_filter)
+    entry, packages = await refresh_cached_branch(branch, cache, offline, base_url, session, options, decoder, executor)
+    if packages is None:
+        return await run_blocking(executor, read_cached_packages, cache, entry, stream, package_filter)
+    if cache.binary:
+        # The binary snapshot keeps the whole branch, the filter is applied to its rows.
+        return await run_blocking(executor, read_cached_packages, cache, entry, False, package_filter, packages)
+    return packages
+
+
+async def get_packages_async(
+    branch: str,
+    stream: bool = False,
+    cache: SnapshotCache | None = None,
+    offline: bool = False,
+    base_url: str = API_URL,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+    decoder: PackageDecoder | None = None,
+    executor: Executor | None = None,
+    pool: StringPool | None = None,
+) -> list | PackageTable | MappedSnapshot:
     """
     Asynchronously fetches package data from a specified branch of the ALT Linux repository.
 
+    With a string pool the packages are dictionary-encoded as soon as they are received: the result is a
+    `PackageTable`, and a body that is parsed chunk by chunk (`stream` or a cache download) goes into the table
+    package by package, so the dictionaries of the whole branch never exist at once.
+
     Args:
         branch (str): The branch name to fetch package data from.
+        stream (bool): Parse the response body chunk by chunk instead of loading it into memory as a whole.
+        cache (SnapshotCache | None): The snapshot cache to reuse previously downloaded data from.
+        offline (bool): Use only the cached snapshot, see `get_cached_packages_async`.
+        base_url (str): The root URL of the API.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`. A temporary session
+            is created if there is none.
+        options (HttpOptions | None): Timeouts and retries, used for a temporary session and for retries.
+        package_filter (PackageFilter | None): Keep only the selected packages, see `PackageFilter`.
+        decoder (PackageDecoder | None): Decode the response body chunk by chunk while it arrives with this
+            decoder and return its result, see `decode_download`.
+        executor (Executor | None): Where the decoder runs and the cached snapshots are read.
+        pool (StringPool | None): Return the packages encoded with this pool, see `encode_packages`.
 
     Returns:
-        list: A list of packages from the specified branch.
+        list | PackageTable | MappedSnapshot: A list of packages from the specified branch (or the result of the
+            decoder), its binary snapshot if the cache keeps them, or a table if a pool is given.
 
     Raises:
-        Exception: If the HTTP request fails or the response status is not 200.
+        FetchError: If the response status is not 200.
+        aiohttp.ClientError: If the HTTP request fails after all retries.
 
     Examples:
         asyncio.run(get_packages_async('branch_name'))
         [{'name': 'package1', 'version': '1.0'}, {'name': 'package2', 'version': '2.0'}]
     """
-    url = f"https://rdb.altlinux.org/api/export/branch_binary_packages/{branch}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["packages"]
-            else:
-                raise Exception(f"Failed to fetch data from -> {branch} <- branch. HTTP status {response.status}")
+    if pool is not None:
+        if decoder is None and (stream or cache is not None):
+            # A binary snapshot keeps the whole branch, the filter is applied to its rows.
+            decoder = TableDecoder(pool, None if cache is not None and cache.binary else package_filter)
+        packages = await get_packages_async(
+            branch, stream, cache, offline, base_url, session, options, package_filter, decoder, executor
+        )
+        return await run_blocking(executor, encode_packages, packages, pool)
+    if cache is not None:
+        return await get_cached_packages_async(
+            branch, cache, stream, offline, base_url, session, options, package_filter, decoder, executor
+        )
+    if offline:
+        raise Exception("Offline mode requires a snapshot cache")
+    if stream and decoder is None:
+        return [
+            package
+            async for package in iter_packages_async(
+                branch, base_url=base_url, session=session, options=options, package_filter=package_filter
+            )
+        ]
 
+    url = export_url(branch, base_url)
+    async with session_scope(session, options) as client:
+        async with ResumableDownload(client, url, options=options) as download:
+            if download.status != 200:
+                raise FetchError(f"Failed to fetch data from -> {branch} <- branch. HTTP status {download.status}")
+            if decoder is not None:
+                return await decode_download(download, decoder, executor)
+            body = bytearray()
+            async for chunk in download.iter_chunks():
+                if chunk is None:
+                    body.clear()
+                else:
+                    body += chunk
+    if package_filter:
+        return list(iter_packages([body], package_filter))
+    return json.loads(body)["packages"]
 
-async def async_version(branch1: str, branch2: str) -> list:
+
+async def async_version(
+    branch1: str,
+    branch2: str,
+    stream: bool = False,
+    cache: SnapshotCache | None = None,
+    offline: bool = False,
+    base_url: str = API_URL,
+    trace_configs: list | None = None,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+    pool: StringPool | None = None,
+) -> list:
     """
     Asynchronously fetches package data from two specified branches and returns the results.
 
     Args:
         branch1 (str): The first branch name.
         branch2 (str): The second branch name.
+        stream (bool): Parse both responses incrementally, see `get_packages_async`.
+        cache (SnapshotCache | None): The snapshot cache shared by both branches.
+        offline (bool): Use only the cached snapshots.
+        base_url (str): The root URL of the API.
+        trace_configs (list | None): aiohttp trace configs of the session, e.g. `Profiler.trace_config`.
+        session (aiohttp.ClientSession | None): The shared session, see `fetch_branches`.
+        options (HttpOptions | None): Timeouts and retries.
+        package_filter (PackageFilter | None): Keep only the selected packages of every branch.
+        pool (StringPool | None): Encode every branch into a `PackageTable` with this pool as soon as it is received.
 
     Returns:
         list: A list containing the package data from both branches. The first element is the data from `branch1`,
@@ -49,6 +1093,93 @@ async def async_version(branch1: str, branch2: str) -> list:
             [{'name': 'package3', 'version': '1.5'}, {'name': 'package4', 'version': '2.5'}]
         ]
     """
-    tasks = [get_packages_async(branch1), get_packages_async(branch2)]
-    results = await asyncio.gather(*tasks)
+    results = await fetch_branches(
+        [branch1, branch2], stream, cache, offline, base_url, trace_configs, session, options, package_filter, pool
+    )
     return results
+
+
+async def fetch_branches(
+    branches: list,
+    stream: bool = False,
+    cache: SnapshotCache | None = None,
+    offline: bool = False,
+    base_url: str = API_URL,
+    trace_configs: list | None = None,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+    pool: StringPool | None = None,
+) -> list:
+    """
+    Concurrently fetches package data of several branches, every distinct branch is downloaded once.
+
+    All branches are downloaded through one pooled session: the given one, or a session created for the call.
+
+    Args:
+        branches (list): The branch names.
+        stream (bool): Parse the responses incrementally, see `get_packages_async`.
+        cache (SnapshotCache | None): The snapshot cache shared by all branches.
+        offline (bool): Use only the cached snapshots.
+        base_url (str): The root URL of the API.
+        trace_configs (list | None): aiohttp trace configs of a created session, e.g. `Profiler.trace_config`.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries.
+        package_filter (PackageFilter | None): Keep only the selected packages of every branch.
+        pool (StringPool | None): Encode every branch into a `PackageTable` with this pool as soon as it is received,
+            see `get_packages_async`. The tables can be compared with each other.
+
+    Returns:
+        list: The package data of every branch, in the order of `branches`.
+
+    Examples:
+        asyncio.run(fetch_branches(['p10', 'p11', 'sisyphus']))
+        [[{'name': 'package1', ...}, ...], [...], [...]]
+    """
+    unique = list(dict.fromkeys(branches))
+    async with session_scope(session, options, trace_configs) as client:
+        tasks = [
+            get_packages_async(
+                branch, stream, cache, offline, base_url, client, options, package_filter, pool=pool
+            )
+            for branch in unique
+        ]
+        results = dict(zip(unique, await asyncio.gather(*tasks)))
+    return [results[branch] for branch in branches]
+
+
+async def cache_branches(
+    branches: list,
+    cache: SnapshotCache,
+    offline: bool = False,
+    base_url: str = API_URL,
+    trace_configs: list | None = None,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+) -> list:
+    """
+    Concurrently brings the cached exports of several branches up to date without decoding them.
+
+    The packages can then be streamed from the cache with bounded memory, e.g. by `core.external.external_join`.
+
+    Args:
+        branches (list): The branch names.
+        cache (SnapshotCache): The snapshot cache.
+        offline (bool): Use only the cached snapshots.
+        base_url (str): The root URL of the API.
+        trace_configs (list | None): aiohttp trace configs of a created session, e.g. `Profiler.trace_config`.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries.
+
+    Returns:
+        list: The `CacheEntry` of every branch, in the order of `branches`.
+
+    Examples:
+        entries = asyncio.run(cache_branches(['p10', 'sisyphus'], SnapshotCache('/tmp/cache')))
+        [iter_packages(cache.read_chunks(entry)) for entry in entries]
+    """
+    unique = list(dict.fromkeys(branches))
+    async with session_scope(session, options, trace_configs) as client:
+        tasks = [refresh_cached_branch(branch, cache, offline, base_url, client, options) for branch in unique]
+        results = dict(zip(unique, await asyncio.gather(*tasks)))
+    return [results[branch][0] for branch in branches]
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from core.cache import SnapshotCache
+from core.classes import StringPool, TableIndex
+from core.parse_data import (
+    API_URL,
+    HttpOptions,
+    PackageFilter,
+    TableDecoder,
+    get_packages_async,
+    run_blocking,
+    session_scope,
+)
+
+
+async def fetch_indexed(
+    branches: list,
+    stream: bool = False,
+    cache: SnapshotCache | None = None,
+    offline: bool = False,
+    base_url: str = API_URL,
+    trace_configs: list | None = None,
+    session: aiohttp.ClientSession | None = None,
+    options: HttpOptions | None = None,
+    package_filter: PackageFilter | None = None,
+) -> list:
+    """
+    Fetches several branches and indexes every one of them as soon as it arrives.
+
+    The downloads run concurrently in the event loop while a single worker thread decodes each body chunk by
+    chunk into a package table and indexes the table when its download ends. So a branch is indexed while the
+    others are still being downloaded, and the whole run takes about as long as the slowest download plus
+    indexing its last part. One thread is enough: decoding holds the GIL, and the string pool shared by the
+    tables is only ever changed by that thread.
+
+    Args:
+        branches (list): The branch names, every distinct branch is fetched once.
+        stream (bool): Parse cached snapshots incrementally, see `get_packages_async`.
+        cache (SnapshotCache | None): The snapshot cache shared by all branches.
+        offline (bool): Use only the cached snapshots.
+        base_url (str): The root URL of the API.
+        trace_configs (list | None): aiohttp trace configs of a created session, e.g. `Profiler.trace_config`.
+        session (aiohttp.ClientSession | None): The shared session, see `create_session`.
+        options (HttpOptions | None): Timeouts and retries.
+        package_filter (PackageFilter | None): Keep only the selected packages of every branch.
+
+    Returns:
+        list: A (`PackageTable`, `TableIndex`) tuple for every branch, in the order of `branches`. All tables
+              share one string pool.
+
+    Examples:
+        (p10, p10_index), (sisyphus, sisyphus_index) = asyncio.run(fetch_indexed(["p10", "sisyphus"]))
+        merge_variant(p10, sisyphus, p10_index, sisyphus_index)
+    """
+    pool = StringPool()
+    unique = list(dict.fromkeys(branches))
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexer") as executor:
+
+        async def fetch(branch: str) -> tuple:
+            # A binary snapshot keeps the whole branch, the filter is applied to its rows.
+            decoder = TableDecoder(pool, None if cache is not None and cache.binary else package_filter)
+            table = await get_packages_async(
+                branch, stream, cache, offline, base_url, client, options, package_filter, decoder, executor, pool
+            )
+            return table, await run_blocking(executor, TableIndex.build, table)
+
+        async with session_scope(session, options, trace_configs) as client:
+            results = dict(zip(unique, await asyncio.gather(*map(fetch, unique))))
+    return [results[branch] for branch in branches]
@@ -0,0 +1,252 @@
+import dataclasses
+import json
+import platform
+import random
+import time
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+
+from core.classes import PackageTable, StringPool
+
+DEFAULT_PROFILE_PATH = Path("~/.cache/compare_packages/machine.profile")
+CALIBRATION_ROWS = 40_000
+PROFILE_VERSION = 2
+
+
+@dataclasses.dataclass()
+class MachineProfile:
+    """
+    Measured costs of the comparison steps on the current machine.
+
+    Attributes:
+        cores (int): The number of available CPU cores.
+        row_cost (float): Seconds to compare one row in a single process (`merge_variant`).
+        transfer_cost (float): Seconds per row to split the data into shards and place them in shared memory.
+        process_cost (float): Seconds to start and stop one worker process.
+        python (str): The Python version the profile was measured with.
+        created_at (float): The UNIX time of the measurement.
+    """
+
+    cores: int
+    row_cost: float
+    transfer_cost: float
+    process_cost: float
+    python: str = platform.python_version()
+    created_at: float = dataclasses.field(default_factory=time.time)
+    version: int = PROFILE_VERSION
+
+
+@dataclasses.dataclass()
+class ExecutionPlan:
+    """
+    The decision of the planner for a given input size.
+
+    Attributes:
+        engine (str): The chosen engine, "merge" or "multiprocess".
+        processes (int): The number of worker processes, 1 for the single-process engine.
+        rows (int): The total number of rows in both branches.
+        estimated_time (float): The expected comparison time of the chosen engine, in seconds.
+        single_process_time (float): The expected comparison time in a single process, in seconds.
+        profile (MachineProfile): The machine profile the estimate is based on.
+        profile_source (str): Where the profile comes from: "stored" or "calibrated".
+    """
+
+    engine: str
+    processes: int
+    rows: int
+    estimated_time: float
+    single_process_time: float
+    profile: MachineProfile
+    profile_source: str
+
+    def describe(self) -> str:
+        """
+        Returns a human-readable description of the plan.
+
+        Examples:
+            plan.describe()
+            'multiprocess engine with 8 processes for 2,100,000 rows: ~1.9 s (single process ~9.7 s), stored profile'
+        """
+        engine = f"{self.engine} engine"
+        if self.processes > 1:
+            engine += f" with {self.processes} processes"
+        return (
+            f"{engine} for {self.rows:,} rows: ~{self.estimated_time:.1f} s "
+            f"(single process ~{self.single_process_time:.1f} s), {self.profile_source} profile"
+        )
+
+
+def calibration_tables(rows: int = CALIBRATION_ROWS) -> tuple:
+    """
+    Generates two deterministic branches for the calibration benchmark.
+
+    Args:
+        rows (int): The number of rows in the first branch.
+
+    Returns:
+        tuple: Two `PackageTable` objects sharing a string pool, with most keys in common and
+               a part of the common packages updated in the second one.
+    """
+    generator = random.Random(0)
+    arches = ("x86_64", "i586", "aarch64", "noarch", "ppc64le")
+    first = []
+    for index in range(rows):
+        first.append({
+            "name": f"package-{index // len(arches)}",
+            "epoch": generator.choice((0, 0, 0, 1)),
+            "version": f"{generator.randint(0, 9)}.{generator.randint(0, 30)}.{generator.randint(0, 9)}",
+            "release": f"alt{generator.randint(1, 5)}",
+            "arch": arches[index % len(arches)],
+            "disttag": "sisyphus+1",
+            "buildtime": 1_700_000_000 + index,
+            "source": f"package-{index // 20}",
+        })
+    second = []
+    for record in first:
+        if generator.random() < 0.9:
+            if generator.random() < 0.3:
+                record = dict(record, release=f"alt{generator.randint(1, 9)}")
+            second.append(record)
+    pool = StringPool()
+    return PackageTable.from_records(first, pool), PackageTable.from_records(second, pool)
+
+
+def calibrate(rows: int = CALIBRATION_ROWS) -> MachineProfile:
+    """
+    Measures the cost of the comparison steps with a short benchmark.
+
+    Args:
+        rows (int): The size of the generated branches, larger values give more stable numbers.
+
+    Returns:
+        MachineProfile: The measured profile of the current machine.
+    """
+    # Imported here because the comparison engines themselves consult the planner.
+    from core.data_extractor import diff_shard, init_shard_worker, merge_variant, split_shards
+    from core.shared import SharedShards
+
+    first, second = calibration_tables(rows)
+    total = len(first) + len(second)
+
+    start = time.perf_counter()
+    merge_variant(first, second)
+    row_cost = (time.perf_counter() - start) / total
+
+    start = time.perf_counter()
+    with SharedShards.create(first, second, split_shards(first, second, 2)) as shared:
+        prepared = time.perf_counter()
+        with Pool(processes=2, initializer=init_shard_worker, initargs=shared.worker_args()) as pool:
+            setup = time.perf_counter()
+            pool.map(diff_shard, range(len(shared.bounds)))
+            done = time.perf_counter()
+    elapsed = time.perf_counter() - start
+    work = prepared - start + done - setup
+    # The shards were compared by two processes at once, what remains is splitting, transfer and process startup.
+    transfer_cost = max(work - row_cost * total / 2, 0) / total
+    process_cost = max(elapsed - work, 0) / 2
+    return MachineProfile(cpu_count(), row_cost, transfer_cost, process_cost)
+
+
+def load_profile(path: str | Path = DEFAULT_PROFILE_PATH) -> MachineProfile | None:
+    """
+    Loads a stored machine profile if it is still valid for this machine.
+
+    Args:
+        path (str | Path): The profile file.
+
+    Returns:
+        MachineProfile | None: The profile, or None if it is missing, outdated or measured on other hardware.
+    """
+    try:
+        with open(Path(path).expanduser()) as file:
+            profile = MachineProfile(**json.load(file))
+    except (OSError, ValueError, TypeError):
+        return None
+    if (
+        profile.version != PROFILE_VERSION
+        or profile.cores != cpu_count()
+        or profile.python != platform.python_version()
+    ):
+        return None
+    return profile
+
+
+def save_profile(profile: MachineProfile, path: str | Path = DEFAULT_PROFILE_PATH) -> None:
+    """
+    Stores a machine profile for the next runs.
+
+    Args:
+        profile (MachineProfile): The profile to store.
+        path (str | Path): The profile file.
+    """
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(dataclasses.asdict(profile), file, indent=4)
+
+
+def plan_execution(
+    rows: int,
+    profile_path: str | Path | None = DEFAULT_PROFILE_PATH,
+    recalibrate: bool = False,
+) -> ExecutionPlan:
+    """
+    Chooses the comparison engine and the number of processes for the given input size.
+
+    The stored machine profile is used if it is valid, otherwise a short calibration benchmark is run and
+    its result is stored. The single-process time is estimated as `rows * row_cost`, the time with
+    `n` processes as `n * process_cost + rows * transfer_cost + rows * row_cost / n`; the fastest option wins.
+
+    Args:
+        rows (int): The total number of rows in both branches.
+        profile_path (str | Path | None): Where the machine profile is stored, None to always calibrate.
+        recalibrate (bool): Ignore the stored profile and measure again.
+
+    Returns:
+        ExecutionPlan: The chosen plan.
+
+    Examples:
+        plan_execution(2_100_000)
+        ExecutionPlan(engine='multiprocess', processes=8, rows=2100000, ...)
+    """
+    profile = None
+    source = "stored"
+    if profile_path is not None and not recalibrate:
+        profile = load_profile(profile_path)
+    if profile is None:
+        profile = calibrate()
+        source = "calibrated"
+        if profile_path is not None:
+            save_profile(profile, profile_path)
+    return choose_plan(rows, profile, source)
+
+
+def choose_plan(rows: int, profile: MachineProfile, source: str = "stored") -> ExecutionPlan:
+    """
+    Chooses the comparison engine and the number of processes with a given machine profile.
+
+    Unlike `plan_execution` it neither runs the calibration nor reads or writes the profile file.
+
+    Args:
+        rows (int): The total number of rows in both branches.
+        profile (MachineProfile): The machine profile, e.g. from `load_profile`.
+        source (str): Where the profile comes from, see `ExecutionPlan.profile_source`.
+
+    Returns:
+        ExecutionPlan: The chosen plan.
+
+    Examples:
+        choose_plan(2_100_000, load_profile())
+        ExecutionPlan(engine='multiprocess', processes=8, rows=2100000, ...)
+    """
+    single_process_time = rows * profile.row_cost
+    plan = ExecutionPlan("merge", 1, rows, single_process_time, single_process_time, profile, source)
+    for processes in range(2, profile.cores + 1):
+        estimate = (
+            processes * profile.process_cost
+            + rows * profile.transfer_cost
+            + rows * profile.row_cost / processes
+        )
+        if estimate < plan.estimated_time:
+            plan = ExecutionPlan("multiprocess", processes, rows, estimate, single_process_time, profile, source)
+    return plan
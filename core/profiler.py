@@ -0,0 +1,260 @@
+import cProfile
+import dataclasses
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import aiohttp
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+SAMPLE_INTERVAL = 0.01
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of the process so far, in bytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def current_rss() -> int | None:
+    """
+    Returns the current resident set size of the process in bytes, None where `/proc/self/statm` is not available.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    Samples the resident set size of the process in a background thread to find the peak of a stage.
+
+    `peak_rss` never decreases, so it can not show the peak of a stage that needs less memory than an earlier one.
+    A peak shorter than the sampling interval may be missed.
+
+    Attributes:
+        interval (float): Seconds between the samples.
+        peak (int | None): The largest sampled RSS in bytes, None where `current_rss` is not available.
+
+    Examples:
+        with RssSampler() as sampler:
+            build_tables(first, second)
+        sampler.peak
+        734003200
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = current_rss()
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        rss = current_rss()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+
+def cpu_time() -> float:
+    """
+    Returns the CPU time used by the process and its finished child processes (e.g. pool workers), in seconds.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+@dataclasses.dataclass()
+class StageRecord:
+    """
+    The measurement of one stage of a run.
+
+    Attributes:
+        name (str): The stage name.
+        wall (float): The wall time of the stage in seconds.
+        cpu (float): The CPU time of the process and its finished child processes during the stage in seconds.
+        rows (int | None): The number of rows the stage processed, if it is known.
+        bytes (int | None): The number of bytes the stage received (response bodies after decompression) or wrote,
+            if it is known.
+        stage_peak_rss (int | None): The largest resident set size of the process sampled during the stage, in
+            bytes (see `RssSampler`), None where it can not be sampled. Worker processes are not included.
+        peak_rss (int): The peak resident set size of the process from its start to the end of the stage, in bytes.
+        details (dict): Additional stage information, e.g. the chosen engine.
+    """
+
+    name: str
+    wall: float = 0.0
+    cpu: float = 0.0
+    rows: int | None = None
+    bytes: int | None = None
+    stage_peak_rss: int | None = None
+    peak_rss: int = 0
+    details: dict = dataclasses.field(default_factory=dict)
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, rows, bytes and peak memory of the stages of a run.
+
+    The memory of a stage is the peak sampled while it runs; the peak of the process so far is reported too.
+
+    Examples:
+        profiler = Profiler()
+        with profiler.stage("diff") as stage:
+            result = get_sorted_data(first, second)
+            stage.rows = len(first) + len(second)
+        profiler.write_report("profile.json")
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.responses = []
+        self.started = time.perf_counter()
+        self.started_cpu = cpu_time()
+
+    @contextmanager
+    def stage(self, name: str, cprofile_path: str | None = None) -> Iterator[StageRecord]:
+        """
+        Measures a stage.
+
+        Args:
+            name (str): The stage name.
+            cprofile_path (str | None): If given, the stage runs under cProfile and the statistics are dumped
+                to this file (it can be read with `pstats` or snakeviz).
+
+        Yields:
+            StageRecord: The record of the stage, the caller may fill in the rows, bytes and details.
+        """
+        record = StageRecord(name)
+        profile = cProfile.Profile() if cprofile_path is not None else None
+        sampler = RssSampler()
+        start_cpu = cpu_time()
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            with sampler:
+                yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(cprofile_path)
+                record.details["cprofile"] = cprofile_path
+            record.wall = time.perf_counter() - start
+            record.cpu = cpu_time() - start_cpu
+            record.stage_peak_rss = sampler.peak
+            record.peak_rss = peak_rss()
+            self.stages.append(record)
+
+    @property
+    def body_bytes(self) -> int:
+        """
+        The number of response body bytes received by the sessions traced with `trace_config`, after
+        decompression: a compressed response took fewer bytes on the wire.
+        """
+        return sum(content.total_bytes for content in self.responses)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Builds an aiohttp trace config that counts the received response body bytes.
+
+        The bodies are counted by their stream readers, so both `response.json()` and the chunked reading
+        of streamed responses are taken into account. The readers get the body after decompression.
+
+        Returns:
+            aiohttp.TraceConfig: A trace config for `aiohttp.ClientSession(trace_configs=[...])`.
+        """
+
+        async def on_request_end(session, context, params):
+            self.responses.append(params.response.content)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def report(self) -> dict:
+        """
+        Builds the report of all recorded stages.
+
+        Returns:
+            dict: The stages, the totals of the run and the received body bytes.
+
+        Examples:
+            profiler.report()
+            {'stages': [{'name': 'fetch', 'wall': 3.2, 'cpu': 1.9, 'rows': 2100000, ...}, ...],
+             'total': {'wall': 9.4, 'cpu': 7.8, 'peak_rss': 1894649856}, 'body_bytes': 412345678}
+        """
+        return {
+            "stages": [dataclasses.asdict(record) for record in self.stages],
+            "total": {
+                "wall": time.perf_counter() - self.started,
+                "cpu": cpu_time() - self.started_cpu,
+                "peak_rss": peak_rss(),
+            },
+            "body_bytes": self.body_bytes,
+        }
+
+    def format_report(self) -> str:
+        """
+        Formats the report as a table for the console.
+
+        Returns:
+            str: One line per stage with the times, rows, bytes, the peak memory of the stage and the peak memory
+                 of the process so far, and a line with the totals.
+        """
+        report = self.report()
+        lines = [
+            f"\t{'stage':<14}{'wall, s':>10}{'cpu, s':>10}{'rows':>14}{'bytes':>16}"
+            f"{'stage peak, MiB':>17}{'process peak, MiB':>19}"
+        ]
+        for stage in report["stages"]:
+            rows = f"{stage['rows']:,}" if stage["rows"] is not None else "-"
+            size = f"{stage['bytes']:,}" if stage["bytes"] is not None else "-"
+            stage_peak = f"{stage['stage_peak_rss'] / 1024**2:.1f}" if stage["stage_peak_rss"] is not None else "-"
+            lines.append(
+                f"\t{stage['name']:<14}{stage['wall']:>10.3f}{stage['cpu']:>10.3f}{rows:>14}{size:>16}"
+                f"{stage_peak:>17}{stage['peak_rss'] / 1024**2:>19.1f}"
+            )
+        total = report["total"]
+        lines.append(
+            f"\t{'total':<14}{total['wall']:>10.3f}{total['cpu']:>10.3f}{'':>14}"
+            f"{report['body_bytes']:>16,}{'':>17}{total['peak_rss'] / 1024**2:>19.1f}"
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str) -> None:
+        """
+        Saves the report as JSON.
+
+        Args:
+            path (str): The report file path.
+        """
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=4)
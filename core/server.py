@@ -0,0 +1,393 @@
+import asyncio
+import dataclasses
+import json
+import re
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiohttp
+from aiohttp import web
+
+from core.cache import SnapshotCache
+from core.classes import INTEGER_FIELDS, PACKAGE_FIELDS, STRING_FIELDS, PackageTable, StringPool, TableIndex
+from core.data_extractor import merge_variant
+from core.fingerprint import TableFingerprint
+from core.parse_data import API_URL, FetchError, HttpOptions, PackageFilter, create_session, get_packages_async
+from core.snapshot import MappedSnapshot
+from core.utils import colorize_text, create_response
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_REFRESH_INTERVAL = 3600
+RESULT_CACHE_SIZE = 64
+MAX_BRANCHES = 16
+BRANCH_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._+-]{0,63}")
+REFRESH_TASK = web.AppKey("refresh", asyncio.Task)
+
+
+@dataclasses.dataclass()
+class BranchSnapshot:
+    """
+    An indexed branch kept in memory by the comparison service.
+
+    Attributes:
+        branch (str): The branch name.
+        table (PackageTable): The packages of the branch, in the string pool of the service.
+        index (TableIndex): The (name, arch) index of the table.
+        version (int): The snapshot version, it changes only when the packages of the branch change.
+        loaded_at (float): The UNIX time the snapshot was last fetched or confirmed.
+        arch_indexes (dict): The indexes of the rows of single architectures, built on the first request for
+            an architecture, see `arch_index`.
+    """
+
+    branch: str
+    table: PackageTable
+    index: TableIndex
+    version: int
+    loaded_at: float
+    arch_indexes: dict = dataclasses.field(default_factory=dict, repr=False)
+
+    def arch_index(self, arch: str) -> TableIndex:
+        """
+        Returns the index of the rows of one architecture, so a comparison joins only those rows.
+
+        Args:
+            arch (str): The architecture.
+
+        Returns:
+            TableIndex: The index of the rows of the architecture, empty if the table has none.
+        """
+        index = self.arch_indexes.get(arch)
+        if index is None:
+            code = self.table.pool.codes.get(arch)
+            rows = array("I", (row for row, value in enumerate(self.table.arch) if value == code))
+            index = TableIndex.build(self.table, rows)
+            # Only the architectures of the pool are kept, so unknown ones from requests do not pile up.
+            if code is not None:
+                self.arch_indexes[arch] = index
+        return index
+
+
+def same_table(first: PackageTable, second: PackageTable) -> bool:
+    """
+    Checks whether two tables of the same string pool hold the same packages in the same order.
+
+    Args:
+        first (PackageTable): The first table.
+        second (PackageTable): The second table.
+
+    Returns:
+        bool: True if every column is equal.
+    """
+    return all(getattr(first, field) == getattr(second, field) for field in PACKAGE_FIELDS)
+
+
+class ComparisonService:
+    """
+    Keeps indexed branches in memory and answers comparison requests from them.
+
+    A branch is fetched and indexed on the first request for it, then it is refreshed in the background
+    every `refresh_interval` seconds. A refresh that brings the same packages keeps the snapshot version,
+    so the cached results stay valid. Comparison results are cached per branch pair, snapshot versions and
+    architecture as serialized JSON, a repeated request is answered without any computation.
+
+    At most `max_branches` branches are kept, the least recently requested one is dropped when another one is
+    loaded. All tables share one string pool, so the snapshots of any two branches can be compared directly.
+    The strings of dropped and replaced snapshots stay in the pool until it is compacted: once as many tables
+    were dropped as there are loaded branches, all tables are encoded into a new pool.
+
+    Examples:
+        service = ComparisonService(cache=SnapshotCache("~/.cache/compare_packages"))
+        body = await service.compare("p10", "sisyphus", arch="x86_64")
+    """
+
+    def __init__(
+        self,
+        cache: SnapshotCache | None = None,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        stream: bool = False,
+        offline: bool = False,
+        base_url: str = API_URL,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        options: HttpOptions | None = None,
+        package_filter: PackageFilter | None = None,
+        max_branches: int = MAX_BRANCHES,
+    ):
+        if max_branches < 2:
+            raise ValueError("The service has to keep at least two branches")
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.stream = stream
+        self.offline = offline
+        self.base_url = base_url
+        self.result_cache_size = result_cache_size
+        self.options = options
+        self.package_filter = package_filter
+        self.max_branches = max_branches
+        self.session = None
+        self.pool = StringPool()
+        self.snapshots = OrderedDict()
+        self.results = OrderedDict()
+        self._locks = {}
+        self._pool_lock = asyncio.Lock()
+        self._version = 0
+        self._dropped = 0
+
+    async def open(self) -> None:
+        """
+        Creates the HTTP session shared by all fetches of the service.
+        """
+        self.session = create_session(self.options)
+
+    async def close(self) -> None:
+        """
+        Closes the HTTP session of the service.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def load(self, branch: str) -> BranchSnapshot:
+        """
+        Fetches and indexes a branch, keeping the current snapshot if the packages did not change.
+
+        Args:
+            branch (str): The branch name.
+
+        Returns:
+            BranchSnapshot: The current snapshot of the branch.
+
+        Raises:
+            FetchError: If the branch can not be fetched.
+            aiohttp.ClientError: If the API can not be reached.
+        """
+        async with self._branch_lock(branch):
+            return await self._load(branch)
+
+    @asynccontextmanager
+    async def _branch_lock(self, branch: str) -> AsyncIterator[None]:
+        # A lock is kept while its branch is loaded or someone waits for it, so the requests for branches that
+        # fail to load do not leave locks behind.
+        lock, users = self._locks.get(branch, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[branch] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[branch]
+            if users > 1 or branch in self.snapshots:
+                self._locks[branch] = (lock, users - 1)
+            else:
+                del self._locks[branch]
+
+    async def _load(self, branch: str) -> BranchSnapshot:
+        packages = await get_packages_async(
+            branch, self.stream, self.cache, self.offline, self.base_url, self.session, self.options,
+            self.package_filter,
+        )
+        # Tables are built in a worker thread, one at a time: the string pool is shared and it is replaced when
+        # it is compacted.
+        async with self._pool_lock:
+            if isinstance(packages, MappedSnapshot):
+                table = await asyncio.to_thread(packages.table, self.pool)
+            else:
+                table = await asyncio.to_thread(PackageTable.from_records, packages, self.pool)
+            del packages
+            current = self.snapshots.get(branch)
+            if current is not None and same_table(current.table, table):
+                current.loaded_at = time.time()
+                return current
+            index = await asyncio.to_thread(TableIndex.build, table)
+            if table.fingerprint is None:
+                # Binary snapshots bring their fingerprints, other tables are hashed once per version.
+                table.fingerprint = await asyncio.to_thread(TableFingerprint.build, table)
+            self._version += 1
+            snapshot = BranchSnapshot(branch, table, index, self._version, time.time())
+            if current is not None:
+                self._dropped += 1
+            self.snapshots[branch] = snapshot
+            self.snapshots.move_to_end(branch)
+            while len(self.snapshots) > self.max_branches:
+                dropped, _ = self.snapshots.popitem(last=False)
+                self._dropped += 1
+                if self._locks.get(dropped, (None, 1))[1] == 0:
+                    del self._locks[dropped]
+            if self._dropped >= len(self.snapshots):
+                self.pool, compacted = await asyncio.to_thread(self._compacted, list(self.snapshots.values()))
+                self.snapshots.update(compacted)
+                self._dropped = 0
+                snapshot = self.snapshots[branch]
+        return snapshot
+
+    @staticmethod
+    def _compacted(snapshots: list) -> tuple:
+        # Encodes the tables of the snapshots into a new pool. The snapshots are replaced, not changed, so
+        # a comparison that already holds the old ones finishes with the old pool.
+        pool = StringPool()
+        compacted_snapshots = {}
+        for snapshot in snapshots:
+            table = snapshot.table
+            strings = table.pool.strings
+            columns = {field: getattr(table, field) for field in INTEGER_FIELDS}
+            for field in STRING_FIELDS:
+                codes = getattr(table, field)
+                translation = {code: pool.encode(strings[code]) for code in dict.fromkeys(codes)}
+                columns[field] = array("I", map(translation.__getitem__, codes))
+            compacted = PackageTable.from_columns(columns, pool)
+            # The fingerprints do not depend on the codes, only their grouping of the rows does.
+            compacted.fingerprint = dataclasses.replace(table.fingerprint)
+            compacted_snapshots[snapshot.branch] = dataclasses.replace(
+                snapshot, table=compacted, index=TableIndex.build(compacted), arch_indexes={}
+            )
+        return pool, compacted_snapshots
+
+    async def snapshot(self, branch: str) -> BranchSnapshot:
+        """
+        Returns the snapshot of a branch, loading it on the first request.
+
+        Concurrent first requests for the same branch wait for a single load.
+
+        Args:
+            branch (str): The branch name.
+
+        Returns:
+            BranchSnapshot: The current snapshot of the branch.
+        """
+        snapshot = self.snapshots.get(branch)
+        if snapshot is None:
+            async with self._branch_lock(branch):
+                snapshot = self.snapshots.get(branch) or await self._load(branch)
+        else:
+            self.snapshots.move_to_end(branch)
+        return snapshot
+
+    async def refresh(self) -> None:
+        """
+        Refreshes all loaded branches in the background, forever.
+
+        A failed refresh keeps the previous snapshot and is retried on the next round.
+        """
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for branch in list(self.snapshots):
+                if branch not in self.snapshots:
+                    continue
+                try:
+                    await self.load(branch)
+                except Exception as error:
+                    sys.stdout.write(f"\t{colorize_text('red', f'Failed to refresh {branch}: {error}')}\n")
+
+    async def compare(self, branch1: str, branch2: str, arch: str | None = None) -> bytes:
+        """
+        Compares two branches from their in-memory snapshots.
+
+        Args:
+            branch1 (str): The first branch name.
+            branch2 (str): The second branch name, the branch in which newer versions are searched.
+            arch (str | None): Return only the packages of this architecture.
+
+        Returns:
+            bytes: The JSON response, see `core.utils.create_response`.
+
+        Examples:
+            json.loads(await service.compare("p10", "sisyphus", "noarch"))["result"].keys()
+            dict_keys(['first_package', 'second_package', 'newer_versions_first_package'])
+        """
+        first, second = await asyncio.gather(self.snapshot(branch1), self.snapshot(branch2))
+        while first.table.pool is not second.table.pool:
+            # The pool was compacted while the other branch was loaded.
+            first, second = await asyncio.gather(self.snapshot(branch1), self.snapshot(branch2))
+        key = (branch1, first.version, branch2, second.version, arch)
+        body = self.results.get(key)
+        if body is None:
+            body = await asyncio.to_thread(self._compare, first, second, arch)
+            self.results[key] = body
+            while len(self.results) > self.result_cache_size:
+                self.results.popitem(last=False)
+        else:
+            self.results.move_to_end(key)
+        return body
+
+    def _compare(self, first: BranchSnapshot, second: BranchSnapshot, arch: str | None) -> bytes:
+        if arch is None:
+            sorted_data = merge_variant(first.table, second.table, first.index, second.index)
+        else:
+            # A key contains the architecture, so joining only its rows gives the same result as filtering.
+            sorted_data = merge_variant(first.table, second.table, first.arch_index(arch), second.arch_index(arch))
+        tables = (first.table, second.table, second.table)
+        response = create_response([table.records(rows) for table, rows in zip(tables, sorted_data)])
+        return json.dumps(response, ensure_ascii=False).encode()
+
+    def status(self) -> dict:
+        """
+        Describes the loaded branches.
+
+        Returns:
+            dict: Maps every loaded branch to its snapshot version, number of packages, load time and the
+                  fingerprint of every architecture (see `TableFingerprint.arch_digests`).
+        """
+        return {
+            branch: {
+                "version": snapshot.version,
+                "packages": len(snapshot.table),
+                "loaded_at": snapshot.loaded_at,
+                "arches": snapshot.table.fingerprint.arch_digests(),
+            }
+            for branch, snapshot in self.snapshots.items()
+        }
+
+
+def create_app(service: ComparisonService, preload: list | None = None) -> web.Application:
+    """
+    Creates the web application of the comparison service.
+
+    Routes:
+        GET /compare?branch1=&branch2=&arch= - the comparison of two branches (arch is optional). Branch names
+            have to match `BRANCH_PATTERN`, a branch that can not be fetched is answered with 502.
+        GET /branches - the loaded branches and their snapshot versions.
+
+    Args:
+        service (ComparisonService): The service that keeps the branches.
+        preload (list | None): Branches to load when the application starts.
+
+    Returns:
+        web.Application: The application, e.g. for `web.run_app`.
+    """
+
+    async def compare(request: web.Request) -> web.Response:
+        branch1 = request.query.get("branch1")
+        branch2 = request.query.get("branch2")
+        if not branch1 or not branch2:
+            return web.json_response({"error": "branch1 and branch2 are required"}, status=400)
+        if not (BRANCH_PATTERN.fullmatch(branch1) and BRANCH_PATTERN.fullmatch(branch2)):
+            return web.json_response({"error": "invalid branch name"}, status=400)
+        try:
+            body = await service.compare(branch1, branch2, request.query.get("arch") or None)
+        except (FetchError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            return web.json_response({"error": str(error) or type(error).__name__}, status=502)
+        return web.Response(body=body, content_type="application/json")
+
+    async def branches(request: web.Request) -> web.Response:
+        return web.json_response(service.status())
+
+    async def start_refresh(app: web.Application) -> None:
+        await service.open()
+        if preload:
+            await asyncio.gather(*(service.load(branch) for branch in dict.fromkeys(preload)))
+        app[REFRESH_TASK] = asyncio.create_task(service.refresh())
+
+    async def stop_refresh(app: web.Application) -> None:
+        app[REFRESH_TASK].cancel()
+        await service.close()
+
+    app = web.Application()
+    app.router.add_get("/compare", compare)
+    app.router.add_get("/branches", branches)
+    app.on_startup.append(start_refresh)
+    app.on_cleanup.append(stop_refresh)
+    return app
@@ -0,0 +1,194 @@
+import itertools
+from array import array
+from collections.abc import Sequence
+from multiprocessing import shared_memory
+
+from core.classes import COLUMN_TYPES, PackageTable, StringPool
+
+SHARD_FIELDS = ("name", "arch", "epoch", "version", "release")
+ALIGNMENT = 8
+
+
+class SharedStrings(Sequence):
+    """
+    The strings of a string pool stored in a shared buffer as UTF-8, decoded only when they are read.
+
+    It stands in for `StringPool.strings` in the worker processes, so the pool is neither pickled nor copied
+    into every process: a worker decodes just the versions and releases it compares.
+
+    Args:
+        data (memoryview): The encoded strings, one after another.
+        offsets (memoryview): The start of every string in `data` and the end of the last one.
+    """
+
+    def __init__(self, data: memoryview, offsets: memoryview):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        return str(self.data[self.offsets[code]:self.offsets[code + 1]], "utf-8", "surrogatepass")
+
+
+class SharedShards:
+    """
+    The compared columns of two tables, their string pool and the row numbers of the shards, placed once in a
+    shared memory block.
+
+    The columns are copied into the block as they are, with one memory copy each, and the row numbers of both
+    tables are written shard after shard (see `core.data_extractor.split_shards`), so every shard is a
+    contiguous range of them. A worker process attaches to the block once, a task is just the shard number:
+    the worker reads the rows of its shard straight from the shared columns into its own compact tables, so
+    nothing is pickled, and the gathering of the shards runs in parallel instead of in the parent process.
+
+    The process that creates the block owns it: the block is removed when the `with` block of the owner ends.
+
+    Attributes:
+        memory (shared_memory.SharedMemory): The shared block.
+        layout (dict): Maps every section ("offsets", "strings", "<side>.rows", "<side>.<field>") to its
+            (offset, typecode, length) in the block; side 0 is the first table, side 1 the second one.
+        bounds (list): The (first_start, first_end, second_start, second_end) row range of every shard.
+
+    Examples:
+        with SharedShards.create(table1, table2, split_shards(table1, table2, 8)) as shared:
+            with Pool(4, initializer=init_shard_worker, initargs=shared.worker_args()) as pool:
+                pool.map(diff_shard, range(len(shared.bounds)))
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, layout: dict, bounds: list, owner: bool = False):
+        self.memory = memory
+        self.layout = layout
+        self.bounds = bounds
+        self.owner = owner
+        self.pool = None
+        self.views = None
+
+    @classmethod
+    def create(cls, first_package: PackageTable, second_package: PackageTable, shards: list) -> "SharedShards":
+        """
+        Copies the shards of two tables into a new shared memory block.
+
+        Args:
+            first_package (PackageTable): The first package table.
+            second_package (PackageTable): The second package table, sharing the string pool of the first one.
+            shards (list): (first_rows, second_rows) pairs of row number arrays, see `split_shards`.
+
+        Returns:
+            SharedShards: The owner of the block.
+        """
+        encoded = [string.encode("utf-8", "surrogatepass") for string in first_package.pool.strings]
+        offsets = array("Q", itertools.accumulate(map(len, encoded), initial=0))
+        strings = b"".join(encoded)
+        del encoded
+        tables = (first_package, second_package)
+        orders = []
+        starts = []
+        for side in range(2):
+            rows = array("I")
+            for shard in shards:
+                rows.extend(shard[side])
+            orders.append(rows)
+            starts.append(list(itertools.accumulate((len(shard[side]) for shard in shards), initial=0)))
+        bounds = [
+            (starts[0][number], starts[0][number + 1], starts[1][number], starts[1][number + 1])
+            for number in range(len(shards))
+        ]
+
+        sections = {"offsets": ("Q", len(offsets)), "strings": ("B", len(strings))}
+        for side, table in enumerate(tables):
+            sections[f"{side}.rows"] = ("I", len(orders[side]))
+            for field in SHARD_FIELDS:
+                sections[f"{side}.{field}"] = (COLUMN_TYPES[field], len(table))
+        layout = {}
+        size = 0
+        for section, (typecode, length) in sections.items():
+            layout[section] = (size, typecode, length)
+            size += -(-length * array(typecode).itemsize // ALIGNMENT) * ALIGNMENT
+
+        shared = cls(shared_memory.SharedMemory(create=True, size=max(size, 1)), layout, bounds, owner=True)
+        try:
+            shared._write("offsets", offsets)
+            shared._write("strings", strings)
+            for side, table in enumerate(tables):
+                shared._write(f"{side}.rows", orders[side])
+                for field in SHARD_FIELDS:
+                    shared._write(f"{side}.{field}", getattr(table, field))
+        except BaseException:
+            shared.close()
+            raise
+        return shared
+
+    @classmethod
+    def attach(cls, name: str, layout: dict, bounds: list) -> "SharedShards":
+        """
+        Attaches to a block created by another process, see `worker_args`.
+
+        Args:
+            name (str): The name of the shared memory block.
+            layout (dict): The layout of the block.
+            bounds (list): The row ranges of the shards.
+
+        Returns:
+            SharedShards: A view of the block, it is never removed by this process.
+        """
+        return cls(shared_memory.SharedMemory(name=name), layout, bounds)
+
+    def worker_args(self) -> tuple:
+        """
+        Returns the arguments of `attach` for the worker processes.
+        """
+        return self.memory.name, self.layout, self.bounds
+
+    def _view(self, section: str) -> memoryview:
+        offset, typecode, length = self.layout[section]
+        return self.memory.buf[offset:offset + length * array(typecode).itemsize].cast(typecode)
+
+    def _write(self, section: str, data) -> None:
+        with self._view(section) as target:
+            target[:] = data
+
+    def shard(self, number: int) -> tuple:
+        """
+        Builds the tables of a shard from the shared columns.
+
+        Args:
+            number (int): The shard number.
+
+        Returns:
+            tuple: (first_rows, first_table, second_rows, second_table), where the rows are the original row
+                   numbers of the shard in both tables and the tables hold only the rows of the shard.
+        """
+        if self.views is None:
+            self.pool = StringPool()
+            self.pool.strings = SharedStrings(self._view("strings"), self._view("offsets"))
+            self.views = {section: self._view(section) for section in self.layout if "." in section}
+        first_start, first_end, second_start, second_end = self.bounds[number]
+        result = []
+        for side, start, end in ((0, first_start, first_end), (1, second_start, second_end)):
+            rows = self.views[f"{side}.rows"][start:end]
+            columns = {}
+            for field in SHARD_FIELDS:
+                view = self.views[f"{side}.{field}"]
+                columns[field] = array(view.format, map(view.__getitem__, rows))
+            result += [rows, PackageTable.from_columns(columns, self.pool)]
+        return tuple(result)
+
+    def close(self) -> None:
+        """
+        Detaches from the block, the owner also removes it. The rows returned by `shard` must not be used after it.
+        """
+        if self.views is not None:
+            for view in (*self.views.values(), self.pool.strings.data, self.pool.strings.offsets):
+                view.release()
+            self.views = self.pool = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self) -> "SharedShards":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
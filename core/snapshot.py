@@ -0,0 +1,363 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+
+from core.classes import COLUMN_TYPES, PACKAGE_FIELDS, STRING_FIELDS, PackageTable, StringPool
+from core.fingerprint import TableFingerprint
+
+MAGIC = b"PKGSNAP\x00"
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<8sIIQQQQQQQ")
+PARTITION_FIELDS = 6
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+HASH_MASK = (1 << 64) - 1
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+def _slot(key: int, bits: int) -> int:
+    return ((key * HASH_MULTIPLIER) & HASH_MASK) >> (64 - bits)
+
+
+def _hash_index(keys: list) -> array:
+    # An open addressing table with linear probing: slot -> position of the key + 1, 0 marks an empty slot.
+    bits = max(1, (2 * len(keys)).bit_length())
+    mask = (1 << bits) - 1
+    index = array("I", bytes(4 << bits))
+    for position, key in enumerate(keys):
+        slot = _slot(key, bits)
+        while index[slot]:
+            slot = (slot + 1) & mask
+        index[slot] = position + 1
+    return index
+
+
+def write_snapshot(path: str | Path, table: PackageTable) -> None:
+    """
+    Writes a package table in the binary snapshot format.
+
+    The file consists of a header, a string table (offsets and a UTF-8 blob) with the strings used by the table,
+    an open addressing hash index of the strings by the CRC-32 of their bytes, one fixed-width column per package
+    field (string codes as 32-bit and integers as 64-bit numbers in native byte order), an open addressing hash
+    index that maps every (name, arch) key to its first row and the fingerprints of the table (see
+    `core.fingerprint`): the 16-bit bucket of every row and one record of `PARTITION_FIELDS` 64-bit numbers per
+    partition (arch, bucket, rows, duplicates, low and high digest half).
+    The fingerprints are computed here unless the table already has them, so they are hashed once per snapshot.
+    Every section starts at an 8-byte boundary, so all of them can be used straight from a memory map.
+    The file is written to a temporary name and replaces the previous snapshot atomically.
+
+    Args:
+        path (str | Path): The snapshot file.
+        table (PackageTable): The table to store.
+
+    Examples:
+        write_snapshot("/tmp/cache/sisyphus.snapshot", table)
+    """
+    rows = len(table)
+    used = sorted(set().union(*(set(getattr(table, field)) for field in STRING_FIELDS)))
+    local = {code: position for position, code in enumerate(used)}
+    strings = [table.pool.strings[code].encode() for code in used]
+    offsets = array("Q", [0])
+    for value in strings:
+        offsets.append(offsets[-1] + len(value))
+    blob = b"".join(strings)
+    string_index = _hash_index(list(map(zlib.crc32, strings)))
+
+    columns = {}
+    for field in PACKAGE_FIELDS:
+        if field in STRING_FIELDS:
+            columns[field] = array("I", map(local.__getitem__, getattr(table, field)))
+        else:
+            columns[field] = array("q", getattr(table, field))
+
+    first_rows = {}
+    for row, (name, arch) in enumerate(zip(columns["name"], columns["arch"])):
+        first_rows.setdefault(name << 32 | arch, row)
+    # The positions of the keys in the table are turned into their first rows.
+    key_index = _hash_index(list(first_rows))
+    rows_of_keys = list(first_rows.values())
+    index = array("I", (position and rows_of_keys[position - 1] + 1 for position in key_index))
+
+    fingerprint = table.fingerprint if table.fingerprint is not None else TableFingerprint.build(table)
+    arch_codes = {table.pool.strings[code]: local[code] for code in set(table.arch)}
+    partitions = array("Q")
+    for (arch, bucket), (digest, partition_rows, duplicates) in fingerprint.partitions.items():
+        partitions.extend((arch_codes[arch], bucket, partition_rows, duplicates, digest & HASH_MASK, digest >> 64))
+    row_buckets = fingerprint.row_buckets.tobytes()
+
+    path = Path(path)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, 0, rows, len(strings), len(blob), len(string_index), len(index),
+                fingerprint.buckets, len(fingerprint.partitions),
+            ))
+            file.write(offsets.tobytes())
+            file.write(blob + bytes(_padding(len(blob))))
+            file.write(string_index.tobytes() + bytes(_padding(4 * len(string_index))))
+            for field in PACKAGE_FIELDS:
+                data = columns[field].tobytes()
+                file.write(data + bytes(_padding(len(data))))
+            file.write(index.tobytes())
+            file.write(row_buckets + bytes(_padding(len(row_buckets))))
+            file.write(partitions.tobytes())
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+class MappedSnapshot:
+    """
+    A binary snapshot opened with `mmap`, see `write_snapshot`.
+
+    Opening a snapshot reads only its header, the sections are paged in by the operating system when
+    they are used. Single packages are found with the hash indexes, comparing the bytes of the name and the
+    architecture with the string blob, and decoded without loading anything else. `table` turns the snapshot
+    into a `PackageTable` of a shared string pool for the comparison engines: the columns are read from the
+    memory map, only string columns that need other codes are translated.
+
+    Examples:
+        with MappedSnapshot("/tmp/cache/sisyphus.snapshot") as snapshot:
+            snapshot.record(snapshot.find("bash", "x86_64"))
+        {'name': 'bash', 'epoch': 0, 'version': '5.2.15', 'release': 'alt1', 'arch': 'x86_64', ...}
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if len(view) < HEADER.size or HEADER.unpack_from(view)[:2] != (MAGIC, FORMAT_VERSION):
+            view.release()
+            self._map.close()
+            raise ValueError(f"{self.path} is not a package snapshot of version {FORMAT_VERSION}")
+        rows, string_count, blob_size, string_capacity, capacity, buckets, partitions = HEADER.unpack_from(view)[3:]
+        self.rows = rows
+        self.capacity = capacity
+        self.string_capacity = string_capacity
+        position = HEADER.size
+        self._offsets = view[position: position + 8 * (string_count + 1)].cast("Q")
+        position += 8 * (string_count + 1)
+        self._blob = view[position: position + blob_size]
+        position += blob_size + _padding(blob_size)
+        self._string_index = view[position: position + 4 * string_capacity].cast("I")
+        position += 4 * string_capacity + _padding(4 * string_capacity)
+        self._columns = {}
+        for field in PACKAGE_FIELDS:
+            size = rows * struct.calcsize(COLUMN_TYPES[field])
+            self._columns[field] = view[position: position + size].cast(COLUMN_TYPES[field])
+            position += size + _padding(size)
+        self._index = view[position: position + 4 * capacity].cast("I")
+        position += 4 * capacity
+        self.buckets = buckets
+        self._row_buckets = view[position: position + 2 * rows].cast("H")
+        position += 2 * rows + _padding(2 * rows)
+        self._partitions = view[position: position + 8 * PARTITION_FIELDS * partitions].cast("Q")
+        self._views = [
+            view, self._offsets, self._blob, self._string_index, self._index, self._row_buckets, self._partitions,
+            *self._columns.values(),
+        ]
+        self._strings = None
+        self.selection = None
+
+    def __enter__(self) -> "MappedSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Releases the memory map. Tables built with `table` stay valid: while they use columns of the map, it is
+        unmapped only when the last of them is gone.
+        """
+        for view in reversed(self._views):
+            view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def __len__(self) -> int:
+        return self.rows if self.selection is None else len(self.selection)
+
+    def select(self, rows: array) -> "MappedSnapshot":
+        """
+        Restricts the rows that `table` converts, e.g. to the packages selected by a filter.
+
+        Args:
+            rows (array): The numbers of the selected rows, in ascending order.
+
+        Returns:
+            MappedSnapshot: The snapshot itself.
+        """
+        self.selection = rows
+        return self
+
+    @property
+    def strings(self) -> list:
+        """
+        The whole string table, decoded on first use. Single strings are decoded with `string`.
+        """
+        if self._strings is None:
+            blob = self._blob
+            offsets = self._offsets
+            self._strings = [str(blob[offsets[i]: offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def string(self, code: int) -> str:
+        """
+        Decodes one string of the string table.
+
+        Args:
+            code (int): The position of the string, as stored in the string columns.
+
+        Returns:
+            str: The string.
+        """
+        if self._strings is not None:
+            return self._strings[code]
+        return str(self._blob[self._offsets[code]: self._offsets[code + 1]], "utf-8")
+
+    def string_code(self, value: str) -> int | None:
+        """
+        Finds the position of a string with the string hash index, comparing bytes with the blob.
+
+        Args:
+            value (str): The string.
+
+        Returns:
+            int | None: The position of the string in the string table, or None if the snapshot does not use it.
+        """
+        data = value.encode("utf-8", "surrogatepass")
+        offsets = self._offsets
+        bits = self.string_capacity.bit_length() - 1
+        mask = self.string_capacity - 1
+        slot = _slot(zlib.crc32(data), bits)
+        while position := self._string_index[slot]:
+            code = position - 1
+            if self._blob[offsets[code]: offsets[code + 1]] == data:
+                return code
+            slot = (slot + 1) & mask
+        return None
+
+    def column(self, field: str) -> memoryview:
+        """
+        Returns a column straight from the memory map, string columns hold positions in `strings`.
+
+        Args:
+            field (str): The package field.
+
+        Returns:
+            memoryview: The column values, without copying.
+        """
+        return self._columns[field]
+
+    def find(self, name: str, arch: str) -> int | None:
+        """
+        Finds the first row of a package with the hash index.
+
+        Args:
+            name (str): The package name.
+            arch (str): The architecture.
+
+        Returns:
+            int | None: The row number, or None if there is no such package.
+        """
+        name_code = self.string_code(name)
+        arch_code = self.string_code(arch)
+        if name_code is None or arch_code is None:
+            return None
+        bits = self.capacity.bit_length() - 1
+        mask = self.capacity - 1
+        slot = _slot(name_code << 32 | arch_code, bits)
+        names = self._columns["name"]
+        arches = self._columns["arch"]
+        while row := self._index[slot]:
+            if names[row - 1] == name_code and arches[row - 1] == arch_code:
+                return row - 1
+            slot = (slot + 1) & mask
+        return None
+
+    def record(self, index: int) -> dict:
+        """
+        Decodes a row into the package dictionary.
+
+        Args:
+            index (int): The row number.
+
+        Returns:
+            dict: The package dictionary with the fields in API order.
+        """
+        return {
+            field: self.string(column[index]) if field in STRING_FIELDS else column[index]
+            for field, column in self._columns.items()
+        }
+
+    def fingerprint(self) -> TableFingerprint:
+        """
+        Reads the fingerprints stored with the snapshot.
+
+        Returns:
+            TableFingerprint: The fingerprints of all rows of the snapshot, regardless of `select`.
+        """
+        arches = {}
+        partitions = {}
+        records = self._partitions
+        for start in range(0, len(records), PARTITION_FIELDS):
+            arch, bucket, rows, duplicates, low, high = records[start: start + PARTITION_FIELDS]
+            if arch not in arches:
+                arches[arch] = self.string(arch)
+            partitions[(arches[arch], bucket)] = (high << 64 | low, rows, bool(duplicates))
+        row_buckets = array("H")
+        row_buckets.frombytes(self._row_buckets.cast("B"))
+        return TableFingerprint(self.buckets, row_buckets, partitions)
+
+    def table(self, pool: StringPool | None = None) -> PackageTable:
+        """
+        Converts the snapshot into a package table encoded with the given pool.
+
+        The string columns are translated into the codes of the pool, so the table can be compared with the
+        tables of other branches. If the pool is empty, the codes are the same. Columns that need no translation
+        are memoryviews of the memory map (see `column`), so the engines read them without a copy, and the map
+        stays open while the table uses it. Only the rows given to `select` are converted, if any, into new
+        arrays; otherwise the table gets the stored fingerprints.
+
+        Args:
+            pool (StringPool | None): The shared string pool.
+
+        Returns:
+            PackageTable: The table of the snapshot.
+        """
+        pool = pool if pool is not None else StringPool()
+        if self.selection is not None:
+            rows = self.selection
+            strings = self.strings
+            columns = {
+                field: array(
+                    COLUMN_TYPES[field],
+                    map(pool.encode, map(strings.__getitem__, map(column.__getitem__, rows)))
+                    if field in STRING_FIELDS else map(column.__getitem__, rows),
+                )
+                for field, column in self._columns.items()
+            }
+            return PackageTable.from_columns(columns, pool)
+        identity = len(pool) == 0
+        translation = list(map(pool.encode, self.strings))
+        columns = {}
+        for field in PACKAGE_FIELDS:
+            column = self._columns[field]
+            if field in STRING_FIELDS and not identity:
+                columns[field] = array("I", map(translation.__getitem__, column))
+            else:
+                # A view of its own, `close` releases the views of the snapshot.
+                columns[field] = column[:]
+        table = PackageTable.from_columns(columns, pool)
+        table.fingerprint = self.fingerprint()
+        return table
@@ -1,9 +1,9 @@
-import multiprocessing
 import os
 import re
 from datetime import datetime
-from itertools import zip_longest
-from typing import Tuple
+from functools import lru_cache
+
+from core.classes import PackageTable
 
 
 def split_version_release(version_release: str) -> list:
@@ -28,52 +28,74 @@ def split_version_release(version_release: str) -> list:
     return result
 
 
-def data_preparation(version1: str, version2: str) -> tuple:
+# Symbols of a compiled version key. The end of a block sorts below everything at the first position of the block
+# and between words and numbers further on, the same way `compare_versions_release` has always ordered them.
+_WORD = 1
+_NUMBER = 3
+_EMPTY_BLOCK_END = (0,)
+_BLOCK_END = (2,)
+
+VERSION_KEY_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=VERSION_KEY_CACHE_SIZE)
+def version_key(version_release: str) -> tuple:
     """
-    Prepares data from version strings by splitting them into components.
+    Compiles a version or release string into a hashable comparison key.
+
+    The string is split into blocks by non-alphanumeric characters and every block into numbers and
+    lowercase words (see `split_version_release`). Keys are cached, so every distinct string is split only once.
 
     Args:
-        version1 (str): The first version as a string.
-        version2 (str): The second version as a string.
+        version_release (str): The version or release string.
 
     Returns:
-        tuple: A tuple containing two lists:
-            - A list of split components of the first version.
-            - A list of split components of the second version.
+        tuple: A tuple of blocks, each block is a tuple of (kind, value) symbols closed by an end marker.
+               Plain tuple comparison of keys orders the strings like `compare_versions_release`.
 
     Examples:
-        data_preparation("alt1.qa2", "alt1.p10.1")
-        ([['alt', 1], ['qa', 2]], [['alt', 1], ['p', 10], [1]])
+        version_key("1.2a")
+        (((3, 1), (2,)), ((3, 2), (1, 'a'), (2,)))
+        version_key("1.2a") == version_key("1-2A")
+        True
     """
-    data1 = re.split(r'[^a-zA-Z0-9]+', version1)
-    data2 = re.split(r'[^a-zA-Z0-9]+', version2)
-
-    fixed_data = [split_version_release(i) for i in data1]
-    fixed_data2 = [split_version_release(i) for i in data2]
-    return fixed_data, fixed_data2
+    blocks = [split_version_release(block) for block in re.split(r"[^a-zA-Z0-9]+", version_release)]
+    while blocks and not blocks[-1]:
+        blocks.pop()
+    return tuple(
+        tuple((_NUMBER, part) if isinstance(part, int) else (_WORD, part) for part in block)
+        + (_BLOCK_END if block else _EMPTY_BLOCK_END,)
+        for block in blocks
+    )
 
 
-def create_zip_data(fixed_data: tuple) -> list:
+def compare_version_keys(key1: tuple, key2: tuple, release: bool = False) -> bool:
     """
-    Creates a list where pairs of elements from two lists are combined into tuples.
+    Compares two compiled version keys, see `compare_versions_release` for the meaning of the result.
 
     Args:
-        fixed_data (tuple): A tuple containing two lists to be zipped together.
+        key1 (tuple): The key of the first version string, from `version_key`.
+        key2 (tuple): The key of the second version string.
+        release (bool): Whether releases are compared, it defines the result for equal keys.
 
     Returns:
-        list: A list where each element is a list of tuples,
-              combining elements from both lists.
-              If one list is shorter, None will be substituted.
+        bool: True if the first version is larger than the second one (or equal to it when comparing versions).
 
     Examples:
-        create_zip_data(([['alt', 1], ['qa', 2]], [['alt', 1], [15]]))
-        [[('alt', 'alt'), (1, None)], [('qa', None), (2, None)]]
+        compare_version_keys(version_key("1.2.3"), version_key("1.2.2"))
+        True
     """
-    zip_data = [
-        list(zip_longest(r1 or [], r2 or [], fillvalue=None))
-        for r1, r2 in zip_longest(fixed_data[0], fixed_data[1], fillvalue=None)
-    ]
-    return zip_data
+    if key1 == key2:
+        return not release
+    if key1 < key2:
+        return False
+    # A block that continues with a number after the common part is not considered larger than the shorter one.
+    for block1, block2 in zip(key1, key2):
+        if block1 != block2:
+            for symbol1, symbol2 in zip(block1, block2):
+                if symbol1 != symbol2:
+                    return not (symbol2 == _BLOCK_END and symbol1[0] == _NUMBER)
+    return True
 
 
 def compare_versions_release(version1: str, version2: str, release: bool = False) -> bool:
@@ -95,137 +117,94 @@ def compare_versions_release(version1: str, version2: str, release: bool = False
         compare_versions("1.2.3", "1.2.4")
         False
     """
-    fixed_data = data_preparation(version1, version2)
-
-    zip_data = create_zip_data(fixed_data)
-
-    this_start = True
-
-    for block in zip_data:
-        for data in block:
-
-            if None in data:
-                if not this_start:
-                    return data[0] is None and isinstance(data[1], str)
-                else:
-                    return data[1] is None
-
-            if isinstance(data[0], int) and isinstance(data[1], int):
-                if data[0] == data[1]:
-                    this_start = False
-                    continue
-                return data[0] > data[1]
-
-            elif isinstance(data[0], str) and isinstance(data[1], str):
-                if data[0] == data[1]:
-                    this_start = False
-                    continue
-                return data[0] > data[1]
+    return compare_version_keys(version_key(version1), version_key(version2), release)
 
-            elif isinstance(data[0], int) and isinstance(data[1], str):
-                return True
-            elif isinstance(data[0], str) and isinstance(data[1], int):
-                return False
 
-        this_start = True
-    return False if release else True
-
-
-def generate_package_set(dict_list: list) -> dict:
+def generate_package_set(table: PackageTable, keys: list | None = None) -> dict:
     """
-    Generates a dictionary of package information from a list of dictionaries.
+    Generates an index of a package table by the (name, arch) key.
 
     Args:
-        dict_list (list): A list of dictionaries where each dictionary contains package details.
+        table (PackageTable): The package table to index.
+        keys (list | None): The result of `table.keys()`, if it has already been computed.
 
     Returns:
-        dict: A dictionary with package names and architectures as keys, and their respective details as values.
+        dict: A dictionary with packed (name, arch) keys (see `PackageTable.keys`) as keys and the number of
+              the first row with that key as values.
 
     Examples:
-        generate_package_set([
-             {"name": "pkg1", "arch": "x86_64", "epoch": 1, "version": "1.0", "release": "1"},
-             {"name": "pkg2", "arch": "arm", "epoch": 2, "version": "2.0", "release": "2"}
-         ])
-        {('pkg1', 'x86_64'): {'epoch': 1, 'version': '1.0', 'release': '1'},
-         ('pkg2', 'arm'): {'epoch': 2, 'version': '2.0', 'release': '2'}}
+        generate_package_set(PackageTable.from_records([
+             {"name": "pkg1", "arch": "x86_64", "epoch": 1, "version": "1.0", "release": "1", ...},
+             {"name": "pkg2", "arch": "arm", "epoch": 2, "version": "2.0", "release": "2", ...}
+         ]))
+        {3: 0, 21474836488: 1}
     """
-    package_dict = {}
-    for item in dict_list:
-        key = (item["name"], item["arch"])
-        if key not in package_dict:
-            package_dict[key] = {
-                "epoch": item["epoch"],
-                "version": item["version"],
-                "release": item["release"],
-            }
+    if keys is None:
+        keys = table.keys()
+    # Filled from the end, so the first row with a duplicate key is the one that remains.
+    package_dict = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
     return package_dict
 
 
-def worker(func, *args):
-    """
-    Executes a function with provided arguments.
-
-    Args:
-        func (callable): The function to be executed.
-        *args: The arguments to be passed to the function.
-
-    Returns:
-        The result of the function call.
-
-    Examples:
-        worker(sum, 1, 2, 3)
-        6
+def is_newer_package(table1: PackageTable, index1: int, table2: PackageTable, index2: int) -> bool:
     """
-    return func(*args)
+    Checks whether a package row has a larger epoch-version-release than a row of another table.
 
-
-def key_func_name(pkg) -> tuple:
-    """
-    Returns a tuple of package name and architecture.
+    The epoch must be at least the same, the version must be at least the same and the release must be larger,
+    see `compare_versions_release`.
 
     Args:
-        pkg (object): A package object with attributes `name` and `arch`.
+        table1 (PackageTable): The table of the package that is expected to be newer.
+        index1 (int): The row number in the first table.
+        table2 (PackageTable): The table of the package it is compared with, sharing the string pool.
+        index2 (int): The row number in the second table.
 
     Returns:
-        tuple: A tuple containing the package's name and architecture.
+        bool: True if the first package is newer.
 
     Examples:
-        class Package:
-             def __init__(self, name, arch):
-                 self.name = name
-                 self.arch = arch
-
-        pkg = Package("pkg1", "x86_64")
-        key_func_name(pkg)
-        ('pkg1', 'x86_64')
+        is_newer_package(sisyphus, 10, p10, 42)
+        True
     """
-    return (pkg.name, pkg.arch)
-
-
-def check_difficult(dict_list1: list, dict_list2: list) -> Tuple[bool, int]:
+    if table1.epoch[index1] < table2.epoch[index2]:
+        return False
+    version1, version2 = table1.version[index1], table2.version[index2]
+    release1, release2 = table1.release[index1], table2.release[index2]
+    # Equal codes mean equal strings: an equal version passes the check, an equal release does not.
+    if release1 == release2:
+        return False
+    strings = table1.pool.strings
+    if version1 != version2 and not compare_version_keys(
+        version_key(strings[version1]), version_key(strings[version2])
+    ):
+        return False
+    return compare_version_keys(version_key(strings[release1]), version_key(strings[release2]), release=True)
+
+
+def is_newer_version(epoch1: int, version1: str, release1: str, epoch2: int, version2: str, release2: str) -> bool:
     """
-    Checks the complexity of processing two lists of dictionaries based on their total length.
+    Checks whether an epoch-version-release is larger than another one, by the same rules as `is_newer_package`.
 
     Args:
-        dict_list1 (list): The first list of dictionaries.
-        dict_list2 (list): The second list of dictionaries.
+        epoch1 (int): The epoch of the package that is expected to be newer.
+        version1 (str): Its version.
+        release1 (str): Its release.
+        epoch2 (int): The epoch of the package it is compared with.
+        version2 (str): Its version.
+        release2 (str): Its release.
 
     Returns:
-        Tuple[bool, int]: A tuple where the first element is True if processing is considered difficult,
-        and the second element is a numerical code indicating the level of difficulty.
+        bool: True if the first package is newer.
 
     Examples:
-        check_difficult([{}], [{}])
-        (False, 0)
+        is_newer_version(0, "5.2.15", "alt2", 0, "5.2.15", "alt1")
+        True
     """
-    length_sum = len(dict_list1) + len(dict_list2)
-    num_cores = multiprocessing.cpu_count()
-    if length_sum > 1_600_000:
-        if num_cores == 2:
-            return (True, 2) if length_sum >= 2_100_000 else (False, 0)
-        elif num_cores > 2:
-            return True, 3
-    return False, 0
+    if epoch1 < epoch2 or release1 == release2:
+        return False
+    if version1 != version2 and not compare_version_keys(version_key(version1), version_key(version2)):
+        return False
+    return compare_version_keys(version_key(release1), version_key(release2), release=True)
 
 
 def get_current_user() -> str:
@@ -248,18 +227,21 @@ def get_current_user() -> str:
         return "Unknown user"
 
 
-def get_time() -> str:
+def get_time(timestamp: float | None = None) -> str:
     """
     Gets the current time formatted as HH:MM:SS DD-MM-YYYY.
 
+    Args:
+        timestamp (float | None): Format this UNIX time instead of the current time.
+
     Returns:
-        str: The current time formatted as HH:MM:SS DD-MM-YYYY.
+        str: The time formatted as HH:MM:SS DD-MM-YYYY.
 
     Examples:
         get_time()
         '14:30:15 18-09-2024'
     """
-    current_time = datetime.now()
+    current_time = datetime.now() if timestamp is None else datetime.fromtimestamp(timestamp)
     formatted_time = current_time.strftime("%H:%M:%S %d-%m-%Y")
     return formatted_time
 
@@ -298,6 +280,130 @@ def create_response(data: list) -> dict:
     return result
 
 
+def create_matrix_response(data: dict) -> dict:
+    """
+    Creates a response dictionary for a comparison of several branches.
+
+    Args:
+        data (dict): Maps a "branch1-branch2" name to the three result lists of that pair, see `create_response`.
+
+    Returns:
+        dict: A dictionary with user, time and the results of every pair.
+
+    Examples:
+        create_matrix_response({"p10-sisyphus": [[...], [...], [...]]})
+        {'user': 'john_doe',
+         'time': '14:30:15 18-09-2024',
+         'result': {'p10-sisyphus': {'first_package': [...],
+                                     'second_package': [...],
+                                     'newer_versions_first_package': [...]}}}
+    """
+    result = {
+        "user": get_current_user(),
+        "time": get_time(),
+        "result": {
+            pair: {
+                "first_package": lists[0],
+                "second_package": lists[1],
+                "newer_versions_first_package": lists[2],
+            }
+            for pair, lists in data.items()
+        },
+    }
+    return result
+
+
+def create_newest_response(data: list) -> dict:
+    """
+    Creates a response dictionary with the newest branch of every package.
+
+    Args:
+        data (list): Rows with the name, arch, newest branch and the versions in every branch.
+
+    Returns:
+        dict: A dictionary with user, time and the rows.
+
+    Examples:
+        create_newest_response([{"name": "pkg1", "arch": "x86_64", "newest_branch": "sisyphus", "versions": {...}}])
+        {'user': 'john_doe',
+         'time': '14:30:15 18-09-2024',
+         'result': {'newest_packages': [{'name': 'pkg1', 'arch': 'x86_64', 'newest_branch': 'sisyphus', ...}]}}
+    """
+    result = {
+        "user": get_current_user(),
+        "time": get_time(),
+        "result": {"newest_packages": data},
+    }
+    return result
+
+
+def create_source_response(data: dict) -> dict:
+    """
+    Creates a response dictionary with a comparison grouped by source package.
+
+    Args:
+        data (dict): Maps every source package to its per-architecture counts, see `SourceRollup.to_dict`.
+
+    Returns:
+        dict: A dictionary with user, time and the source packages.
+
+    Examples:
+        create_source_response({"bash": {"first_package": {}, "second_package": {"x86_64": 1}, ...}})
+        {'user': 'john_doe',
+         'time': '14:30:15 18-09-2024',
+         'result': {'sources': {'bash': {'first_package': {}, 'second_package': {'x86_64': 1}, ...}}}}
+    """
+    result = {
+        "user": get_current_user(),
+        "time": get_time(),
+        "result": {"sources": data},
+    }
+    return result
+
+
+def create_matrix_source_response(data: dict) -> dict:
+    """
+    Creates a response dictionary for a comparison of several branches grouped by source package.
+
+    Args:
+        data (dict): Maps a "branch1-branch2" name to the source packages of that pair, see `create_source_response`.
+
+    Returns:
+        dict: A dictionary with user, time and the source packages of every pair.
+
+    Examples:
+        create_matrix_source_response({"p10-sisyphus": {"bash": {...}}})
+        {'user': 'john_doe', 'time': '14:30:15 18-09-2024', 'result': {'p10-sisyphus': {'sources': {'bash': {...}}}}}
+    """
+    result = {
+        "user": get_current_user(),
+        "time": get_time(),
+        "result": {pair: {"sources": sources} for pair, sources in data.items()},
+    }
+    return result
+
+
+def format_evr(epoch: int, version: str, release: str) -> str:
+    """
+    Formats a package version the way rpm prints it.
+
+    Args:
+        epoch (int): The epoch, omitted when it is 0.
+        version (str): The version string.
+        release (str): The release string.
+
+    Returns:
+        str: "[epoch:]version-release".
+
+    Examples:
+        format_evr(0, "1.2", "alt1")
+        '1.2-alt1'
+        format_evr(2, "1.2", "alt1")
+        '2:1.2-alt1'
+    """
+    return f"{epoch}:{version}-{release}" if epoch else f"{version}-{release}"
+
+
 def colorize_text(color: str, text: str) -> str:
     colors = {"green": "\033[92m", "red": "\033[91m", "purple": "\033[95m"}
     reset = "\033[0m"
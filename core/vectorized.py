@@ -0,0 +1,121 @@
+from core.classes import PackageTable
+from core.utils import is_newer_package, version_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def numpy_available() -> bool:
+    """
+    Checks whether the vectorized engine can be used.
+
+    Returns:
+        bool: True if NumPy is installed.
+    """
+    return np is not None
+
+
+def version_ranks(*tables: PackageTable) -> "np.ndarray":
+    """
+    Ranks every version and release string of the tables by the rpm comparison order.
+
+    The distinct strings are sorted once by `version_key`; strings with equal keys (e.g. "1.2a" and "1-2A")
+    get the same rank.
+
+    Args:
+        *tables (PackageTable): Tables sharing a string pool.
+
+    Returns:
+        np.ndarray: The rank of every code of the string pool, indexed by the code. Only the codes of versions
+                    and releases are ranked, the other entries are 0.
+
+    Examples:
+        ranks = version_ranks(table1, table2)
+        ranks[pool.codes["1.10"]] > ranks[pool.codes["1.9"]]
+        True
+    """
+    pool = tables[0].pool
+    codes = np.unique(np.concatenate([
+        np.frombuffer(getattr(table, field), dtype=np.uint32)
+        for table in tables
+        for field in ("version", "release")
+    ]))
+    keys = [version_key(pool.strings[code]) for code in codes.tolist()]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    sorted_ranks = []
+    rank = 0
+    previous = None
+    for position in order:
+        if keys[position] != previous:
+            rank += 1
+            previous = keys[position]
+        sorted_ranks.append(rank)
+    ranks = np.zeros(len(pool), dtype=np.int64)
+    ranks[codes[np.array(order, dtype=np.int64)]] = sorted_ranks
+    return ranks
+
+
+def _packed_keys(table: PackageTable) -> "np.ndarray":
+    names = np.frombuffer(table.name, dtype=np.uint32).astype(np.uint64)
+    arches = np.frombuffer(table.arch, dtype=np.uint32).astype(np.uint64)
+    return names << np.uint64(32) | arches
+
+
+def numpy_variant(first_package: PackageTable, second_package: PackageTable) -> list:
+    """
+    Produces the comparison results with array operations instead of a loop over the rows.
+
+    The (name, arch) keys are joined with a sorted search: every row of the second table is matched with the
+    first row of the first table that has the same key. Versions and releases are compared by their ranks
+    (see `version_ranks`), which selects every row that can be newer. The rpm rules are not a total order,
+    so these candidates are confirmed with `is_newer_package`; all other rows are settled by the arrays alone.
+
+    Args:
+        first_package (PackageTable): The first package table.
+        second_package (PackageTable): The second package table.
+
+    Returns:
+        list: The same results as `sync_variant`.
+
+    Raises:
+        Exception: If NumPy is not installed.
+
+    Examples:
+        numpy_variant(table1, table2)
+        [[unique_in_first], [unique_in_second], [common_and_newer_versions]]
+    """
+    if np is None:
+        raise Exception("The numpy engine requires NumPy, install it with `pip install numpy`")
+    first_keys = _packed_keys(first_package)
+    second_keys = _packed_keys(second_package)
+    unique_keys, first_rows = np.unique(first_keys, return_index=True)
+
+    positions = np.searchsorted(unique_keys, second_keys)
+    positions[positions == len(unique_keys)] = 0
+    found = unique_keys[positions] == second_keys if len(unique_keys) else np.zeros(len(second_keys), dtype=bool)
+    second_rows = np.flatnonzero(found)
+    other_rows = first_rows[positions[second_rows]]
+
+    ranks = version_ranks(first_package, second_package)
+    first_epoch = np.frombuffer(first_package.epoch, dtype=np.int64)
+    second_epoch = np.frombuffer(second_package.epoch, dtype=np.int64)
+    first_version = np.frombuffer(first_package.version, dtype=np.uint32)
+    second_version = np.frombuffer(second_package.version, dtype=np.uint32)
+    first_release = np.frombuffer(first_package.release, dtype=np.uint32)
+    second_release = np.frombuffer(second_package.release, dtype=np.uint32)
+    candidates = (
+        (second_epoch[second_rows] >= first_epoch[other_rows])
+        & (ranks[second_version[second_rows]] >= ranks[first_version[other_rows]])
+        & (ranks[second_release[second_rows]] > ranks[first_release[other_rows]])
+    )
+    newer_second = [
+        index
+        for index, other in zip(second_rows[candidates].tolist(), other_rows[candidates].tolist())
+        if is_newer_package(second_package, index, first_package, other)
+    ]
+
+    unique_first = np.flatnonzero(~np.isin(first_keys, second_keys)).tolist()
+    unique_second = np.flatnonzero(~found).tolist()
+    return [unique_first, unique_second, newer_second]
@@ -0,0 +1,248 @@
+import gzip
+import json
+from contextlib import contextmanager
+from json.encoder import encode_basestring, encode_basestring_ascii
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO
+
+FORMATS = ("json", "compact", "ndjson")
+INDENT = 4
+WRITE_BUFFER_SIZE = 256 * 1024
+
+
+class JsonChunks:
+    """
+    Serializes a response piece by piece, so the whole document never exists in memory as one string.
+
+    Dictionaries and the lists or iterators at the top levels are streamed: the result lists may be generators
+    that decode packages only when they are written. The items of a list are serialized whole; flat package
+    dictionaries take a fast path. The output is the same as `json.dumps(response, indent=4)` for the "json"
+    format and `json.dumps(response, separators=(",", ":"))` for the "compact" one.
+
+    Examples:
+        "".join(JsonChunks(indent=None, ensure_ascii=True).iter_value({"result": iter([1, 2])}))
+        '{"result":[1,2]}'
+    """
+
+    def __init__(self, indent: int | None = INDENT, ensure_ascii: bool = False):
+        self.indent = indent
+        self.ensure_ascii = ensure_ascii
+        self.encode_string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self.item_separator = ","
+        self.key_separator = ":" if indent is None else ": "
+
+    def newline(self, level: int) -> str:
+        return "" if self.indent is None else "\n" + " " * (self.indent * level)
+
+    def iter_value(self, value, level: int = 0) -> Iterator[str]:
+        """
+        Serializes a value, streaming dictionaries and lists.
+
+        Args:
+            value: A JSON-serializable value, lists may be replaced by any iterables.
+            level (int): The nesting level of the value.
+
+        Returns:
+            Iterator[str]: The pieces of the JSON document.
+        """
+        if isinstance(value, dict):
+            if not value:
+                yield "{}"
+                return
+            separator = "{"
+            for key, item in value.items():
+                yield separator + self.newline(level + 1) + self.encode_string(str(key)) + self.key_separator
+                yield from self.iter_value(item, level + 1)
+                separator = self.item_separator
+            yield self.newline(level) + "}"
+        elif isinstance(value, (list, tuple, Iterator)):
+            separator = "["
+            for item in value:
+                yield separator + self.newline(level + 1) + self.dumps(item, level + 1)
+                separator = self.item_separator
+            yield "[]" if separator == "[" else self.newline(level) + "]"
+        else:
+            yield self.dumps(value, level)
+
+    def dumps(self, value, level: int) -> str:
+        """
+        Serializes an item of a list as a whole.
+
+        Args:
+            value: A JSON-serializable value.
+            level (int): The nesting level of the value.
+
+        Returns:
+            str: The serialized value, indented for its level.
+        """
+        if isinstance(value, dict) and all(type(item) in (str, int) for item in value.values()):
+            # Package records are flat dictionaries of strings and integers.
+            if not value:
+                return "{}"
+            fields = (
+                self.encode_string(key) + self.key_separator
+                + (self.encode_string(item) if type(item) is str else int.__repr__(item))
+                for key, item in value.items()
+            )
+            inner = self.newline(level + 1)
+            return "{" + inner + (self.item_separator + inner).join(fields) + self.newline(level) + "}"
+        text = json.dumps(
+            value,
+            indent=self.indent,
+            separators=(self.item_separator, self.key_separator),
+            ensure_ascii=self.ensure_ascii,
+        )
+        return text.replace("\n", self.newline(level)) if self.indent is not None and level else text
+
+
+def iter_ndjson(response: dict, ensure_ascii: bool = False) -> Iterator[str]:
+    """
+    Serializes a response as newline-delimited JSON.
+
+    The first line holds the user and the time of the response, then every package is written on its own
+    line with the result category it belongs to ("category") and, for a comparison of several branches,
+    the branch pair ("pair"). A response grouped by source package has a line per source package ("source").
+
+    Args:
+        response (dict): A response of `get_sorted_data` or `get_branches_data`.
+        ensure_ascii (bool): Escape non-ASCII characters.
+
+    Returns:
+        Iterator[str]: The lines of the document.
+
+    Examples:
+        list(iter_ndjson(response))
+        ['{"user": "john_doe", "time": "14:30:15 18-09-2024"}\\n',
+         '{"category": "first_package", "name": "pkg1", "arch": "x86_64", ...}\\n', ...]
+    """
+    header = {key: value for key, value in response.items() if key != "result"}
+    yield json.dumps(header, ensure_ascii=ensure_ascii) + "\n"
+    for name, value in response["result"].items():
+        if name == "sources":
+            for source, groups in value.items():
+                yield json.dumps({"source": source, **groups}, ensure_ascii=ensure_ascii) + "\n"
+        elif isinstance(value, dict):
+            for category, packages in value.items():
+                if category == "sources":
+                    for source, groups in packages.items():
+                        line = {"pair": name, "source": source, **groups}
+                        yield json.dumps(line, ensure_ascii=ensure_ascii) + "\n"
+                    continue
+                for package in packages:
+                    line = {"pair": name, "category": category, **package}
+                    yield json.dumps(line, ensure_ascii=ensure_ascii) + "\n"
+        else:
+            for package in value:
+                yield json.dumps({"category": name, **package}, ensure_ascii=ensure_ascii) + "\n"
+
+
+def iter_response(response: dict, output_format: str = "json") -> Iterator[str]:
+    """
+    Serializes a response in one of the output formats.
+
+    Args:
+        response (dict): A response of `get_sorted_data` or `get_branches_data`, its package lists
+            may be generators.
+        output_format (str): One of `FORMATS`: "json" (indented), "compact" or "ndjson".
+
+    Returns:
+        Iterator[str]: The pieces of the document, which ends with a newline.
+
+    Examples:
+        "".join(iter_response({"result": {"first_package": []}}, "compact"))
+        '{"result":{"first_package":[]}}\\n'
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}. Available formats: {', '.join(FORMATS)}")
+    if output_format == "ndjson":
+        yield from iter_ndjson(response)
+        return
+    yield from JsonChunks(INDENT if output_format == "json" else None).iter_value(response)
+    yield "\n"
+
+
+def write_response(
+    response: dict,
+    outputs: Iterable[TextIO],
+    output_format: str = "json",
+    buffer_size: int = WRITE_BUFFER_SIZE,
+) -> int:
+    """
+    Serializes a response once and writes it to several outputs at the same time.
+
+    The pieces are collected into blocks of about `buffer_size` characters and every block is written to
+    every output, so a file and the console get the same document without serializing it twice.
+
+    Args:
+        response (dict): A response of `get_sorted_data` or `get_branches_data`.
+        outputs (Iterable[TextIO]): The files to write to, e.g. an output file and `sys.stdout`.
+        output_format (str): One of `FORMATS`.
+        buffer_size (int): The approximate size of the written blocks.
+
+    Returns:
+        int: The number of characters written to each output.
+
+    Examples:
+        with open_output("p10-sisyphus.json.gz", compress=True) as file:
+            write_response(result, [file, sys.stdout], "compact")
+    """
+    outputs = list(outputs)
+    block = []
+    size = 0
+    written = 0
+    for piece in iter_response(response, output_format):
+        block.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            text = "".join(block)
+            for output in outputs:
+                output.write(text)
+            written += size
+            block.clear()
+            size = 0
+    text = "".join(block)
+    for output in outputs:
+        output.write(text)
+        output.flush()
+    return written + size
+
+
+def output_path(directory: str | Path, name: str, output_format: str = "json", compress: bool = False) -> Path:
+    """
+    Builds the path of an output file.
+
+    Args:
+        directory (str | Path): The output directory.
+        name (str): The file name without the extension, e.g. "p10-sisyphus".
+        output_format (str): One of `FORMATS`, "ndjson" files get the ".ndjson" extension.
+        compress (bool): Add the ".gz" extension.
+
+    Returns:
+        Path: The output file path.
+
+    Examples:
+        output_path("/tmp", "p10-sisyphus", "ndjson", compress=True)
+        PosixPath('/tmp/p10-sisyphus.ndjson.gz')
+    """
+    extension = ".ndjson" if output_format == "ndjson" else ".json"
+    return Path(directory) / f"{name}{extension}{'.gz' if compress else ''}"
+
+
+@contextmanager
+def open_output(path: str | Path, compress: bool = False):
+    """
+    Opens an output file for writing text, optionally through streaming gzip compression.
+
+    Args:
+        path (str | Path): The output file path.
+        compress (bool): Compress the file with gzip while it is written.
+
+    Yields:
+        TextIO: The file to write the document to, in UTF-8.
+    """
+    if compress:
+        file = gzip.open(path, "wt", encoding="utf-8")
+    else:
+        file = open(path, "w", encoding="utf-8")
+    with file:
+        yield file
@@ -1,53 +1,67 @@
 import argparse
 import asyncio
 import json
+import re
 import sys
+from contextlib import ExitStack
 from pathlib import Path
 
-from core.data_extractor import get_sorted_data
-from core.parse_data import async_version
+from core.api import ComparisonResult, compare_branches
+from core.cache import DEFAULT_MAX_SIZE, DEFAULT_TTL, SnapshotCache
+from core.classes import StringPool
+from core.data_extractor import ENGINES, build_tables, get_branches_data
+from core.external import DEFAULT_MEMORY_BUDGET, external_join
+from core.history import HistoryStore
+from core.parse_data import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    RETRIES,
+    HttpOptions,
+    PackageFilter,
+    async_version,
+    cache_branches,
+    fetch_branches,
+    iter_packages,
+)
+from core.pipeline import fetch_indexed
+from core.planner import plan_execution
+from core.profiler import Profiler
 from core.utils import colorize_text
+from core.vectorized import numpy_available
+from core.writer import FORMATS, open_output, output_path, write_response
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     """
-    Compare packages between two branches and optionally save results to a file or print them to the console.
-
-    This script uses command line arguments to specify two branches to compare. It retrieves packet data asynchronously,
-    compares them, and outputs the results. If the `--write` argument is specified, the results
-    saved to a JSON file with a name derived from the branch names. If the `--console` argument is specified,
-    the results will be output to the console.
-
-    Command-line Arguments:
-        --branch1 (str): The name of the first branch to compare.
-        --branch2 (str): The name of the second branch to compare.
-        --write (str, optional): The directory path where the output JSON file will be saved. If not provided, the
-                                  results will only be printed to stdout.
-        --console (bool, optional): Print the results to stdout in JSON format if this flag is provided.
+    Builds the command line parser of the utility, with the `history` subcommand.
 
-    Behavior:
-        1. Parses command-line arguments to get branch names and output file path.
-        2. Fetches package data for the specified branches asynchronously using `async_version`.
-        3. Compares the package data and generates a result using `get_sorted_data`.
-        4. If the `--write` argument is provided, writes the results to a JSON file in the specified directory.
-        5. If the `--console` argument is provided, prints the results in JSON format to the console. By default,
-           results are not printed unless this flag is specified.
-
-    Examples:
-        $ python script.py --branch1 branch1_name --branch2 branch2_name --write /path/to/output
-        $ python script.py --branch1 branch1_name --branch2 branch2_name --console
+    Returns:
+        argparse.ArgumentParser: The parser, the arguments are described in their help and in the README.
     """
     parser = argparse.ArgumentParser(description="Compare packages between two branches.")
     parser.add_argument(
         "--branch1",
-        required=True,
         help="Name of the first branch"
     )
     parser.add_argument(
         "--branch2",
-        required=True,
         help="Name of the second branch, " "the branch in which we will search for newer versions",
     )
+    parser.add_argument(
+        "--branches",
+        nargs="+",
+        help="Names of several branches to compare pairwise in one run, instead of --branch1 and --branch2",
+    )
+    parser.add_argument(
+        "--newest",
+        action="store_true",
+        help="With --branches, output the branch with the newest version of every package",
+    )
+    parser.add_argument(
+        "--by-source",
+        action="store_true",
+        help="Group the result by source package with the package counts of every architecture",
+    )
     parser.add_argument(
         "--write",
         help="Path to the output file, will be written " "to the file branch1-branch2.json",
@@ -57,29 +71,556 @@ def main():
         action="store_true",
         help="Output the result to the stdout",
     )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="json",
+        help="Output format: indented json, compact json or ndjson with one package per line",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress the output file with gzip, requires --write",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the API responses incrementally to reduce peak memory usage",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Decode and index the branches in a worker thread while they are downloaded",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory where branch snapshots are cached between runs",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=DEFAULT_TTL,
+        help="Seconds during which a cached snapshot is used without asking the API",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE // 1024**2,
+        help="Maximum size of the snapshot cache in megabytes",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Work only with the cached snapshots, requires --cache-dir",
+    )
+    parser.add_argument(
+        "--binary-cache",
+        action="store_true",
+        help="Load the cached branches from memory-mappable binary snapshots, requires --cache-dir",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        help="Seconds to wait for a connection to the API",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        help="Seconds to wait for the next piece of a response",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=RETRIES,
+        help="How many times a failed request is repeated",
+    )
+    parser.add_argument(
+        "--arch",
+        nargs="+",
+        default=(),
+        help="Compare only the packages of these architectures",
+    )
+    parser.add_argument(
+        "--name",
+        nargs="+",
+        default=(),
+        help='Compare only the packages whose names match these globs, or regular expressions prefixed with "re:"',
+    )
+    parser.add_argument(
+        "--source",
+        nargs="+",
+        default=(),
+        help="Compare only the packages built from source packages matching these globs or regular expressions",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the comparison results of the previous run, requires --cache-dir",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="auto",
+        help="Comparison engine, by default it is chosen by the execution planner",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=DEFAULT_MEMORY_BUDGET // 1024**2,
+        help="Memory in megabytes for the sorted rows of --engine external",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print the engine and the number of processes chosen by the execution planner",
+    )
+    parser.add_argument(
+        "--recalibrate",
+        action="store_true",
+        help="Run the calibration benchmark of the execution planner again",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        help="Print the time, CPU time, rows, body bytes, the peak memory of every stage and of the process so far, "
+             "or save them to the given JSON file",
+    )
+    parser.add_argument(
+        "--profile-diff",
+        help="Run the comparison stage under cProfile and dump the statistics to the given file",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a comparison service that keeps the indexed branches in memory",
+    )
+    # The defaults of the service options are in `core.server`, it is imported only by `run_serve`.
+    parser.add_argument(
+        "--host",
+        help="Address of the comparison service, 127.0.0.1 by default",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="Port of the comparison service, 8080 by default",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=int,
+        help="Seconds between the background refreshes of the branches kept by the service, 3600 by default",
+    )
+    parser.add_argument(
+        "--max-branches",
+        type=int,
+        help="The most branches the comparison service keeps in memory (16 by default), the least recently "
+             "requested one is dropped",
+    )
+    parser.add_argument(
+        "--history-db",
+        help="Record the run and its result in the given SQLite database",
+    )
+    parser.add_argument(
+        "--history-keep",
+        type=int,
+        help="Keep only this many latest runs of the branch pair in --history-db, all of them by default",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    history_parser = subparsers.add_parser("history", help="Query the runs recorded with --history-db")
+    # Kept in the parsed arguments, so the errors of the subcommand are reported with its usage.
+    history_parser.set_defaults(command_parser=history_parser)
+    history_parser.add_argument(
+        "--history-db",
+        required=True,
+        help="The SQLite database of the recorded runs",
+    )
+    history_parser.add_argument(
+        "--branch1",
+        help="Only the runs with this first branch",
+    )
+    history_parser.add_argument(
+        "--branch2",
+        help="Only the runs with this second branch",
+    )
+    history_parser.add_argument(
+        "--arch",
+        help="Only this architecture for --package and --newer-since",
+    )
+    history_parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of runs for --runs and --trend, 0 for all of them",
+    )
+    query = history_parser.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "--runs",
+        action="store_true",
+        help="List the latest runs with their counts and snapshots",
+    )
+    query.add_argument(
+        "--trend",
+        action="store_true",
+        help="List the counts of every run of --branch1 and --branch2",
+    )
+    query.add_argument(
+        "--package",
+        help="List every recorded result the package was part of",
+    )
+    query.add_argument(
+        "--newer-since",
+        metavar="PACKAGE",
+        help="Show since when the package has been newer in --branch2 than in --branch1",
+    )
+    query.add_argument(
+        "--source",
+        help="Count the packages of the source package in every run",
+    )
+    return parser
 
-    args = parser.parse_args()
 
+def validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> PackageFilter | None:
+    """
+    Checks the combinations of the parsed arguments and compiles the package filter.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser, its `error` reports a wrong combination and exits.
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        PackageFilter | None: The filter of --arch, --name and --source, None if none of them is given or for
+                              the `history` subcommand.
+    """
+    if args.command == "history":
+        if (args.trend or args.newer_since is not None) and (args.branch1 is None or args.branch2 is None):
+            args.command_parser.error("--trend and --newer-since require --branch1 and --branch2")
+        return None
+    if args.serve:
+        if args.branches is not None and (args.branch1 is not None or args.branch2 is not None):
+            parser.error("--branches can not be used together with --branch1 and --branch2")
+        if args.max_branches is not None and args.max_branches < 2:
+            parser.error("--max-branches must be at least 2")
+    elif args.branches is None and (args.branch1 is None or args.branch2 is None):
+        parser.error("either --branch1 and --branch2, --branches or --serve are required")
+    elif args.branches is not None and (args.branch1 is not None or args.branch2 is not None):
+        parser.error("--branches can not be used together with --branch1 and --branch2")
+    if args.newest and args.branches is None:
+        parser.error("--newest requires --branches")
+    if args.by_source and args.newest:
+        parser.error("--by-source can not be used with --newest")
+    if args.incremental and args.branches is not None:
+        parser.error("--incremental can not be used with --branches")
+    if args.branches is not None and args.engine not in ("auto", "merge"):
+        parser.error("--branches compares the branches with the single join, --engine can only be merge with it")
+    if args.plan and args.branches is not None:
+        parser.error("--plan can not be used with --branches")
+    if args.gzip and args.write is None:
+        parser.error("--gzip requires --write")
+    if args.offline and args.cache_dir is None:
+        parser.error("--offline requires --cache-dir")
+    if args.incremental and args.cache_dir is None:
+        parser.error("--incremental requires --cache-dir")
+    if args.binary_cache and args.cache_dir is None:
+        parser.error("--binary-cache requires --cache-dir")
+    if args.engine == "numpy" and not numpy_available():
+        parser.error("--engine numpy requires NumPy, install it with `pip install numpy`")
+    if args.engine == "external":
+        if args.cache_dir is None:
+            parser.error("--engine external requires --cache-dir")
+        if args.by_source or args.incremental or args.pipeline or args.plan:
+            parser.error("--engine external can not be used with --by-source, --incremental, --pipeline or --plan")
+    if args.history_db is not None and args.branches is not None:
+        parser.error("--history-db can not be used with --branches")
+    if args.history_keep is not None and (args.history_db is None or args.history_keep < 1):
+        parser.error("--history-keep requires --history-db and must be at least 1")
+    if args.memory_budget <= 0:
+        parser.error("--memory-budget must be positive")
+    try:
+        return PackageFilter(tuple(args.arch), tuple(args.name), tuple(args.source)) or None
+    except re.error as error:
+        parser.error(f"invalid --name or --source pattern: {error}")
+
+
+def run_history(args: argparse.Namespace) -> None:
+    """
+    Runs a query of the `history` subcommand and prints its result as JSON.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments of the subcommand.
+    """
+    with HistoryStore(args.history_db) as history:
+        if args.runs:
+            data = history.runs(args.branch1, args.branch2, args.limit)
+        elif args.trend:
+            data = history.trend(args.branch1, args.branch2, args.limit)
+        elif args.package is not None:
+            data = history.package_history(args.package, args.arch, args.branch1, args.branch2)
+        elif args.newer_since is not None:
+            data = history.newer_since(args.newer_since, args.branch1, args.branch2, args.arch)
+        else:
+            data = history.source_history(args.source, args.branch1, args.branch2)
+    sys.stdout.write(json.dumps(data, indent=4, ensure_ascii=False) + "\n")
+
+
+def run_serve(
+    args: argparse.Namespace,
+    cache: SnapshotCache | None,
+    options: HttpOptions,
+    package_filter: PackageFilter | None,
+) -> None:
+    """
+    Runs the comparison service until it is stopped, see `core.server`.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        cache (SnapshotCache | None): The snapshot cache of the refreshes.
+        options (HttpOptions): The timeouts and retries of the requests.
+        package_filter (PackageFilter | None): The filter the branches are read with.
+    """
+    from aiohttp import web
+
+    from core.server import (
+        DEFAULT_HOST,
+        DEFAULT_PORT,
+        DEFAULT_REFRESH_INTERVAL,
+        MAX_BRANCHES,
+        ComparisonService,
+        create_app,
+    )
+
+    service = ComparisonService(
+        cache,
+        DEFAULT_REFRESH_INTERVAL if args.refresh_interval is None else args.refresh_interval,
+        args.stream,
+        args.offline,
+        options=options,
+        package_filter=package_filter,
+        max_branches=MAX_BRANCHES if args.max_branches is None else args.max_branches,
+    )
+    preload = args.branches or [branch for branch in (args.branch1, args.branch2) if branch is not None]
+    web.run_app(
+        create_app(service, preload),
+        host=args.host or DEFAULT_HOST,
+        port=DEFAULT_PORT if args.port is None else args.port,
+    )
+
+
+def fetch_data(
+    args: argparse.Namespace,
+    branches: list,
+    cache: SnapshotCache | None,
+    options: HttpOptions,
+    package_filter: PackageFilter | None,
+    profiler: Profiler,
+) -> tuple:
+    """
+    Downloads the branches (or takes them from the cache) in the way the arguments ask for.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        branches (list): The branch names.
+        cache (SnapshotCache | None): The snapshot cache.
+        options (HttpOptions): The timeouts and retries of the requests.
+        package_filter (PackageFilter | None): The filter the branches are read with.
+        profiler (Profiler): Measures the "fetch" stage.
+
+    Returns:
+        tuple: (received_data, indexes): the packages of every branch (the cache entries for the "external"
+               engine) and their prebuilt indexes with --pipeline, None otherwise.
+    """
+    trace_configs = [profiler.trace_config()]
+    indexes = None
+    with profiler.stage("fetch") as stage:
+        if args.engine == "external":
+            # Only the exports are brought up to date, the packages are streamed from the cache by the comparison.
+            received_data = asyncio.run(
+                cache_branches(branches, cache, args.offline, trace_configs=trace_configs, options=options)
+            )
+        elif args.pipeline:
+            indexed = asyncio.run(
+                fetch_indexed(
+                    branches, args.stream, cache, args.offline,
+                    trace_configs=trace_configs, options=options, package_filter=package_filter,
+                )
+            )
+            received_data = [table for table, _ in indexed]
+            indexes = [index for _, index in indexed]
+            del indexed
+        elif args.branches is not None:
+            received_data = asyncio.run(
+                fetch_branches(
+                    branches, args.stream, cache, args.offline, trace_configs=trace_configs, options=options,
+                    package_filter=package_filter, pool=StringPool(),
+                )
+            )
+        else:
+            received_data = asyncio.run(
+                async_version(
+                    args.branch1, args.branch2, args.stream, cache, args.offline, trace_configs=trace_configs,
+                    options=options, package_filter=package_filter, pool=StringPool(),
+                )
+            )
+        if args.engine != "external":
+            stage.rows = sum(map(len, received_data))
+        stage.bytes = profiler.body_bytes
+    return received_data, indexes
+
+
+def compare_pair(
+    args: argparse.Namespace,
+    tables: tuple,
+    indexes: list | None,
+    cache: SnapshotCache | None,
+    package_filter: PackageFilter | None,
+    profiler: Profiler,
+) -> ComparisonResult:
+    """
+    Plans and runs the comparison of --branch1 and --branch2 with `core.api.compare_branches`.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        tables (tuple): The tables of both branches, see `build_tables`.
+        indexes (list | None): Their prebuilt indexes, if any.
+        cache (SnapshotCache | None): The snapshot cache, it keeps the state of --incremental.
+        package_filter (PackageFilter | None): The filter the branches were read with.
+        profiler (Profiler): Measures the "plan" and "diff" stages.
+
+    Returns:
+        ComparisonResult: The result of the comparison.
+    """
+    state_path = cache.diff_state_path(args.branch1, args.branch2) if args.incremental else None
+    plan = None
+    with profiler.stage("plan") as stage:
+        if args.plan or args.recalibrate or args.engine == "auto" and state_path is None:
+            plan = plan_execution(len(tables[0]) + len(tables[1]), recalibrate=args.recalibrate)
+            stage.details = {"engine": plan.engine, "processes": plan.processes, "source": plan.profile_source}
+    if args.plan:
+        sys.stdout.write(f"\tExecution plan: {colorize_text('purple', plan.describe())}\n")
+        if args.engine != "auto" or state_path is not None:
+            sys.stdout.write(f"\tThe plan is overridden by {'--incremental' if state_path else '--engine'}\n")
+    with profiler.stage("diff", args.profile_diff) as stage:
+        comparison = compare_branches(
+            tables[0], tables[1], args.engine, state_path, plan, by_source=args.by_source, indexes=indexes,
+            package_filter=package_filter,
+        )
+        stage.rows = len(tables[0]) + len(tables[1])
+        stage.details = {"engine": "incremental" if state_path else args.engine}
+    return comparison
+
+
+def write_result(args: argparse.Namespace, branches: list, result: dict, profiler: Profiler) -> Path | None:
+    """
+    Writes the response to the file of --write and to stdout with --console.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        branches (list): The branch names, the file is named after them.
+        result (dict): The response document.
+        profiler (Profiler): Measures the "write" stage.
+
+    Returns:
+        Path | None: The written file, None without --write.
+    """
+    path = None
+    with profiler.stage("write") as stage, ExitStack() as stack:
+        outputs = []
+        if args.write is not None:
+            name = f"{'-'.join(branches)}{'-newest' if args.newest else ''}{'-sources' if args.by_source else ''}"
+            path = output_path(args.write, name, args.format, args.gzip)
+            outputs.append(stack.enter_context(open_output(path, args.gzip)))
+        if args.console:
+            outputs.append(sys.stdout)
+        if outputs:
+            stage.bytes = write_response(result, outputs, args.format)
+        stage.details = {"format": args.format, "gzip": args.gzip}
+    return path
+
+
+def run_compare(
+    args: argparse.Namespace,
+    cache: SnapshotCache | None,
+    options: HttpOptions,
+    package_filter: PackageFilter | None,
+) -> None:
+    """
+    Compares the branches of the arguments, writes the result and records the run.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        cache (SnapshotCache | None): The snapshot cache.
+        options (HttpOptions): The timeouts and retries of the requests.
+        package_filter (PackageFilter | None): The filter the branches are read with.
+    """
+    branches = args.branches or [args.branch1, args.branch2]
     sys.stdout.write(f"\n{colorize_text(color='green', text="Hey, I'm starting work.")}" + "\n")
     sys.stdout.write(
-        f"\n\tI'm starting work on two branches: "
-        f"{colorize_text('green', args.branch1)} "
-        f"and "
-        f"{colorize_text('green', args.branch2)}." + "\n"
+        f"\n\tI'm starting work on the branches: "
+        f"{', '.join(colorize_text('green', branch) for branch in branches)}." + "\n"
     )
 
+    profiler = Profiler()
     sys.stdout.write("\n\tSending requests to the API\n")
-    received_data = asyncio.run(async_version(args.branch1, args.branch2))
+    received_data, indexes = fetch_data(args, branches, cache, options, package_filter, profiler)
     sys.stdout.write("\tData successfully received\n")
 
-    sys.stdout.write("\n\tI'm starting to work with the data\n")
-    result = get_sorted_data(received_data[0], received_data[1])
-    sys.stdout.write("\tEverything went well, the data is sorted\n")
+    # The result of the external engine keeps its rows in temporary files until it is closed.
+    with ExitStack() as resources:
+        sys.stdout.write("\n\tI'm starting to work with the data\n")
+        if args.engine == "external":
+            with profiler.stage("diff", args.profile_diff) as stage:
+                comparison = resources.enter_context(external_join(
+                    iter_packages(cache.read_chunks(received_data[0]), package_filter),
+                    iter_packages(cache.read_chunks(received_data[1]), package_filter),
+                    args.memory_budget * 1024**2,
+                ))
+                stage.rows = sum(comparison.rows)
+                stage.details = {"engine": args.engine, "memory_budget": args.memory_budget}
+            rows = comparison.rows
+        else:
+            with profiler.stage("build_tables") as stage:
+                tables = build_tables(*received_data)
+                del received_data
+                stage.rows = sum(map(len, tables))
+            rows = tuple(map(len, tables))
+        if args.branches is not None:
+            with profiler.stage("diff", args.profile_diff) as stage:
+                result = get_branches_data(
+                    branches, tables, args.newest, lazy=True, by_source=args.by_source, indexes=indexes
+                )
+                stage.rows = sum(rows)
+        else:
+            if args.engine != "external":
+                comparison = compare_pair(args, tables, indexes, cache, package_filter, profiler)
+            counts = comparison.counts()
+            sys.stdout.write(
+                f"\tNumber of packets found for the first branch: "
+                f"{colorize_text('red', str(counts['first_package']))}"
+                f"\n\tNumber of packets found for the second branch: "
+                f"{colorize_text('red', str(counts['second_package']))}\n "
+                f"\tAll packages whose version-release is larger in the second branch: "
+                f"{colorize_text('red', str(counts['newer_versions_first_package']))}\n"
+            )
+            result = comparison.to_response() if args.engine == "external" else comparison.to_response(args.by_source)
+            if args.by_source:
+                sources = result["result"]["sources"]
+                sys.stdout.write(f"\tNumber of source packages: {colorize_text('red', str(len(sources)))}\n")
+        sys.stdout.write("\tEverything went well, the data is sorted\n")
+
+        path = write_result(args, branches, result, profiler)
 
-    if args.write is not None:
-        path = Path(args.write) / f"{args.branch1}-{args.branch2}.json"
-        with open(path, "w") as file:
-            json.dump(result, file, indent=4)
+        if args.history_db is not None:
+            with profiler.stage("history") as stage, HistoryStore(args.history_db) as history:
+                snapshots = [cache.get(branch) for branch in branches] if cache is not None else ()
+                engine = "incremental" if args.incremental else args.engine
+                run_id = history.record(branches, comparison, rows, snapshots, engine, package_filter)
+                if args.history_keep is not None:
+                    history.prune(*branches, args.history_keep)
+                stage.rows = sum(comparison.counts().values())
+            sys.stdout.write(f"\tThe run is recorded in the history as {colorize_text('purple', str(run_id))}\n")
+
+    if path is not None:
         sys.stdout.write(
             f"\n\t{
         colorize_text(
@@ -88,9 +629,11 @@ def main():
             f"{colorize_text('purple', str(path))}\n"
         )
 
-    if args.console:
-        formatted_json = json.dumps(result, indent=4, ensure_ascii=False)
-        sys.stdout.write(formatted_json + "\n")
+    if args.profile == "":
+        sys.stdout.write("\n" + profiler.format_report())
+    elif args.profile is not None:
+        profiler.write_report(args.profile)
+        sys.stdout.write(f"\n\tThe profile report is written to: {colorize_text('purple', args.profile)}\n")
 
     sys.stdout.write(
         f"\n{
@@ -98,3 +641,38 @@ def main():
         'green',
         'The results will be available according to your settings')}\n"
     )
+
+
+def main():
+    """
+    Compare packages between two branches and optionally save results to a file or print them to the console.
+
+    This script uses command line arguments to specify two branches to compare. It retrieves packet data asynchronously,
+    compares them, and outputs the results. The arguments are described in `build_parser` and the README; the
+    `history` subcommand queries the database of --history-db and --serve runs the comparison service instead.
+
+    Behavior:
+        1. Parses command-line arguments (`build_parser`) and checks them (`validate_args`).
+        2. Runs the `history` subcommand (`run_history`), the service (`run_serve`) or a comparison (`run_compare`).
+
+    Examples:
+        $ python script.py --branch1 branch1_name --branch2 branch2_name --write /path/to/output
+        $ python script.py --branch1 branch1_name --branch2 branch2_name --console
+        $ python script.py history --history-db history.sqlite --newer-since python3 --branch1 p10 --branch2 sisyphus
+    """
+    parser = build_parser()
+    args = parser.parse_args()
+    package_filter = validate_args(parser, args)
+    if args.command == "history":
+        run_history(args)
+        return
+    cache = None
+    if args.cache_dir is not None:
+        cache = SnapshotCache(
+            args.cache_dir, ttl=args.cache_ttl, max_size=args.cache_size * 1024**2, binary=args.binary_cache
+        )
+    options = HttpOptions(args.connect_timeout, args.read_timeout, args.retries)
+    if args.serve:
+        run_serve(args, cache, options, package_filter)
+    else:
+        run_compare(args, cache, options, package_filter)
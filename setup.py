@@ -4,7 +4,7 @@ setup(
     name='test_task_bazalt_spo',
     version='0.1',
     py_modules=['main'],
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests"]),
     install_requires=[
         "aiohappyeyeballs==2.4.0",
         "aiohttp==3.10.5",
@@ -25,6 +25,9 @@ setup(
         "urllib3==2.2.3",
         "yarl==1.11.1"
     ],
+    extras_require={
+        "numpy": ["numpy"],
+    },
     entry_points={
         'console_scripts': [
             'compare_packages=main:main',
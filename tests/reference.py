@@ -0,0 +1,100 @@
+from core.utils import compare_versions_release
+
+CATEGORIES = ("first_package", "second_package", "newer_versions_first_package")
+
+
+def package(name: str, epoch: int = 0, version: str = "1.0", release: str = "alt1", arch: str = "x86_64") -> dict:
+    """
+    Builds a package dictionary in the format of the export API.
+    """
+    return {
+        "name": name,
+        "epoch": epoch,
+        "version": version,
+        "release": release,
+        "arch": arch,
+        "disttag": "sisyphus+1",
+        "buildtime": 1700000000,
+        "source": name,
+    }
+
+
+def reference_comparison(first: list, second: list) -> list:
+    """
+    Compares two branches the way the original list-based implementation did, one package at a time.
+
+    The packages of the first branch whose (name, arch) key is not in the second one, the packages of the second
+    branch whose key is not in the first one, and the packages of the second branch that are newer than the first
+    package with the same key in the first branch: the epoch is not smaller, the version is not smaller and the
+    release is larger.
+
+    Args:
+        first (list): The packages of the first branch.
+        second (list): The packages of the second branch.
+
+    Returns:
+        list: The three package lists in the order of the input.
+    """
+    first_keys = {(item["name"], item["arch"]) for item in first}
+    second_keys = {(item["name"], item["arch"]) for item in second}
+    oldest = {}
+    for item in first:
+        oldest.setdefault((item["name"], item["arch"]), item)
+    newer = []
+    for item in second:
+        other = oldest.get((item["name"], item["arch"]))
+        if (
+            other is not None
+            and item["epoch"] >= other["epoch"]
+            and compare_versions_release(item["version"], other["version"])
+            and compare_versions_release(item["release"], other["release"], release=True)
+        ):
+            newer.append(item)
+    return [
+        [item for item in first if (item["name"], item["arch"]) not in second_keys],
+        [item for item in second if (item["name"], item["arch"]) not in first_keys],
+        newer,
+    ]
+
+
+def edge_case_branches() -> tuple:
+    """
+    Builds two small branches with the cases the comparison has to get right.
+
+    Returns:
+        tuple: The packages of the first and the second branch.
+    """
+    first = [
+        package("only-first"),
+        package("same"),
+        package("newer-release", release="alt1"),
+        package("newer-version", version="1.0", release="alt1"),
+        package("older-version", version="2.0", release="alt1"),
+        package("equal-release-higher-epoch", epoch=0, release="alt1"),
+        package("lower-epoch", epoch=2, release="alt1"),
+        package("higher-epoch", epoch=0, version="2.0", release="alt1"),
+        package("case-only", release="alt1"),
+        package("duplicate", release="alt1"),
+        package("duplicate", release="alt5"),
+        package("same", arch="i586", release="alt3"),
+        package("only-noarch", arch="noarch"),
+        package("dotted", version="1.2", release="alt1.1"),
+    ]
+    second = [
+        package("only-second"),
+        package("same"),
+        package("newer-release", release="alt2"),
+        package("newer-version", version="1.1", release="alt2"),
+        package("older-version", version="1.9", release="alt9"),
+        package("equal-release-higher-epoch", epoch=1, release="alt1"),
+        package("lower-epoch", epoch=1, release="alt9"),
+        package("higher-epoch", epoch=1, version="2.0", release="alt2"),
+        package("case-only", release="ALT1"),
+        # Compared with the first row of the key in the first branch, release alt1.
+        package("duplicate", release="alt3"),
+        package("duplicate", release="alt1"),
+        package("same", release="alt0"),
+        package("only-noarch"),
+        package("dotted", version="1.2.0", release="alt1.2"),
+    ]
+    return first, second
@@ -0,0 +1,101 @@
+import json
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from core.parse_data import HttpOptions
+
+# Short timeouts and almost no backoff, so the retries of a test take milliseconds.
+TEST_OPTIONS = HttpOptions(connect_timeout=5, read_timeout=5, retries=3, backoff_base=0.001, backoff_max=0.001)
+
+
+def make_packages(count: int, release: str = "alt1") -> list:
+    """
+    Builds package dictionaries in the format of the export API.
+
+    Args:
+        count (int): The number of packages.
+        release (str): The release of every package.
+
+    Returns:
+        list: Package dictionaries with distinct names.
+    """
+    return [
+        {
+            "name": f"package{number}",
+            "epoch": 0,
+            "version": f"1.{number}",
+            "release": release,
+            "arch": "x86_64",
+            "disttag": "sisyphus+1",
+            "buildtime": 1700000000 + number,
+            "source": f"package{number}",
+        }
+        for number in range(count)
+    ]
+
+
+def make_body(packages: list) -> bytes:
+    """
+    Serializes packages into an export response body.
+    """
+    return json.dumps({"request_args": {}, "length": len(packages), "packages": packages}).encode()
+
+
+class StandInServer:
+    """
+    A local stand-in for the export API, served by aiohttp on a free port.
+
+    Every request to `/export/branch_binary_packages/{branch}` is passed to `handler` together with its number,
+    starting from 0, and the headers of all requests are kept in `requests`. The helper methods build the
+    responses the tests need: a body that breaks off in the middle, a byte range of it or a compressed body.
+
+    Examples:
+        async with StandInServer(handler) as server:
+            await get_packages_async("sisyphus", base_url=server.base_url)
+    """
+
+    def __init__(self, handler: Callable[[web.Request, int], Awaitable[web.StreamResponse]]):
+        self.handler = handler
+        self.requests = []
+        self.runner = None
+        self.base_url = None
+
+    async def __aenter__(self) -> "StandInServer":
+        app = web.Application()
+        app.router.add_get("/export/branch_binary_packages/{branch}", self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests.append(request.headers.copy())
+        return await self.handler(request, len(self.requests) - 1)
+
+    @staticmethod
+    async def broken(request: web.Request, body: bytes, headers: dict, sent: int) -> web.StreamResponse:
+        """
+        Sends the first `sent` bytes of a body with the full Content-Length and drops the connection.
+        """
+        response = web.StreamResponse(headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        await response.write(body[:sent])
+        request.transport.close()
+        return response
+
+    @staticmethod
+    def partial(request: web.Request, body: bytes, headers: dict) -> web.Response:
+        """
+        Answers a `Range: bytes=<start>-` request with the rest of the body.
+        """
+        start = int(request.headers["Range"].removeprefix("bytes=").rstrip("-"))
+        headers = {**headers, "Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"}
+        return web.Response(status=206, body=body[start:], headers=headers)
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import time
+import unittest
+
+from aiohttp import web
+
+from core.cache import SnapshotCache
+from core.parse_data import get_packages_async, refresh_cached_branch
+from tests.stand_in import TEST_OPTIONS, StandInServer, make_body, make_packages
+
+PACKAGES = make_packages(100)
+BODY = make_body(PACKAGES)
+ETAG = '"export-1"'
+LAST_MODIFIED = "Mon, 02 Sep 2024 10:00:00 GMT"
+
+
+async def export(request, number):
+    if request.headers.get("If-None-Match") == ETAG:
+        return web.Response(status=304, headers={"ETag": ETAG})
+    return web.Response(body=BODY, headers={"ETag": ETAG, "Last-Modified": LAST_MODIFIED})
+
+
+class SnapshotCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def cache(self, **kwargs) -> SnapshotCache:
+        return SnapshotCache(self.directory.name, **kwargs)
+
+    async def fetch(self, server: StandInServer, cache: SnapshotCache, branch: str = "sisyphus", **kwargs) -> list:
+        return await get_packages_async(
+            branch, cache=cache, base_url=server.base_url, options=TEST_OPTIONS, **kwargs
+        )
+
+    async def test_stores_snapshot_with_validators(self):
+        cache = self.cache()
+        async with StandInServer(export) as server:
+            self.assertEqual(await self.fetch(server, cache), PACKAGES)
+        entry = cache.get("sisyphus")
+        self.assertEqual((entry.etag, entry.last_modified, entry.size), (ETAG, LAST_MODIFIED, len(BODY)))
+        self.assertEqual(entry.path.read_bytes(), BODY)
+        self.assertNotIn("If-None-Match", server.requests[0])
+
+    async def test_fresh_snapshot_is_used_without_request(self):
+        cache = self.cache(ttl=3600)
+        async with StandInServer(export) as server:
+            await self.fetch(server, cache)
+            self.assertEqual(await self.fetch(server, cache), PACKAGES)
+        self.assertEqual(len(server.requests), 1)
+
+    async def test_stale_snapshot_is_revalidated(self):
+        async with StandInServer(export) as server:
+            await self.fetch(server, self.cache())
+            # The same snapshot is stale for a cache without a TTL.
+            cache = self.cache(ttl=0)
+            fetched_at = cache.get("sisyphus").fetched_at
+            entry, packages = await refresh_cached_branch(
+                "sisyphus", cache, base_url=server.base_url, options=TEST_OPTIONS
+            )
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[1]["If-None-Match"], ETAG)
+        self.assertEqual(server.requests[1]["If-Modified-Since"], LAST_MODIFIED)
+        # 304: the body is kept and the TTL starts over.
+        self.assertIsNone(packages)
+        self.assertGreater(cache.get("sisyphus").fetched_at, fetched_at)
+        self.assertEqual(entry.path.read_bytes(), BODY)
+
+    async def test_changed_export_replaces_snapshot(self):
+        cache = self.cache(ttl=0)
+        updated = make_packages(100, release="alt2")
+
+        async def handler(request, number):
+            if number == 0:
+                return web.Response(body=BODY, headers={"ETag": ETAG})
+            return web.Response(body=make_body(updated), headers={"ETag": '"export-2"'})
+
+        async with StandInServer(handler) as server:
+            await self.fetch(server, cache)
+            self.assertEqual(await self.fetch(server, cache), updated)
+        self.assertEqual(server.requests[1]["If-None-Match"], ETAG)
+        self.assertEqual(cache.get("sisyphus").etag, '"export-2"')
+
+    async def test_offline_uses_only_cache(self):
+        cache = self.cache(ttl=0)
+        async with StandInServer(export) as server:
+            with self.assertRaisesRegex(Exception, "no cached snapshot"):
+                await self.fetch(server, cache, offline=True)
+            await self.fetch(server, cache)
+            self.assertEqual(await self.fetch(server, cache, offline=True), PACKAGES)
+        self.assertEqual(len(server.requests), 1)
+
+    async def test_evicts_least_recently_used(self):
+        # Room for two snapshots only.
+        cache = self.cache(max_size=2 * len(BODY) + len(BODY) // 2)
+        async with StandInServer(export) as server:
+            await self.fetch(server, cache, "p10")
+            await self.fetch(server, cache, "p11")
+            now = time.time()
+            os.utime(cache.get("p10").path, (now - 20, now - 20))
+            os.utime(cache.get("p11").path, (now - 10, now - 10))
+            # Reading p10 makes p11 the least recently used snapshot.
+            await self.fetch(server, cache, "p10")
+            await self.fetch(server, cache, "sisyphus")
+        self.assertIsNotNone(cache.get("p10"))
+        self.assertIsNone(cache.get("p11"))
+        self.assertIsNotNone(cache.get("sisyphus"))
+        self.assertEqual(len(server.requests), 3)
+
+    async def test_names_do_not_collide(self):
+        cache = self.cache()
+        self.assertNotEqual(cache._paths("a/b")[0], cache._paths("a_b")[0])
+        self.assertNotEqual(cache.diff_state_path("a-b", "c"), cache.diff_state_path("a", "b-c"))
+        self.assertNotEqual(cache.diff_state_path("a_b", "c"), cache.diff_state_path("a", "b_c"))
+        self.assertNotEqual(cache.diff_state_path("p10", "p11"), cache.diff_state_path("p11", "p10"))
+        async with StandInServer(export) as server:
+            await self.fetch(server, cache, "a/b")
+            self.assertIsNone(cache.get("a_b"))
+            await self.fetch(server, cache, "a_b")
+        self.assertEqual(len(server.requests), 2)
+
+    async def test_evicts_pair_states(self):
+        cache = self.cache(max_size=2 * len(BODY) + len(BODY) // 2)
+        async with StandInServer(export) as server:
+            await self.fetch(server, cache, "p10")
+            state_path = cache.diff_state_path("p10", "p11")
+            state_path.write_bytes(bytes(len(BODY)))
+            now = time.time()
+            os.utime(cache.get("p10").path, (now - 10, now - 10))
+            os.utime(state_path, (now - 20, now - 20))
+            # The state counts towards the size and is older than p10.
+            await self.fetch(server, cache, "p11")
+        self.assertFalse(state_path.exists())
+        self.assertIsNotNone(cache.get("p10"))
+        self.assertIsNotNone(cache.get("p11"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import contextlib
+import io
+import unittest
+
+from main import build_parser, validate_args
+
+
+class ValidateArgsTest(unittest.TestCase):
+    def validate(self, *argv: str):
+        parser = build_parser()
+        return validate_args(parser, parser.parse_args(argv))
+
+    def assertParserError(self, message: str, *argv: str):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), self.assertRaises(SystemExit) as raised:
+            self.validate(*argv)
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIn(message, stderr.getvalue())
+
+    def test_branches_accept_only_single_join(self):
+        for engine in ("sync", "multiprocess", "numpy", "external"):
+            with self.subTest(engine=engine):
+                self.assertParserError(
+                    "--engine can only be merge", "--branches", "p10", "p11", "sisyphus", "--engine", engine
+                )
+        for engine in ("auto", "merge"):
+            with self.subTest(engine=engine):
+                self.assertIsNone(self.validate("--branches", "p10", "p11", "sisyphus", "--engine", engine))
+
+    def test_rejects_conflicting_arguments(self):
+        cases = [
+            ("either --branch1 and --branch2", ["--branch1", "p10"]),
+            ("can not be used together", ["--branches", "p10", "p11", "--branch1", "p10"]),
+            ("--newest requires --branches", ["--branch1", "p10", "--branch2", "p11", "--newest"]),
+            ("--incremental can not be used with --branches", ["--branches", "p10", "p11", "--incremental"]),
+            ("--offline requires --cache-dir", ["--branch1", "p10", "--branch2", "p11", "--offline"]),
+            ("--max-branches must be at least 2", ["--serve", "--max-branches", "1"]),
+            ("--history-keep requires --history-db", ["--branch1", "p10", "--branch2", "p11", "--history-keep", "3"]),
+        ]
+        for message, argv in cases:
+            with self.subTest(argv=argv):
+                self.assertParserError(message, *argv)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import gzip
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from core.cache import SnapshotCache
+from core.parse_data import ResumableDownload, create_session, get_packages_async, iter_packages_async
+from tests.stand_in import TEST_OPTIONS, StandInServer, make_body, make_packages
+
+PACKAGES = make_packages(500)
+BODY = make_body(PACKAGES)
+ETAG = '"export-1"'
+HALF = len(BODY) // 2
+
+
+class ResumableDownloadTest(unittest.IsolatedAsyncioTestCase):
+    async def fetch(self, server: StandInServer, stream: bool = False) -> list:
+        async with create_session(TEST_OPTIONS) as session:
+            return await get_packages_async(
+                "sisyphus", stream, base_url=server.base_url, session=session, options=TEST_OPTIONS
+            )
+
+    async def test_retries_unavailable_server(self):
+        async def handler(request, number):
+            if number < 2:
+                return web.Response(status=503)
+            return web.Response(body=BODY)
+
+        async with StandInServer(handler) as server:
+            self.assertEqual(await self.fetch(server), PACKAGES)
+        self.assertEqual(len(server.requests), 3)
+
+    async def test_gives_up_after_retries(self):
+        async def handler(request, number):
+            return web.Response(status=503)
+
+        async with StandInServer(handler) as server:
+            with self.assertRaisesRegex(Exception, "HTTP status 503"):
+                await self.fetch(server)
+        self.assertEqual(len(server.requests), TEST_OPTIONS.retries + 1)
+
+    async def test_resumes_broken_body_with_range(self):
+        headers = {"ETag": ETAG, "Accept-Ranges": "bytes"}
+
+        async def handler(request, number):
+            if number == 0:
+                return await server.broken(request, BODY, headers, HALF)
+            return server.partial(request, BODY, headers)
+
+        async with StandInServer(handler) as server:
+            self.assertEqual(await self.fetch(server), PACKAGES)
+        self.assertEqual(len(server.requests), 2)
+        resumed = server.requests[1]
+        self.assertEqual(resumed["Range"], f"bytes={HALF}-")
+        self.assertEqual(resumed["If-Range"], ETAG)
+        self.assertEqual(resumed["Accept-Encoding"], "identity")
+
+    async def test_restarts_compressed_body(self):
+        compressed = gzip.compress(BODY)
+        headers = {"ETag": ETAG, "Accept-Ranges": "bytes", "Content-Encoding": "gzip"}
+
+        async def handler(request, number):
+            if number == 0:
+                return await server.broken(request, compressed, headers, len(compressed) // 2)
+            return web.Response(body=compressed, headers=headers)
+
+        async with StandInServer(handler) as server:
+            self.assertEqual(await self.fetch(server), PACKAGES)
+        self.assertEqual(len(server.requests), 2)
+        self.assertNotIn("Range", server.requests[1])
+
+    async def test_restarts_without_range_support(self):
+        async def handler(request, number):
+            if number == 0:
+                return await server.broken(request, BODY, {"ETag": ETAG}, HALF)
+            return web.Response(body=BODY, headers={"ETag": ETAG})
+
+        async with StandInServer(handler) as server:
+            # The streamed packages that were yielded before the restart are not repeated.
+            self.assertEqual(await self.fetch(server, stream=True), PACKAGES)
+        self.assertEqual(len(server.requests), 2)
+        self.assertNotIn("Range", server.requests[1])
+
+    async def test_restarts_if_export_changed(self):
+        new_packages = make_packages(300)
+        new_body = make_body(new_packages)
+
+        async def handler(request, number):
+            # Every download breaks off in the old export and continues in the new one.
+            if number % 2 == 0:
+                return await server.broken(request, BODY, {"ETag": ETAG}, HALF)
+            return web.Response(body=new_body, headers={"ETag": '"export-2"'})
+
+        async with StandInServer(handler) as server:
+            packages = [
+                package async for package in
+                iter_packages_async("sisyphus", base_url=server.base_url, options=TEST_OPTIONS)
+            ]
+            self.assertEqual(packages, new_packages)
+            with tempfile.TemporaryDirectory() as directory:
+                cache = SnapshotCache(directory)
+                packages = await get_packages_async(
+                    "sisyphus", cache=cache, base_url=server.base_url, options=TEST_OPTIONS
+                )
+                self.assertEqual(packages, new_packages)
+                entry = cache.get("sisyphus")
+                self.assertEqual(entry.etag, '"export-2"')
+                self.assertEqual(entry.path.read_bytes(), new_body)
+        self.assertEqual(len(server.requests), 4)
+
+    async def test_revalidation_not_modified(self):
+        async def handler(request, number):
+            if request.headers.get("If-None-Match") == ETAG:
+                return web.Response(status=304, headers={"ETag": ETAG})
+            return web.Response(body=BODY, headers={"ETag": ETAG})
+
+        async with StandInServer(handler) as server:
+            url = f"{server.base_url}/export/branch_binary_packages/sisyphus"
+            async with create_session(TEST_OPTIONS) as session:
+                async with ResumableDownload(session, url, {"If-None-Match": ETAG}, TEST_OPTIONS) as download:
+                    self.assertEqual(download.status, 304)
+                    self.assertEqual(download.validator, ETAG)
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]["Accept-Encoding"], "gzip, deflate")
+
+
+if __name__ == "__main__":
+    unittest.main()
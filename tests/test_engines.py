@@ -0,0 +1,70 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from benchmarks.generator import generate_branch_pair
+from core.data_extractor import ENGINES, get_sorted_data
+from core.planner import ExecutionPlan, MachineProfile
+from core.vectorized import numpy_available
+from tests.reference import CATEGORIES, edge_case_branches, package, reference_comparison
+
+PROFILE = MachineProfile(cores=2, row_cost=1e-6, transfer_cost=1e-7, process_cost=0.05)
+# "auto" follows a given plan, so the tests never calibrate the machine or write a profile.
+PLANS = {
+    "merge": ExecutionPlan("merge", 1, 0, 0.0, 0.0, PROFILE, "stored"),
+    "multiprocess": ExecutionPlan("multiprocess", 2, 0, 0.0, 0.0, PROFILE, "stored"),
+}
+
+
+def compare(first: list, second: list, engine: str, plan: ExecutionPlan | None = None) -> list:
+    with redirect_stdout(io.StringIO()):
+        response = get_sorted_data(first, second, engine, plan=plan)
+    return [list(response["result"][category]) for category in CATEGORIES]
+
+
+class EnginesTest(unittest.TestCase):
+    def check_engines(self, first: list, second: list) -> None:
+        expected = reference_comparison(first, second)
+        for engine in ENGINES:
+            if engine == "numpy" and not numpy_available():
+                continue
+            for plan in PLANS.values() if engine == "auto" else (None,):
+                with self.subTest(engine=engine, plan=plan and plan.engine):
+                    self.assertEqual(compare(first, second, engine, plan), expected)
+
+    def test_edge_cases(self):
+        first, second = edge_case_branches()
+        self.check_engines(first, second)
+
+    def test_edge_case_results(self):
+        first, second = edge_case_branches()
+        result = compare(first, second, "merge")
+        names = [[(item["name"], item["arch"], item["release"]) for item in items] for items in result]
+        self.assertEqual(names[0], [("only-first", "x86_64", "alt1"), ("same", "i586", "alt3"),
+                                    ("only-noarch", "noarch", "alt1")])
+        self.assertEqual(names[1], [("only-second", "x86_64", "alt1"), ("only-noarch", "x86_64", "alt1")])
+        self.assertEqual(names[2], [
+            ("newer-release", "x86_64", "alt2"),
+            ("newer-version", "x86_64", "alt2"),
+            ("higher-epoch", "x86_64", "alt2"),
+            ("duplicate", "x86_64", "alt3"),
+            ("dotted", "x86_64", "alt1.2"),
+        ])
+
+    def test_generated_branches(self):
+        for seed in range(3):
+            first, second = generate_branch_pair(2000, duplicate_rate=0.02, seed=seed)
+            self.check_engines(first, second)
+
+    def test_empty_branches(self):
+        branch = [package("pkg1"), package("pkg2", arch="noarch"), package("pkg1")]
+        for first, second in (([], []), (branch, []), ([], branch)):
+            self.check_engines(first, second)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            compare([], [], "quick")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import random
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+
+from benchmarks.generator import generate_branch_pair
+from core.data_extractor import build_tables, merge_variant
+from core.external import BLOCK_ROWS, ExternalSorter, external_join, external_variant
+from tests.reference import CATEGORIES
+
+# A few hundred tuples per run and a fan-in of 2, so the runs are merged in several passes.
+SMALL_BUDGET = 64 * 1024
+
+
+class ExternalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+
+    def test_sorter_merges_runs_in_several_passes(self):
+        generator = random.Random(0)
+        items = [(generator.random(), number) for number in range(3 * BLOCK_ROWS)]
+        sorter = ExternalSorter(self.path, SMALL_BUDGET)
+        sorter.extend(items)
+        sorter.spill()
+        self.assertGreater(len(sorter.runs), 8)
+        self.assertEqual(list(sorter), sorted(items))
+        self.assertLessEqual(len(sorter.runs), 2)
+        sorter.close()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_join_matches_merge_engine(self):
+        first, second = generate_branch_pair(5000, duplicate_rate=0.02, seed=3)
+        first_table, second_table = build_tables(first, second)
+        expected = merge_variant(first_table, second_table)
+        with external_join(iter(first), iter(second), SMALL_BUDGET, self.path) as result:
+            self.assertEqual(len(list(self.path.iterdir())), 1)
+            self.assertEqual(result.rows, (len(first), len(second)))
+            self.assertEqual([list(result.iter_rows(category)) for category in CATEGORIES], expected)
+            self.assertEqual(list(result.iter_packages(CATEGORIES[2])), second_table.records(expected[2]))
+        self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual(external_variant(first_table, second_table, SMALL_BUDGET, self.path), expected)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_close_removes_files(self):
+        first, second = generate_branch_pair(2000, seed=4)
+        result = external_join(first, second, SMALL_BUDGET, self.path)
+        self.assertNotEqual(os.listdir(self.path), [])
+        result.close()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_failure_removes_files(self):
+        first, second = generate_branch_pair(2000, seed=5)
+
+        def broken(packages):
+            for number, package in enumerate(packages):
+                if number == len(packages) // 2:
+                    raise ConnectionError("the export broke off")
+                yield package
+
+        # The files must be removed by the engine, not left to the finalizer of the temporary directory.
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            with self.assertRaises(ConnectionError):
+                external_join(first, broken(second), SMALL_BUDGET, self.path)
+            self.assertEqual(os.listdir(self.path), [])
+
+            with self.assertRaises(RuntimeError):
+                with external_join(first, second, SMALL_BUDGET, self.path) as result:
+                    next(result.iter_packages(CATEGORIES[0]))
+                    raise RuntimeError("the output could not be written")
+            self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual([warning for warning in caught if warning.category is ResourceWarning], [])
+
+if __name__ == "__main__":
+    unittest.main()
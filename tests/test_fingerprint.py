@@ -0,0 +1,65 @@
+import unittest
+
+from benchmarks.generator import generate_branch_pair
+from core.classes import TableIndex
+from core.data_extractor import build_tables, merge_variant
+from core.fingerprint import TableFingerprint, changed_rows, name_bucket
+from tests.reference import package
+
+
+def fingerprinted(first: list, second: list) -> tuple:
+    tables = build_tables(first, second)
+    for table in tables:
+        table.fingerprint = TableFingerprint.build(table)
+    return tables
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.first = generate_branch_pair(3000, duplicate_rate=0, seed=5)[0]
+
+    def check(self, second: list) -> None:
+        expected = merge_variant(*build_tables(self.first, second))
+        tables = fingerprinted(self.first, second)
+        self.assertEqual(merge_variant(*tables), expected)
+        indexes = [TableIndex.build(table) for table in tables]
+        self.assertEqual(merge_variant(*tables, *indexes), expected)
+
+    def test_single_changed_partition(self):
+        target = self.first[10]
+        partition = (target["arch"], name_bucket(target["name"]))
+
+        def in_partition(item: dict) -> bool:
+            return (item["arch"], name_bucket(item["name"])) == partition
+
+        # Another release of one package and a duplicate key next to it, with the rows in another order.
+        second = [dict(item, release=f"{item['release']}.1") if item is target else item for item in self.first]
+        second.append(package(target["name"], version=target["version"], release="alt0", arch=target["arch"]))
+        second.reverse()
+        first_rows, second_rows = changed_rows(*fingerprinted(self.first, second))
+        self.assertEqual(list(first_rows), [row for row, item in enumerate(self.first) if in_partition(item)])
+        self.assertEqual(list(second_rows), [row for row, item in enumerate(second) if in_partition(item)])
+        self.check(second)
+
+        # A package removed from the partition, and one added in another architecture.
+        second = [item for item in self.first if item is not target]
+        second.append(package(target["name"], arch="armh" if target["arch"] != "armh" else "i586"))
+        self.assertIsNotNone(changed_rows(*fingerprinted(self.first, second)))
+        self.check(second)
+
+    def test_partition_with_duplicates_is_compared(self):
+        # The same rows in both tables, but the first row of the duplicate key differs.
+        duplicates = [package("dup", release="alt1"), package("dup", release="alt2")]
+        second = self.first + duplicates[::-1]
+        self.first = self.first + duplicates
+        self.assertEqual(merge_variant(*fingerprinted(self.first, second))[2], [len(second) - 2])
+        self.check(second)
+
+    def test_no_skip_below_share(self):
+        second = [dict(item, release=f"{item['release']}.1") for item in self.first[::2]] + self.first[1::2]
+        self.assertIsNone(changed_rows(*fingerprinted(self.first, second)))
+        self.check(second)
+
+
+if __name__ == "__main__":
+    unittest.main()
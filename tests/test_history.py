@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from core.api import compare_branches
+from core.history import HistoryStore
+from core.parse_data import PackageFilter
+from tests.reference import package
+
+FIRST = [package("python3", version="3.11.9", arch="x86_64"), package("python3", version="3.11.9", arch="noarch")]
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.history = HistoryStore(Path(directory.name) / "history.sqlite")
+        self.addCleanup(self.history.close)
+
+    def record(self, second: list, branches: tuple = ("p10", "sisyphus"), **kwargs) -> int:
+        return self.history.record(branches, compare_branches(FIRST, second), **kwargs)
+
+    def started(self, run_id: int) -> str:
+        return next(run["started"] for run in self.history.runs(limit=None) if run["id"] == run_id)
+
+    def test_trend_and_package_history(self):
+        runs = [
+            self.record([package("python3", version="3.12.1", release="alt2", arch="x86_64")]),
+            self.record([*FIRST, package("bash")]),
+        ]
+        self.record([package("bash")], branches=("p11", "sisyphus"))
+        trend = self.history.trend("p10", "sisyphus")
+        self.assertEqual([run["run"] for run in trend], runs)
+        self.assertEqual(
+            [(run["first_package"], run["second_package"], run["newer_versions_first_package"]) for run in trend],
+            [(1, 0, 1), (0, 1, 0)],
+        )
+        self.assertEqual([run["run"] for run in self.history.trend("p10", "sisyphus", limit=1)], runs[1:])
+
+        history = self.history.package_history("python3", branch1="p10")
+        self.assertEqual(
+            [(run["run"], run["arch"], run["category"], run["version"]) for run in history],
+            [
+                (runs[0], "noarch", "first_package", "3.11.9"),
+                (runs[0], "x86_64", "newer_versions_first_package", "3.12.1"),
+            ],
+        )
+        self.assertEqual(self.history.package_history("python3", "noarch", "p10", "sisyphus"), history[:1])
+        self.assertEqual(self.history.package_history("bash", branch1="p11")[0]["category"], "second_package")
+
+    def test_newer_since_counts_the_latest_streak(self):
+        newer = [
+            package("python3", version="3.12.1", release="alt2", arch="x86_64"),
+            package("python3", version="3.12.1", release="alt2", arch="noarch"),
+        ]
+        first = self.record(newer)
+        # The streak is broken on x86_64 only.
+        self.record([newer[1], FIRST[0]])
+        since = self.record(newer)
+        # A filtered run neither breaks nor extends the streak.
+        self.record([FIRST[0]], package_filter=PackageFilter(arches=("x86_64",)))
+        latest = [package("python3", version="3.12.2", release="alt2", arch="x86_64"), newer[1]]
+        self.record(latest)
+        self.assertEqual(
+            self.history.newer_since("python3", "p10", "sisyphus"),
+            {
+                "noarch": {"since": self.started(first), "runs": 4, "version": "3.12.1", "release": "alt2"},
+                "x86_64": {"since": self.started(since), "runs": 2, "version": "3.12.2", "release": "alt2"},
+            },
+        )
+        self.assertEqual(list(self.history.newer_since("python3", "p10", "sisyphus", "x86_64")), ["x86_64"])
+        # Not newer in the latest run: no streak at all.
+        self.record(FIRST)
+        self.assertEqual(self.history.newer_since("python3", "p10", "sisyphus"), {})
+        self.assertEqual(self.history.newer_since("python3", "p11", "sisyphus"), {})
+
+    def test_prune_keeps_latest_runs_of_pair(self):
+        runs = [self.record([package("bash")]) for _ in range(4)]
+        other = self.record([package("bash")], branches=("p11", "sisyphus"))
+        self.assertEqual(self.history.prune("p10", "sisyphus", 2), 2)
+        self.assertEqual([run["id"] for run in self.history.runs(limit=None)], [other, *reversed(runs[2:])])
+        self.assertEqual({run["run"] for run in self.history.package_history("bash")}, {other, *runs[2:]})
+        count = self.history.connection.execute("SELECT COUNT(*) FROM packages WHERE run_id IN (?, ?)", runs[:2])
+        self.assertEqual(count.fetchone()[0], 0)
+        with self.assertRaises(ValueError):
+            self.history.prune("p10", "sisyphus", -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.generator import generate_branch_pair
+from core.data_extractor import build_tables, merge_variant
+from core.incremental import STATE_VERSION, incremental_variant, load_diff_state
+from core.parse_data import PackageFilter
+from tests.reference import package
+
+
+def bump(packages: list, generator: random.Random, share: float) -> list:
+    return [
+        dict(item, release=f"{item['release']}.1") if generator.random() < share else item for item in packages
+    ]
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.state_path = Path(self.directory.name) / "p10-sisyphus.state"
+
+    def check(self, first: list, second: list, package_filter: PackageFilter | None = None) -> list:
+        # Every run gets new tables with a new string pool, like a new process would.
+        first_table, second_table = build_tables(first, second)
+        result = incremental_variant(first_table, second_table, self.state_path, package_filter)
+        self.assertEqual(result, merge_variant(*build_tables(first, second)))
+        return result
+
+    def test_runs_match_full_comparison(self):
+        generator = random.Random(1)
+        first, second = generate_branch_pair(3000, duplicate_rate=0.01, seed=11)
+        self.check(first, second)
+        # The same exports again.
+        self.check(first, second)
+        # Other releases in place: both tables keep their layout.
+        second = bump(second, generator, 0.05)
+        self.check(first, second)
+        first = bump(first, generator, 0.05)
+        self.check(first, second)
+        # Added and removed packages shift the rows.
+        second = [item for item in second if generator.random() > 0.02] + [package("brand-new")]
+        first = [package("only-first-now")] + first[10:]
+        self.check(first, second)
+        # The same packages in another order.
+        generator.shuffle(second)
+        self.check(first, second)
+        state = load_diff_state(self.state_path)
+        self.assertEqual([list(rows) for rows in state.results], merge_variant(*build_tables(first, second)))
+
+    def test_duplicate_keys(self):
+        first = [package("dup", release="alt1"), package("dup", release="alt1"), package("pkg", release="alt1")]
+        second = [package("dup", release="alt2"), package("dup", release="alt2"), package("pkg", release="alt2")]
+        self.check(first, second)
+        # One of the equal rows is gone: the row set is the same, the number of rows is not.
+        self.check(first[1:], second[1:])
+        self.check(first, second)
+        self.check(first, [package("dup", release="alt0"), *second])
+
+    def test_disappearing_strings(self):
+        first = [package("old", version="1.0"), package("kept", version="2.0")]
+        second = [package("old", version="1.1", release="alt2"), package("kept", version="2.1", release="alt2")]
+        self.check(first, second)
+        self.check([package("kept", version="2.0")], [package("kept", version="3.0", release="alt2")])
+
+    def test_empty_branches(self):
+        branch = [package("pkg1"), package("pkg2")]
+        for first, second in (([], []), (branch, []), ([], branch), (branch, branch), ([], [])):
+            self.check(first, second)
+
+    def test_filter_change_discards_state(self):
+        first, second = generate_branch_pair(500, seed=12)
+        x86 = PackageFilter(arches=("x86_64",))
+        selected = [[item for item in branch if item["arch"] == "x86_64"] for branch in (first, second)]
+        self.check(*selected, x86)
+        self.assertEqual(load_diff_state(self.state_path).filter, [["x86_64"], [], []])
+        self.check(first, second)
+        self.assertIsNone(load_diff_state(self.state_path).filter)
+
+    def test_damaged_state_is_ignored(self):
+        first, second = generate_branch_pair(500, seed=13)
+        self.check(first, second)
+        data = self.state_path.read_bytes()
+        self.state_path.write_bytes(data[: len(data) // 2])
+        self.assertIsNone(load_diff_state(self.state_path))
+        self.check(first, second)
+        self.state_path.write_bytes(b"\x80\x04not a state")
+        self.check(first, second)
+        self.assertEqual(STATE_VERSION, int.from_bytes(self.state_path.read_bytes()[8:12], "little"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import random
+import unittest
+
+from core.parse_data import PackageFilter, iter_packages
+from tests.reference import package
+
+FILTERS = [
+    PackageFilter(names=("python3-*",)),
+    PackageFilter(names=("python3-[ab]*", "bash")),
+    PackageFilter(names=("пакет?",)),
+    PackageFilter(names=('quote"d',)),
+    PackageFilter(sources=("python3",)),
+    PackageFilter(arches=("noarch",)),
+    PackageFilter(arches=("x86_64",), names=("*-devel",)),
+    PackageFilter(names=("re:^python3-",)),
+]
+NAMES = ["python3-base", "python3-attrs", "python3-devel", "bash", "bash-devel", "пакет1", 'quote"d', "a{b", "x,{y"]
+
+
+def make_export(seed: int, size: int = 60) -> bytes:
+    generator = random.Random(seed)
+    records = []
+    for number in range(size):
+        item = package(
+            generator.choice(NAMES), version=f"1.{number}", arch=generator.choice(["x86_64", "noarch", "i586"])
+        )
+        item["source"] = generator.choice(["python3", "bash", item["name"]])
+        # Keys in another order, and sometimes nested values with brackets and braces in strings.
+        keys = list(item)
+        generator.shuffle(keys)
+        item = {key: item[key] for key in keys}
+        if generator.random() < 0.2:
+            item["changelog"] = [{"text": "fixed [x], {y}"}, {"name": "python3-z", "text": "\"z\""}]
+        if generator.random() < 0.2:
+            item["signature"] = {"name": "python3-key", "text": "a,{b"}
+        # Escaped names and values: \uXXXX for every non-ASCII character and sometimes for a plain one.
+        text = json.dumps(item, ensure_ascii=generator.random() < 0.5, indent=generator.choice([None, 2]))
+        if generator.random() < 0.2:
+            text = text.replace('"python3', '"python\\u0033', 1)
+        records.append(text)
+    body = '{"length": %d, "packages": [\n%s\n], "request_args": {"arch": null}}' % (size, ",\n".join(records))
+    return body.encode()
+
+
+def chunked(body: bytes, size: int) -> list:
+    return [body[start: start + size] for start in range(0, len(body), size)]
+
+
+class PackageParserTest(unittest.TestCase):
+    def test_filters_match_decoded_packages(self):
+        for seed in range(3):
+            body = make_export(seed)
+            packages = json.loads(body)["packages"]
+            for package_filter in FILTERS:
+                expected = [item for item in packages if package_filter.matches(item)]
+                # Chunk boundaries fall everywhere inside the records, including escapes and multi-byte characters.
+                for size in (3, 17, 256, len(body)):
+                    with self.subTest(seed=seed, filter=package_filter, size=size):
+                        self.assertEqual(list(iter_packages(chunked(body, size), package_filter)), expected)
+
+    def test_escaped_value_is_checked_after_decoding(self):
+        body = b'{"packages": [{"arch": "noarch", "name": "python\\u0033-a"}, {"name": "python3\\"-b"}]}'
+        for size in (1, 3, len(body)):
+            with self.subTest(size=size):
+                self.assertEqual(
+                    list(iter_packages(chunked(body, size), PackageFilter(names=("python3-*",)))),
+                    [{"arch": "noarch", "name": "python3-a"}],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
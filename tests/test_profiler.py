@@ -0,0 +1,51 @@
+import gzip
+import time
+import unittest
+
+from aiohttp import web
+
+from core.parse_data import create_session, get_packages_async
+from core.profiler import Profiler, current_rss
+from tests.stand_in import TEST_OPTIONS, StandInServer, make_body, make_packages
+
+PACKAGES = make_packages(2000)
+BODY = make_body(PACKAGES)
+BLOCK = 256 * 1024**2
+
+
+class ProfilerTest(unittest.IsolatedAsyncioTestCase):
+    @unittest.skipIf(current_rss() is None, "/proc/self/statm is not available")
+    def test_stage_peak_is_sampled_per_stage(self):
+        profiler = Profiler()
+        with profiler.stage("large"):
+            block = b"x" * BLOCK
+            time.sleep(0.05)
+            del block
+        with profiler.stage("small"):
+            time.sleep(0.05)
+        large, small = profiler.stages
+        self.assertGreater(large.stage_peak_rss - small.stage_peak_rss, BLOCK // 2)
+        # The process peak so far still includes the large stage.
+        self.assertGreaterEqual(small.peak_rss, large.stage_peak_rss - BLOCK // 8)
+        self.assertIn("process peak, MiB", profiler.format_report())
+
+    async def test_body_bytes_are_counted_after_decompression(self):
+        compressed = gzip.compress(BODY)
+
+        async def export(request, number):
+            return web.Response(body=compressed, headers={"Content-Encoding": "gzip"})
+
+        profiler = Profiler()
+        async with StandInServer(export) as server:
+            async with create_session(TEST_OPTIONS, [profiler.trace_config()]) as session:
+                packages = await get_packages_async(
+                    "sisyphus", base_url=server.base_url, session=session, options=TEST_OPTIONS
+                )
+        self.assertEqual(packages, PACKAGES)
+        self.assertLess(len(compressed), len(BODY))
+        self.assertEqual(profiler.body_bytes, len(BODY))
+        self.assertEqual(profiler.report()["body_bytes"], len(BODY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.parse_data import export_url
+from core.server import ComparisonService, create_app
+from tests.reference import package
+from tests.stand_in import TEST_OPTIONS, StandInServer, make_body
+
+BRANCHES = {
+    "p10": [
+        package("same"),
+        package("newer", version="1.0"),
+        package("newer", version="1.0", arch="noarch"),
+        package("only-p10", arch="i586"),
+        package("only-p10-noarch", arch="noarch"),
+    ],
+    "sisyphus": [
+        package("same"),
+        package("newer", version="2.0", release="alt2"),
+        package("newer", version="2.0", release="alt2", arch="noarch"),
+        package("only-sisyphus"),
+        package("only-sisyphus", arch="aarch64"),
+    ],
+    "p11": [package(f"p11-package{number}", version=f"{number}.0") for number in range(20)],
+    "c10f2": [package(f"c10f2-package{number}", release=f"alt{number}") for number in range(20)],
+    "broken": None,
+}
+
+
+async def export(request, number):
+    packages = BRANCHES.get(request.match_info["branch"], ())
+    if packages is None:
+        return web.Response(body=b'{"packages": [{"name": ')
+    if not packages:
+        return web.Response(status=404)
+    return web.Response(body=make_body(packages))
+
+
+def names(body: bytes) -> dict:
+    result = json.loads(body)["result"]
+    return {category: sorted((item["name"], item["arch"]) for item in items) for category, items in result.items()}
+
+
+class ComparisonServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stand_in = await self.enterAsyncContext(StandInServer(export))
+
+    async def open_service(self, **kwargs) -> ComparisonService:
+        service = ComparisonService(base_url=self.stand_in.base_url, options=TEST_OPTIONS, **kwargs)
+        await service.open()
+        self.addAsyncCleanup(service.close)
+        return service
+
+    async def test_arch_is_joined_separately(self):
+        service = await self.open_service()
+        full = names(await service.compare("p10", "sisyphus"))
+        self.assertEqual(full, {
+            "first_package": [("only-p10", "i586"), ("only-p10-noarch", "noarch")],
+            "second_package": [("only-sisyphus", "aarch64"), ("only-sisyphus", "x86_64")],
+            "newer_versions_first_package": [("newer", "noarch"), ("newer", "x86_64")],
+        })
+        for arch in ("x86_64", "noarch", "i586", "aarch64", "ppc64le"):
+            with self.subTest(arch=arch):
+                expected = {category: [item for item in items if item[1] == arch] for category, items in full.items()}
+                self.assertEqual(names(await service.compare("p10", "sisyphus", arch)), expected)
+        # Only the architectures of the pool keep their indexes.
+        self.assertNotIn("ppc64le", service.snapshots["p10"].arch_indexes)
+
+    async def test_branches_are_dropped_and_pool_compacted(self):
+        service = await self.open_service(max_branches=2)
+        expected = names(await service.compare("p10", "sisyphus"))
+        await service.compare("p11", "c10f2")
+        self.assertEqual(list(service.snapshots), ["p11", "c10f2"])
+        self.assertEqual(set(service._locks), {"p11", "c10f2"})
+        # Two tables were dropped, as many as there are loaded branches, so only the strings of p11 and c10f2 remain.
+        used = {
+            service.pool.strings[code]
+            for snapshot in service.snapshots.values()
+            for field in ("name", "version", "release", "arch", "disttag", "source")
+            for code in getattr(snapshot.table, field)
+        }
+        self.assertEqual(set(service.pool.strings), used)
+        self.assertEqual(names(await service.compare("p10", "sisyphus")), expected)
+        self.assertEqual(list(service.snapshots), ["p10", "sisyphus"])
+
+    async def test_requests_are_validated(self):
+        service = await self.open_service()
+        async with TestClient(TestServer(create_app(service))) as client:
+            for query, status in (
+                ({"branch1": "p10"}, 400),
+                ({"branch1": "../../admin", "branch2": "p10"}, 400),
+                ({"branch1": "p10", "branch2": "sisyphus?arch=x"}, 400),
+                ({"branch1": "p10", "branch2": "unknown"}, 502),
+                ({"branch1": "p10", "branch2": "broken"}, 500),
+                ({"branch1": "p10", "branch2": "sisyphus", "arch": "noarch"}, 200),
+            ):
+                with self.subTest(query=query):
+                    response = await client.get("/compare", params=query)
+                    self.assertEqual(response.status, status)
+        self.assertEqual(list(service.snapshots), ["p10", "sisyphus"])
+        self.assertEqual(set(service._locks), {"p10", "sisyphus"})
+
+    def test_branch_is_quoted(self):
+        self.assertEqual(
+            export_url("a/../b?c", "http://api"), "http://api/export/branch_binary_packages/a%2F..%2Fb%3Fc"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
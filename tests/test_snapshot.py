@@ -0,0 +1,73 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.generator import generate_branch_pair
+from core.classes import PACKAGE_FIELDS, PackageTable, TableIndex
+from core.data_extractor import build_tables, merge_variant
+from core.snapshot import HEADER, MappedSnapshot, write_snapshot
+from core.vectorized import numpy_available, numpy_variant
+from tests.reference import package
+
+
+class MappedSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.first, self.second = generate_branch_pair(3000, duplicate_rate=0.01, seed=21)
+        # Non-ASCII strings and a name that differs only in its last byte from another one.
+        self.first += [package("пакет", version="1.0ü"), package("bash2"), package("bash3")]
+        self.paths = [Path(directory.name) / f"{branch}.snapshot" for branch in ("first", "second")]
+        for path, packages in zip(self.paths, (self.first, self.second)):
+            write_snapshot(path, PackageTable.from_records(packages))
+
+    def open(self, path: Path) -> MappedSnapshot:
+        snapshot = MappedSnapshot(path)
+        self.addCleanup(snapshot.close)
+        return snapshot
+
+    def test_find_uses_the_hash_indexes(self):
+        snapshot = self.open(self.paths[0])
+        table = PackageTable.from_records(self.first)
+        for key, row in TableIndex.build(table).first_rows.items():
+            name, arch = table.pool.strings[key >> 32], table.pool.strings[key & 0xFFFFFFFF]
+            self.assertEqual(snapshot.find(name, arch), row)
+        self.assertEqual(snapshot.record(snapshot.find("пакет", "x86_64")), self.first[-3])
+        for name, arch in (("bash", "x86_64"), ("пакет", "noarch"), ("", ""), ("\udc80", "x86_64")):
+            self.assertIsNone(snapshot.find(name, arch))
+        # Neither the lookups nor the records decode the whole string table.
+        self.assertIsNone(snapshot._strings)
+
+    def test_table_reads_the_mapped_columns(self):
+        first, second = map(self.open, self.paths)
+        first_table, second_table = build_tables(first, second)
+        # The first table keeps the codes of its snapshot, the second one is translated into the shared pool.
+        self.assertIsInstance(first_table.name, memoryview)
+        self.assertIsInstance(second_table.epoch, memoryview)
+        self.assertEqual(first_table.records(range(len(first_table))), self.first)
+        self.assertEqual(second_table.records(range(len(second_table))), self.second)
+        expected = merge_variant(*build_tables(self.first, self.second))
+        self.assertEqual(merge_variant(first_table, second_table), expected)
+        if numpy_available():
+            self.assertEqual(numpy_variant(first_table, second_table), expected)
+
+    def test_table_outlives_close(self):
+        snapshot = MappedSnapshot(self.paths[1])
+        table = snapshot.table()
+        snapshot.close()
+        self.assertEqual(table.record(len(table) - 1), self.second[-1])
+        self.assertEqual(list(table.select([0], PACKAGE_FIELDS)["epoch"]), [self.second[0]["epoch"]])
+
+    def test_other_format_is_rejected(self):
+        data = bytearray(self.paths[0].read_bytes())
+        data[8:12] = (2).to_bytes(4, "little")
+        self.paths[0].write_bytes(bytes(data))
+        with self.assertRaises(ValueError):
+            MappedSnapshot(self.paths[0])
+        self.paths[0].write_bytes(bytes(data[: HEADER.size - 1]))
+        with self.assertRaises(ValueError):
+            MappedSnapshot(self.paths[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
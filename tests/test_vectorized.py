@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from benchmarks.generator import generate_branch_pair
+from core.data_extractor import build_tables, merge_variant
+from core.utils import is_newer_package, version_key
+from core.vectorized import numpy_available, numpy_variant, version_ranks
+from tests.reference import package
+
+# Strings on which the rpm rules are not a total order (a number that continues a block after a word, e.g. "alt1a1"
+# is not newer than "alt1a"), or that differ only in separators and case.
+VERSIONS = (
+    "1.0", "1.0a", "1.0a1", "1.0.1", "1_0", "1.0-1", "1.0A", "1.00", "1.0.a", "2", "10", "1.a", "a.1", "1..0", "",
+)
+RELEASES = (
+    "alt1", "alt1.1", "alt1_1", "alt2", "alt10", "ALT1", "alt1.p10", "alt0.1", "alt1.M100P.1", "1alt", "alt1a",
+    "alt1a1",
+)
+
+
+def tricky_branches(seed: int, rows: int = 600) -> tuple:
+    generator = random.Random(seed)
+
+    def branch() -> list:
+        return [
+            package(
+                f"pkg{generator.randrange(rows // 3)}",
+                epoch=generator.choice((0, 0, 0, 1)),
+                version=generator.choice(VERSIONS),
+                release=generator.choice(RELEASES),
+                arch=generator.choice(("x86_64", "noarch")),
+            )
+            for _ in range(rows)
+        ]
+
+    return branch(), branch()
+
+
+@unittest.skipUnless(numpy_available(), "NumPy is not installed")
+class NumpyVariantTest(unittest.TestCase):
+    def check(self, first: list, second: list) -> None:
+        first_table, second_table = build_tables(first, second)
+        result = numpy_variant(first_table, second_table)
+        self.assertEqual(result, merge_variant(first_table, second_table))
+        # Every common key is compared with the first row of the key in the first table.
+        first_rows = {}
+        for row, key in enumerate(first_table.keys()):
+            first_rows.setdefault(key, row)
+        newer = [
+            row for row, key in enumerate(second_table.keys())
+            if key in first_rows and is_newer_package(second_table, row, first_table, first_rows[key])
+        ]
+        self.assertEqual(result[2], newer)
+
+    def test_tricky_versions(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.check(*tricky_branches(seed))
+
+    def test_generated_branches(self):
+        self.check(*generate_branch_pair(3000, duplicate_rate=0.02, seed=7))
+
+    def test_empty_tables(self):
+        branch = [package("pkg1"), package("pkg2")]
+        for first, second in (([], []), (branch, []), ([], branch)):
+            with self.subTest(first=len(first), second=len(second)):
+                self.check(first, second)
+
+    def test_version_ranks_follow_version_keys(self):
+        first, second = build_tables(*tricky_branches(0, rows=50))
+        ranks = version_ranks(first, second)
+        strings = first.pool.strings
+        codes = set(first.version) | set(first.release) | set(second.version) | set(second.release)
+        for code1 in codes:
+            for code2 in codes:
+                key1, key2 = version_key(strings[code1]), version_key(strings[code2])
+                self.assertEqual(ranks[code1] < ranks[code2], key1 < key2)
+                self.assertEqual(ranks[code1] == ranks[code2], key1 == key2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from core.writer import JsonChunks, iter_response
+from tests.reference import package
+
+PACKAGES = [
+    package("python3", version="3.12.1"),
+    package("пакет-тест", epoch=1, arch="noarch"),
+    package('quote"back\\slash\ttab', version="ü", release="alt1\u2028"),
+]
+
+
+def two_branches(packages: list) -> dict:
+    return {
+        "user": "пользователь",
+        "time": "14:30:15 18-09-2024",
+        "result": {
+            "first_package": packages,
+            "second_package": [],
+            "newer_versions_first_package": packages[1:],
+        },
+    }
+
+
+def several_branches(packages: list) -> dict:
+    return {
+        "user": "user",
+        "time": "14:30:15 18-09-2024",
+        "result": {
+            "p10 -> sisyphus": {
+                "first_package": packages,
+                "second_package": [],
+                "sources": {"пакет-тест": {"first_package": {"noarch": 1}, "second_package": {}}},
+            },
+            "p11 -> sisyphus": {"first_package": [], "second_package": packages[:1]},
+        },
+    }
+
+
+def streamed(response: dict) -> dict:
+    # The package lists of a real response are generators that decode the packages while they are written.
+    result = {}
+    for name, value in response["result"].items():
+        if isinstance(value, dict):
+            result[name] = {
+                category: packages if category == "sources" else iter(packages) for category, packages in value.items()
+            }
+        else:
+            result[name] = iter(value)
+    return {**response, "result": result}
+
+
+class WriterTest(unittest.TestCase):
+    def test_json_formats_match_json_dumps(self):
+        for build in (two_branches, several_branches):
+            for packages in (PACKAGES, []):
+                response = build(packages)
+                with self.subTest(build=build.__name__, packages=len(packages)):
+                    self.assertEqual(
+                        "".join(iter_response(streamed(response), "json")),
+                        json.dumps(response, indent=4, ensure_ascii=False) + "\n",
+                    )
+                    self.assertEqual(
+                        "".join(iter_response(streamed(response), "compact")),
+                        json.dumps(response, separators=(",", ":"), ensure_ascii=False) + "\n",
+                    )
+
+    def test_ensure_ascii_matches_json_dumps(self):
+        response = two_branches(PACKAGES)
+        chunks = JsonChunks(ensure_ascii=True)
+        self.assertEqual("".join(chunks.iter_value(streamed(response))), json.dumps(response, indent=4))
+
+    def test_ndjson_lines(self):
+        text = "".join(iter_response(streamed(two_branches(PACKAGES)), "ndjson"))
+        self.assertTrue(text.endswith("\n"))
+        self.assertIn("пакет-тест", text)
+        # U+2028 is written as is: the lines are separated by "\n" only.
+        lines = [json.loads(line) for line in text.split("\n")[:-1]]
+        self.assertEqual(lines[0], {"user": "пользователь", "time": "14:30:15 18-09-2024"})
+        self.assertEqual(
+            lines[1:],
+            [{"category": "first_package", **item} for item in PACKAGES]
+            + [{"category": "newer_versions_first_package", **item} for item in PACKAGES[1:]],
+        )
+
+        lines = [json.loads(line) for line in iter_response(streamed(several_branches(PACKAGES)), "ndjson")]
+        self.assertEqual(
+            lines[1:],
+            [{"pair": "p10 -> sisyphus", "category": "first_package", **item} for item in PACKAGES]
+            + [{
+                "pair": "p10 -> sisyphus", "source": "пакет-тест",
+                "first_package": {"noarch": 1}, "second_package": {},
+            }]
+            + [{"pair": "p11 -> sisyphus", "category": "second_package", **PACKAGES[0]}],
+        )
+        self.assertEqual("".join(iter_response(streamed(two_branches([])), "ndjson")).count("\n"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()